@@ -0,0 +1,92 @@
+"""Benchmark download progress persistence with several concurrent downloads.
+
+Compares writing every progress update straight to downloads.json with the
+buffered mode that flushes on an interval and on status changes.
+
+    python3 benchmarks/download_progress.py --downloads 8 --rate 50 --duration 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.database import Database
+
+
+def run(downloads, rate, duration, flush_interval, catalog_size):
+    """Simulate concurrent downloads reporting progress and return the measurements."""
+    with tempfile.TemporaryDirectory() as data_dir:
+        db = Database(data_dir=data_dir, progress_flush_interval=flush_interval)
+        
+        # Pad downloads.json so each rewrite costs about as much as on a real install
+        for i in range(catalog_size):
+            db.add_download(f"old_{i}", f"episode_{i}")
+            db.update_download_status(f"old_{i}", 'completed', 100, local_path=f"/downloads/episode_{i}.mp3")
+        
+        task_ids = [f"task_{i}" for i in range(downloads)]
+        for task_id in task_ids:
+            db.add_download(task_id, task_id)
+            db.update_download_status(task_id, 'downloading', 0)
+        
+        writes_before = db.get_cache_stats()['writes']
+        
+        updates = [0] * downloads
+        
+        def download(index, task_id):
+            # Report progress at a fixed rate, like a chunked download would
+            started = time.perf_counter()
+            step = 0
+            while time.perf_counter() - started < duration:
+                step += 1
+                db.update_download_status(task_id, 'downloading', min(99, int(step * 100 / (rate * duration))))
+                time.sleep(max(0, started + step / rate - time.perf_counter()))
+            db.update_download_status(task_id, 'completed', 100, local_path=f"/downloads/{task_id}.mp3")
+            updates[index] = step + 1
+        
+        threads = [threading.Thread(target=download, args=(i, task_id)) for i, task_id in enumerate(task_ids)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        
+        writes = db.get_cache_stats()['writes'] - writes_before
+        
+        # Every download must end up completed on disk
+        on_disk = Database(data_dir=data_dir).get_downloads()
+        assert all(on_disk[task_id]['status'] == 'completed' for task_id in task_ids)
+        
+        return {
+            'updates': sum(updates),
+            'writes': writes,
+            'elapsed': elapsed
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--downloads', type=int, default=8, help="concurrent downloads")
+    parser.add_argument('--rate', type=float, default=50, help="progress updates per second per download")
+    parser.add_argument('--duration', type=float, default=5, help="seconds each download runs")
+    parser.add_argument('--interval', type=float, default=2.0, help="flush interval in seconds for buffered mode")
+    parser.add_argument('--catalog', type=int, default=200, help="finished downloads already in downloads.json")
+    args = parser.parse_args()
+    
+    print(f"{args.downloads} concurrent downloads, {args.rate:g} progress updates/s each for "
+          f"{args.duration:g}s, {args.catalog} existing records")
+    print(f"{'mode':<22}{'updates/s':>12}{'writes':>10}{'writes/s':>12}{'seconds':>10}")
+    
+    for label, interval in (('write-through', 0), (f'buffered ({args.interval:g}s)', args.interval)):
+        result = run(args.downloads, args.rate, args.duration, interval, args.catalog)
+        elapsed = result['elapsed']
+        print(f"{label:<22}{result['updates'] / elapsed:>12.0f}{result['writes']:>10}"
+              f"{result['writes'] / elapsed:>12.1f}{elapsed:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
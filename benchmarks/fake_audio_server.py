@@ -0,0 +1,143 @@
+"""Local HTTP server serving deterministic fake episode audio.
+
+Serves /audio/<name>.mp3 with a fixed size, with or without Range support,
+an optional bandwidth cap per connection and a way to cut connections after
+a number of bytes to simulate interrupted downloads:
+
+    with FakeAudioServer(size=50 * 1024 * 1024, ranges=False) as server:
+        url = server.audio_url('episode_1')
+"""
+import hashlib
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def fake_audio(name, size):
+    """Build deterministic bytes for an audio file name."""
+    seed = hashlib.sha256(name.encode()).digest()
+    return (seed * (size // len(seed) + 1))[:size]
+
+
+class FakeAudioHandler(BaseHTTPRequestHandler):
+    """Request handler serving fake audio files."""
+    
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this the body waits for a delayed ACK
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def do_GET(self):
+        server = self.server
+        path = urlparse(self.path).path
+        
+        if not path.startswith('/audio/'):
+            self.send_error(404)
+            return
+        
+        data = server.file(path.rsplit('/', 1)[-1])
+        start, end = 0, len(data) - 1
+        status = 200
+        
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if server.ranges and range_header and (not if_range or if_range == server.etag):
+            first, _, last = range_header.split('=', 1)[1].partition('-')
+            start = int(first)
+            end = min(int(last), len(data) - 1) if last else len(data) - 1
+            status = 206
+        
+        with server.lock:
+            server.requests += 1
+            if status == 206:
+                server.range_requests += 1
+        
+        self.send_response(status)
+        self.send_header('Content-Type', 'audio/mpeg')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('ETag', server.etag)
+        if server.ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        if status == 206:
+            self.send_header('Content-Range', f"bytes {start}-{end}/{len(data)}")
+        self.end_headers()
+        
+        position = start
+        while position <= end:
+            block = data[position:min(position + server.block_size, end + 1)]
+            
+            with server.lock:
+                # Drop the connection once the configured number of bytes has gone out
+                if server.fail_after is not None:
+                    if server.fail_after <= 0:
+                        server.dropped += 1
+                        self.close_connection = True
+                        return
+                    block = block[:server.fail_after]
+                    server.fail_after -= len(block)
+                server.sent += len(block)
+            
+            self.wfile.write(block)
+            position += len(block)
+            
+            if server.rate:
+                time.sleep(len(block) / server.rate)
+
+
+class FakeAudioServer(ThreadingHTTPServer):
+    """Threaded fake audio server on a free local port, usable as a context manager."""
+    
+    daemon_threads = True
+    
+    def __init__(self, size=10 * 1024 * 1024, ranges=True, rate=None, block_size=64 * 1024):
+        super().__init__(('127.0.0.1', 0), FakeAudioHandler)
+        self.size = size
+        self.ranges = ranges
+        self.rate = rate
+        self.block_size = block_size
+        self.etag = '"v1"'
+        self.fail_after = None
+        self.requests = 0
+        self.range_requests = 0
+        self.sent = 0
+        self.dropped = 0
+        self.lock = threading.Lock()
+        self._files = {}
+        self._thread = None
+    
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+    
+    def audio_url(self, name):
+        return f"{self.url}/audio/{name}.mp3"
+    
+    def file(self, filename):
+        """Get the bytes served for a file name."""
+        with self.lock:
+            if filename not in self._files:
+                self._files[filename] = fake_audio(filename, self.size)
+            return self._files[filename]
+    
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-response is expected when testing interrupted downloads
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+    
+    def cut_after(self, count):
+        """Drop every connection once count more bytes have been sent, until reset with None."""
+        with self.lock:
+            self.fail_after = count
+    
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
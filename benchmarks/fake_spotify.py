@@ -0,0 +1,142 @@
+"""Local stand-in for the Spotify accounts and Web API endpoints.
+
+Serves /api/token, /v1/search, /v1/tracks and /v1/tracks/<id> with
+deterministic fake data, an optional per-request latency and an optional
+rate limit that answers with 429 and Retry-After. Point the integrations at
+it through SPOTIFY_ACCOUNTS_URL and SPOTIFY_API_URL:
+
+    with FakeSpotifyServer(latency=0.05) as server:
+        os.environ.update(server.environ())
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def fake_track(track_id):
+    """Build a Spotify track object for an ID."""
+    return {
+        'id': track_id,
+        'name': f"Track {track_id}",
+        'artists': [{'name': f"Artist {track_id}"}],
+        'album': {'name': f"Album {track_id}", 'images': [{'url': f"https://img.example.com/{track_id}.jpg"}]},
+        'preview_url': None,
+        'external_urls': {'spotify': f"https://open.spotify.com/track/{track_id}"}
+    }
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """Request handler answering like the Spotify API."""
+    
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes; without this the body waits for a delayed ACK
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def _throttle(self):
+        """Apply the configured latency and rate limit; returns False if the request was rejected."""
+        server = self.server
+        
+        with server.lock:
+            server.requests += 1
+            rejected = server.reject_next > 0
+            if rejected:
+                server.reject_next -= 1
+                server.rejected += 1
+        
+        if rejected:
+            self._send_json(429, {'error': {'status': 429, 'message': 'API rate limit exceeded'}},
+                            {'Retry-After': str(server.retry_after)})
+            return False
+        
+        if server.latency:
+            time.sleep(server.latency)
+        return True
+    
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        
+        if not self._throttle():
+            return
+        
+        if urlparse(self.path).path == '/api/token':
+            self._send_json(200, {'access_token': 'fake_token', 'token_type': 'Bearer', 'expires_in': 3600})
+        else:
+            self._send_json(404, {'error': 'not found'})
+    
+    def do_GET(self):
+        if not self._throttle():
+            return
+        
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        
+        if url.path == '/v1/search':
+            query = params.get('q', [''])[0]
+            limit = int(params.get('limit', ['5'])[0])
+            items = [fake_track(f"{abs(hash(query)) % 100000}_{i}") for i in range(limit)]
+            self._send_json(200, {'tracks': {'items': items}})
+        elif url.path == '/v1/tracks':
+            ids = params.get('ids', [''])[0].split(',')
+            self._send_json(200, {'tracks': [None if track_id.startswith('missing') else fake_track(track_id) for track_id in ids]})
+        elif url.path.startswith('/v1/tracks/'):
+            self._send_json(200, fake_track(url.path.rsplit('/', 1)[-1]))
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+
+class FakeSpotifyServer(ThreadingHTTPServer):
+    """Threaded fake Spotify server on a free local port, usable as a context manager."""
+    
+    daemon_threads = True
+    
+    def __init__(self, latency=0.0, retry_after=1):
+        super().__init__(('127.0.0.1', 0), FakeSpotifyHandler)
+        self.latency = latency
+        self.retry_after = retry_after
+        self.reject_next = 0
+        self.requests = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+        self._thread = None
+    
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+    
+    def environ(self):
+        """Environment variables pointing the integrations at this server."""
+        return {
+            'SPOTIFY_ACCOUNTS_URL': f"{self.url}/api/token",
+            'SPOTIFY_API_URL': f"{self.url}/v1",
+            'SPOTIFY_CLIENT_ID': 'fake_client_id',
+            'SPOTIFY_CLIENT_SECRET': 'fake_client_secret'
+        }
+    
+    def rate_limit(self, count):
+        """Answer the next count requests with 429."""
+        with self.lock:
+            self.reject_next = count
+    
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,133 @@
+"""Micro-benchmark the per-entry cost of PodcastParser._parse_entry.
+
+Builds a synthetic feed of entries with large HTML descriptions, the way
+feedparser hands them to the parser, and times the full entry parse as well
+as the HTML scan for audio/image URLs and the plain-text conversion on their own.
+Each is compared with the extraction path before the single-pass scan: separate
+uncompiled searches for the audio and image URL over content and summary, and the
+raw HTML kept as description.
+
+    python3 benchmarks/feed_parsing.py --entries 2000 --repeat 5
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import feedparser
+
+from models.podcast_parser import SRC_RE, PodcastParser
+
+
+def make_entry(i, tracks):
+    """Build one feedparser-style entry with a tracklist-heavy HTML description."""
+    tracklist = ''.join(
+        f'<li>{t + 1:02d}. Artist {i}-{t} &amp; Friends - Track title number {t} (Extended Mix)</li>'
+        for t in range(tracks)
+    )
+    html = (
+        f'<p>The Sublime Weekendmix episode {i}, recorded live.</p>'
+        f'<p><img src="https://cdn.example.com/covers/{i}.jpg" alt="cover"></p>'
+        f'<h3>Tracklist</h3><ol>{tracklist}</ol>'
+        f'<p><audio src="https://media.example.com/mixes/{i}.mp3" controls></audio></p>'
+    )
+    
+    # No enclosure or media tags, so audio and image come from the HTML like in older episodes
+    return feedparser.FeedParserDict(
+        id=f"https://example.com/episodes/{i}",
+        title=f"Episode {i}",
+        published="Sat, 01 Jun 2024 10:00:00 +0000",
+        summary=html,
+        content=[feedparser.FeedParserDict(value=html)],
+        links=[feedparser.FeedParserDict(href=f"https://example.com/episodes/{i}", type='text/html')],
+        itunes_duration='2:00:00'
+    )
+
+
+class LegacyPodcastParser(PodcastParser):
+    """The entry parse before the single-pass HTML scan, as the baseline."""
+    
+    def _parse_entry(self, entry, index):
+        return {
+            'id': self._extract_id(entry) or f"episode_{index}",
+            'title': entry.title if hasattr(entry, 'title') else f"Episode {index}",
+            'date': self._extract_date(entry),
+            'audioUrl': self._legacy_html_url(entry, r'src=[\'"]([^\'"]+\.mp3)[\'"]'),
+            'image': self._legacy_html_url(entry, r'src=[\'"]([^\'"]+\.(jpg|jpeg|png|gif))[\'"]'),
+            'duration': self._extract_duration(entry),
+            'description': self._extract_description_html(entry)
+        }
+    
+    def _legacy_html_url(self, entry, pattern):
+        """Search content, then summary, the way _extract_audio_url and _extract_image_url did."""
+        if hasattr(entry, 'content') and entry.content:
+            for content in entry.content:
+                if 'value' in content:
+                    match = re.search(pattern, content['value'])
+                    if match:
+                        return match.group(1)
+        
+        if hasattr(entry, 'summary'):
+            match = re.search(pattern, entry.summary)
+            if match:
+                return match.group(1)
+        
+        return None
+
+
+def best_time(func, repeat):
+    """Run func repeat times and return the fastest run in seconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=2000, help="entries in the synthetic feed")
+    parser.add_argument('--tracks', type=int, default=40, help="tracklist lines per description")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs; the best one is reported")
+    args = parser.parse_args()
+    
+    entries = [make_entry(i, args.tracks) for i in range(args.entries)]
+    podcast_parser = PodcastParser()
+    legacy_parser = LegacyPodcastParser()
+    
+    episodes = [podcast_parser._parse_entry(entry, i) for i, entry in enumerate(entries)]
+    legacy_episodes = [legacy_parser._parse_entry(entry, i) for i, entry in enumerate(entries)]
+    assert all(episode['audioUrl'] and episode['image'] for episode in episodes)
+    assert [(e['audioUrl'], e['image']) for e in episodes] == [(e['audioUrl'], e['image']) for e in legacy_episodes]
+    
+    # (case, before, after); the plain-text conversion is new work with nothing before it
+    timings = [
+        ('urls', best_time(lambda: [(legacy_parser._legacy_html_url(entry, r'src=[\'"]([^\'"]+\.mp3)[\'"]'),
+                                     legacy_parser._legacy_html_url(entry, r'src=[\'"]([^\'"]+\.(jpg|jpeg|png|gif))[\'"]'))
+                                    for entry in entries], args.repeat),
+                 best_time(lambda: [list(SRC_RE.finditer(entry.summary)) for entry in entries], args.repeat)),
+        ('plain text', None,
+         best_time(lambda: [podcast_parser._html_to_text(entry.summary) for entry in entries], args.repeat)),
+        ('full entry', best_time(lambda: [legacy_parser._parse_entry(entry, i) for i, entry in enumerate(entries)],
+                                 args.repeat),
+         best_time(lambda: [podcast_parser._parse_entry(entry, i) for i, entry in enumerate(entries)], args.repeat))
+    ]
+    
+    html_bytes = sum(len(entry.summary.encode()) for entry in entries)
+    text_bytes = sum(len(episode['description'].encode()) for episode in episodes)
+    
+    print(f"{args.entries} entries, {args.tracks} tracklist lines each, us per entry")
+    print(f"{'case':<12}{'before':>10}{'after':>10}")
+    for label, before, after in timings:
+        before_text = f"{before / args.entries * 1e6:.1f}" if before is not None else '-'
+        print(f"{label:<12}{before_text:>10}{after / args.entries * 1e6:>10.1f}")
+    print(f"description {html_bytes / args.entries:>10.0f} B html -> {text_bytes / args.entries:.0f} B text per entry")
+
+
+if __name__ == '__main__':
+    main()
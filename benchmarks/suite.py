@@ -0,0 +1,366 @@
+"""Benchmark suite for storage, feed parsing and the Spotify client.
+
+Runs every case against synthetic fixtures: a catalog of episodes in both
+database backends, a large RSS file for PodcastParser and the local fake
+Spotify server. Reports throughput, p50/p99 latency, peak Python memory and
+the memory a result keeps holding per case, optionally writes them as JSON and compares them with an earlier
+run, exiting non-zero when a case got slower than the threshold:
+
+    python3 benchmarks/suite.py --json before.json
+    python3 benchmarks/suite.py --compare before.json --threshold 0.25
+    python3 benchmarks/suite.py --only database.json --episodes 1000
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; the process peak is then left out
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_spotify import FakeSpotifyServer
+
+ARTISTS = ('Tiësto', 'Armin van Buuren', 'Ferry Corsten', 'Above & Beyond', 'Paul van Dyk', 'Eric Prydz',
+           'Solarstone', 'Gareth Emery', 'Markus Schulz', 'Cosmic Gate')
+WORDS = ('Sunrise', 'Horizon', 'Shivers', 'Blue', 'Adagio', 'Strings', 'Forever', 'Silence', 'Anthem', 'Waves',
+         'Skyline', 'Lights', 'Dream', 'Echo', 'Pulse', 'Vortex', 'Gravity', 'Aurora', 'Eclipse', 'Motion')
+
+
+def percentile(sorted_values, fraction):
+    """Get a percentile of sorted values by nearest rank."""
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def measure(name, func, iterations, items=1, warmup=1):
+    """Time iterations calls of func(i) and measure the memory of one more.
+    
+    items is how many things one call handles, e.g. episodes saved, for throughput.
+    Memory is traced in a separate call, since tracing slows down the timed ones: the
+    peak during the call and what is still allocated after it, such as a cache it
+    filled or the result it returned.
+    """
+    for i in range(warmup):
+        func(i)
+    
+    tracemalloc.start()
+    result = func(warmup)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    
+    latencies = []
+    for i in range(warmup + 1, warmup + 1 + iterations):
+        start = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - start)
+    
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        'name': name,
+        'iterations': iterations,
+        'items': items,
+        'throughput': round(iterations * items / total, 2) if total else None,
+        'mean': total / iterations,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'max': latencies[-1],
+        'peakMemory': peak,
+        'retainedMemory': retained
+    }
+
+
+def make_episode(i, tracks):
+    """Build a catalog episode with a tracklist description."""
+    rng = random.Random(i)
+    tracklist = '\n'.join(
+        f"{t + 1:02d}. {rng.choice(ARTISTS)} - {rng.choice(WORDS)} {rng.choice(WORDS)}" for t in range(tracks)
+    )
+    return {
+        'id': f"episode-{i}",
+        'title': f"Sublime Weekendmix {i} by {rng.choice(ARTISTS)}",
+        'date': datetime.fromtimestamp(1500000000 + i * 86400).isoformat(),
+        'audioUrl': f"https://media.example.com/mixes/{i}.mp3",
+        'image': f"https://cdn.example.com/covers/{i}.jpg",
+        'duration': '2:00:00',
+        'description': f"The Sublime Weekendmix episode {i}, recorded live.\n\nTracklist:\n{tracklist}"
+    }
+
+
+def write_feed(path, entries, tracks):
+    """Write an RSS feed with entries items, newest first, carrying HTML tracklists."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<rss version="2.0" '
+                'xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd" '
+                'xmlns:content="http://purl.org/rss/1.0/modules/content/">\n'
+                '<channel><title>Sublime Weekendmix</title><link>https://example.com</link>\n')
+        
+        for i in range(entries - 1, -1, -1):
+            episode = make_episode(i, tracks)
+            lines = episode['description'].split('\n')
+            html = f"<p>{escape(lines[0])}</p><ol>{''.join(f'<li>{escape(line)}</li>' for line in lines[3:])}</ol>"
+            published = format_datetime(datetime.fromtimestamp(1500000000 + i * 86400).astimezone())
+            f.write(
+                f"<item><guid>https://example.com/episodes/{i}</guid><title>{escape(episode['title'])}</title>"
+                f"<pubDate>{published}</pubDate>"
+                f"<enclosure url=\"{episode['audioUrl']}\" type=\"audio/mpeg\" length=\"100000000\"/>"
+                f"<itunes:duration>7200</itunes:duration><itunes:image href=\"{episode['image']}\"/>"
+                f"<description>{escape(html)}</description>"
+                f"<content:encoded><![CDATA[{html}]]></content:encoded></item>\n"
+            )
+        
+        f.write('</channel></rss>\n')
+
+
+def temporary_directory():
+    """Make a directory removed at exit, after the databases in it have saved their state."""
+    path = tempfile.mkdtemp(prefix='sublimemix-bench-')
+    # Exit handlers run last registered first, so this runs after those registered later
+    atexit.register(shutil.rmtree, path, True)
+    return path
+
+
+def bench_database(label, db, episodes, iterations):
+    """Benchmark the reads and writes the app makes against one database backend."""
+    rng = random.Random(42)
+    count = len(episodes)
+    ids = [episode['id'] for episode in episodes]
+    results = []
+    
+    # A feed refresh: one new episode in front of the catalog; the first save also builds the search index
+    new_episodes = [make_episode(count + i, 25) for i in range(iterations * 3 + 3)]
+    results.append(measure(
+        f"{label}.save_episodes",
+        lambda i: db.save_episodes([new_episodes[i]] + episodes),
+        max(3, iterations // 10), items=count + 1
+    ))
+    db.save_episodes(episodes)
+    
+    if hasattr(db, 'clear_cache'):
+        def cold_read(i):
+            db.clear_cache()
+            return db.get_episodes()
+        results.append(measure(f"{label}.get_episodes.cold", cold_read, max(3, iterations // 10), items=count))
+        
+        # The catalog as plain dicts in one file, as stored before descriptions were kept
+        # apart, to compare the time and memory of the cached reads with
+        plain_file = os.path.join(db.data_dir, 'episodes.plain.json')
+        with open(plain_file, 'w') as f:
+            json.dump(episodes, f)
+        
+        def plain_read(i):
+            with open(plain_file, 'r') as f:
+                return json.load(f)
+        results.append(measure(f"{label}.get_episodes.dicts", plain_read, max(3, iterations // 10), items=count))
+    
+    results.append(measure(f"{label}.get_episodes", lambda i: db.get_episodes(), max(3, iterations // 10), items=count))
+    results.append(measure(f"{label}.get_episode", lambda i: db.get_episode(rng.choice(ids)), iterations * 10))
+    results.append(measure(
+        f"{label}.query_episodes",
+        lambda i: db.query_episodes(offset=rng.randrange(count), limit=50, fields=('id', 'title', 'date')),
+        iterations
+    ))
+    
+    queries = ['tiesto', 'armin van buuren', 'shivers', 'ferry cor', 'sublime weekendmix 42', 'eclipse motion']
+    results.append(measure(f"{label}.search", lambda i: db.search(queries[i % len(queries)]), iterations))
+    
+    results.append(measure(
+        f"{label}.add_favorite_song",
+        lambda i: db.add_favorite_song({
+            'episodeId': ids[i % count],
+            'timestamp': rng.uniform(0, 7200),
+            'artist': rng.choice(ARTISTS),
+            'title': rng.choice(WORDS)
+        }),
+        iterations
+    ))
+    results.append(measure(f"{label}.get_episode_markers", lambda i: db.get_episode_markers(ids[i % count]), iterations))
+    
+    return results
+
+
+def run_database(args):
+    from models.database import Database
+    from models.sqlite_database import SQLiteDatabase
+    
+    episodes = [make_episode(i, args.tracks) for i in range(args.episodes)]
+    results = []
+    
+    results += bench_database('database.json', Database(data_dir=temporary_directory()), episodes, args.iterations)
+    
+    # Nothing to import from an empty JSON directory
+    data_dir = temporary_directory()
+    db = SQLiteDatabase(db_path=os.path.join(data_dir, 'bench.db'), data_dir=data_dir)
+    results += bench_database('database.sqlite', db, episodes, args.iterations)
+    
+    return results
+
+
+def run_feeds(args):
+    from models.database import Database
+    from models.podcast_parser import PodcastParser
+    
+    results = []
+    
+    data_dir = temporary_directory()
+    feed_path = os.path.join(data_dir, 'feed.xml')
+    write_feed(feed_path, args.feed_entries, args.tracks)
+    print(f"  feed fixture: {args.feed_entries} entries, {os.path.getsize(feed_path) / 1e6:.1f} MB")
+    
+    parser = PodcastParser()
+    results.append(measure('feed.parse_feed', lambda i: parser.parse_feed(feed_path), args.feed_iterations,
+                           items=args.feed_entries))
+    results.append(measure('feed.iter_feed', lambda i: list(parser.iter_feed(feed_path)), args.feed_iterations,
+                           items=args.feed_entries))
+    
+    # The catalog is stored after the first run, so later ones only reparse unknown entries
+    refresher = PodcastParser(Database(data_dir=os.path.join(data_dir, 'data')))
+    results.append(measure('feed.refresh_feed', lambda i: refresher.refresh_feed(feed_path), args.feed_iterations,
+                           items=args.feed_entries))
+    
+    return results
+
+
+def run_spotify(args):
+    from models.spotify_integration import SpotifyIntegration
+    
+    results = []
+    
+    with FakeSpotifyServer(latency=args.latency) as server:
+        os.environ.update(server.environ())
+        os.environ.setdefault('SPOTIFY_CLIENT_ID', 'benchmark')
+        os.environ.setdefault('SPOTIFY_CLIENT_SECRET', 'benchmark')
+        
+        spotify = SpotifyIntegration()
+        
+        # Unique queries and IDs, so every call goes over HTTP instead of hitting the cache
+        results.append(measure('spotify.search', lambda i: spotify.search(f"query {i}"), args.iterations))
+        results.append(measure('spotify.get_track', lambda i: spotify.get_track(f"track{i}"), args.iterations))
+        results.append(measure('spotify.search.cached', lambda i: spotify.search('query 0'), args.iterations * 10))
+        results.append(measure(
+            'spotify.get_tracks',
+            lambda i: spotify.get_tracks([f"batch{i}_{n}" for n in range(100)]),
+            max(3, args.iterations // 10), items=100
+        ))
+    
+    return results
+
+
+SUITES = {
+    'database': run_database,
+    'feed': run_feeds,
+    'spotify': run_spotify
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline_path, threshold):
+    """Print how p50 latencies changed against a baseline run and return the regressed cases."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {result['name']: result for result in json.load(f)['results']}
+    
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    print(f"{'case':<36}{'p50 before':>12}{'p50 now':>12}{'change':>10}")
+    
+    for result in results:
+        before = baseline.get(result['name'])
+        if not before:
+            continue
+        
+        change = result['p50'] / before['p50'] - 1 if before['p50'] else 0
+        flag = ''
+        if change > threshold:
+            regressions.append(result['name'])
+            flag = '  REGRESSION'
+        print(f"{result['name']:<36}{before['p50'] * 1000:>10.2f}ms{result['p50'] * 1000:>10.2f}ms"
+              f"{change * 100:>+9.0f}%{flag}")
+    
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', action='append', help="run only cases starting with this prefix; repeatable")
+    parser.add_argument('--episodes', type=int, default=5000, help="episodes in the database catalog")
+    parser.add_argument('--tracks', type=int, default=25, help="tracklist lines per episode description")
+    parser.add_argument('--feed-entries', type=int, default=2000, help="items in the RSS fixture")
+    parser.add_argument('--feed-iterations', type=int, default=3, help="timed runs of each feed case")
+    parser.add_argument('--iterations', type=int, default=100, help="timed runs of the quick cases")
+    parser.add_argument('--latency', type=float, default=0.02, help="simulated Spotify API latency in seconds")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--threshold', type=float, default=0.2, help="p50 slowdown that counts as a regression")
+    parser.add_argument('--seed', type=int, default=1, help="random seed, for reproducible runs")
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    prefixes = args.only or []
+    
+    results = []
+    for suite, run in SUITES.items():
+        if prefixes and not any(prefix.startswith(suite) or suite.startswith(prefix) for prefix in prefixes):
+            continue
+        
+        print(f"Running {suite} benchmarks...")
+        for result in run(args):
+            if not prefixes or any(result['name'].startswith(prefix) for prefix in prefixes):
+                results.append(result)
+    
+    print(f"\n{'case':<36}{'items/s':>12}{'p50':>10}{'p99':>10}{'peak mem':>12}{'retained':>12}")
+    for result in results:
+        print(f"{result['name']:<36}{result['throughput'] or 0:>12,.0f}{result['p50'] * 1000:>8.2f}ms"
+              f"{result['p99'] * 1000:>8.2f}ms{result['peakMemory'] / 1e6:>10.1f}MB"
+              f"{result['retainedMemory'] / 1e6:>10.1f}MB")
+    
+    report = {
+        'meta': {
+            'createdAt': datetime.now().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            # ru_maxrss is in kilobytes on Linux
+            'maxRss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 if resource else None,
+            'args': vars(args)
+        },
+        'results': results
+    }
+    
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
+    
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) regressed by more than {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
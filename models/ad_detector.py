@@ -0,0 +1,274 @@
+import os
+import tempfile
+
+import numpy as np
+
+from models.waveform import DECODE_SAMPLE_RATE, decode_audio
+
+# Fingerprint frames of 256 ms taken every 32 ms, so shifted copies of the same audio still line up
+FRAME_SIZE = 2048
+HOP_SIZE = 256
+
+# 33 log-spaced bands give 32 bits per frame
+BAND_EDGES = np.geomspace(300, 3000, 34)
+
+# Frames quieter than this RMS (about -54 dBFS) get no fingerprint
+SILENCE_RMS = 64
+
+class AdDetector:
+    """Finds ads and jingles by matching audio that recurs across downloaded episodes."""
+    
+    def __init__(self, database, fingerprints_dir=None, min_episodes=3, min_duration=5, max_duration=120,
+                 max_bit_error_rate=0.35, ffmpeg='ffmpeg'):
+        """Initialize the ad detector."""
+        self.database = database
+        self.fingerprints_dir = fingerprints_dir or os.path.join(database.data_dir, "fingerprints")
+        self.min_episodes = min_episodes
+        self.min_duration = min_duration
+        self.max_duration = max_duration
+        self.max_bit_error_rate = max_bit_error_rate
+        self.ffmpeg = ffmpeg
+        os.makedirs(self.fingerprints_dir, exist_ok=True)
+    
+    def fingerprint_path(self, episode_id):
+        """Path of the stored fingerprints for an episode."""
+        return os.path.join(self.fingerprints_dir, f"{episode_id}.npy")
+    
+    def get_fingerprints(self, episode_id, audio_path, force=False):
+        """Get an episode's fingerprints, computing them only if the audio is newer than the stored ones."""
+        path = self.fingerprint_path(episode_id)
+        
+        try:
+            if not force and os.path.getmtime(path) >= os.path.getmtime(audio_path):
+                return np.load(path)
+        except (OSError, ValueError):
+            pass
+        
+        fingerprints = fingerprint(decode_audio(audio_path, chunk_samples=HOP_SIZE * 512, ffmpeg=self.ffmpeg))
+        
+        fd, tmp_path = tempfile.mkstemp(dir=self.fingerprints_dir, prefix=f".{episode_id}.", suffix='.npy')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, fingerprints)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        
+        return fingerprints
+    
+    def analyze(self, force=False):
+        """Fingerprint all downloaded episodes and store the recurring segments as skip ranges."""
+        fingerprints = {}
+        errors = {}
+        
+        for download in self.database.get_downloads().values():
+            episode_id = download.get('episodeId')
+            audio_path = download.get('local_path')
+            
+            if download.get('status') != 'completed' or not audio_path or not os.path.exists(audio_path):
+                continue
+            
+            try:
+                fingerprints[episode_id] = self.get_fingerprints(episode_id, audio_path, force)
+            except Exception as e:
+                print(f"Error fingerprinting {episode_id}: {e}")
+                errors[episode_id] = str(e)
+        
+        hop_seconds = HOP_SIZE / DECODE_SAMPLE_RATE
+        segments = find_recurring_segments(
+            fingerprints,
+            min_episodes=self.min_episodes,
+            min_frames=int(self.min_duration / hop_seconds),
+            max_frames=int(self.max_duration / hop_seconds),
+            max_bit_error_rate=self.max_bit_error_rate
+        )
+        
+        # Every analyzed episode is saved, so ranges that no longer match are cleared
+        skip_ranges = {
+            episode_id: [
+                {
+                    'start': round(start * hop_seconds, 2),
+                    'end': round((end * HOP_SIZE + FRAME_SIZE) / DECODE_SAMPLE_RATE, 2)
+                }
+                for start, end in segments.get(episode_id, [])
+            ]
+            for episode_id in fingerprints
+        }
+        self.database.save_ad_segments(skip_ranges)
+        
+        return {'episodes': len(fingerprints), 'segments': skip_ranges, 'errors': errors}
+
+def fingerprint(chunks, sample_rate=DECODE_SAMPLE_RATE):
+    """Compute a 32-bit fingerprint per frame over a stream of sample chunks.
+    
+    Each bit is the sign of the change over time of the energy difference between two
+    neighbouring bands, which survives re-encoding and volume changes. Silent frames are 0.
+    """
+    window = np.hanning(FRAME_SIZE).astype(np.float32)
+    edges = np.searchsorted(np.fft.rfftfreq(FRAME_SIZE, 1 / sample_rate), BAND_EDGES)
+    
+    results = []
+    carry = np.empty(0, dtype=np.float32)
+    previous = None
+    
+    for chunk in chunks:
+        samples = np.concatenate((carry, chunk.astype(np.float32)))
+        count = (samples.size - FRAME_SIZE) // HOP_SIZE + 1
+        if count <= 0:
+            carry = samples
+            continue
+        
+        frames = np.lib.stride_tricks.sliding_window_view(samples, FRAME_SIZE)[::HOP_SIZE][:count]
+        carry = samples[count * HOP_SIZE:]
+        
+        power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2
+        energies = np.add.reduceat(power[:, edges[0]:edges[-1]], edges[:-1] - edges[0], axis=1)
+        differences = energies[:, :-1] - energies[:, 1:]
+        
+        # The first frame of a chunk is compared with the last frame of the previous one
+        if previous is None:
+            previous = differences[:1]
+        bits = np.diff(np.concatenate((previous, differences)), axis=0) > 0
+        previous = differences[-1:]
+        
+        values = np.packbits(bits, axis=1).view('>u4').ravel().astype(np.uint32)
+        values[np.mean(frames ** 2, axis=1) < SILENCE_RMS ** 2] = 0
+        results.append(values)
+    
+    if not results:
+        return np.empty(0, dtype=np.uint32)
+    
+    return np.concatenate(results)
+
+def find_recurring_segments(fingerprints, min_episodes=3, min_frames=150, max_frames=3750, min_hits=3,
+                            max_occurrences=64, max_bit_error_rate=0.35, window=32):
+    """Find frame ranges per episode whose audio also occurs in at least min_episodes - 1 other episodes.
+    
+    Identical fingerprints, looked up through a sorted hash index, only suggest a time offset
+    between two episodes; the matching range at that offset is then taken from the bit error
+    rate of the aligned fingerprints, which stays low even when few frames match exactly.
+    """
+    episode_ids = list(fingerprints)
+    if len(episode_ids) < min_episodes:
+        return {}
+    
+    hashes = np.concatenate([fingerprints[episode_id] for episode_id in episode_ids])
+    episodes = np.concatenate([np.full(fingerprints[episode_id].size, i, dtype=np.int32)
+                               for i, episode_id in enumerate(episode_ids)])
+    frames = np.concatenate([np.arange(fingerprints[episode_id].size, dtype=np.int32)
+                             for episode_id in episode_ids])
+    
+    keep = hashes != 0
+    order = np.argsort(hashes[keep], kind='stable')
+    hashes = hashes[keep][order]
+    episodes = episodes[keep][order]
+    frames = frames[keep][order]
+    
+    if not hashes.size:
+        return {}
+    
+    # Group equal hashes; very common ones carry no information and would explode the pair count
+    starts = np.flatnonzero(np.concatenate(([True], hashes[1:] != hashes[:-1])))
+    counts = np.diff(np.append(starts, hashes.size))
+    group_end = np.repeat(starts + counts, counts)
+    usable = np.repeat((counts > 1) & (counts <= max_occurrences), counts)
+    
+    # Pair every position with each later position in its group
+    first = []
+    second = []
+    positions = np.flatnonzero(usable)
+    for step in range(1, max_occurrences):
+        positions = positions[positions + step < group_end[positions]]
+        if not positions.size:
+            break
+        first.append(positions)
+        second.append(positions + step)
+    
+    if not first:
+        return {}
+    
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    
+    # Orient every pair from the lower to the higher episode index
+    swap = episodes[first] > episodes[second]
+    first, second = np.where(swap, second, first), np.where(swap, first, second)
+    other = episodes[first] != episodes[second]
+    episode_a = episodes[first][other]
+    episode_b = episodes[second][other]
+    frame_a = frames[first][other]
+    offset = frames[second][other] - frame_a
+    
+    # Count hits per episode pair and offset
+    order = np.lexsort((frame_a, offset, episode_b, episode_a))
+    episode_a = episode_a[order]
+    episode_b = episode_b[order]
+    frame_a = frame_a[order]
+    offset = offset[order]
+    
+    breaks = np.concatenate(([True], (episode_a[1:] != episode_a[:-1]) | (episode_b[1:] != episode_b[:-1]) |
+                             (offset[1:] != offset[:-1])))
+    group_starts = np.flatnonzero(breaks)
+    group_ends = np.append(group_starts[1:], breaks.size) - 1
+    candidates = group_ends - group_starts + 1 >= min_hits
+    
+    support = {}
+    for start, end in zip(group_starts[candidates], group_ends[candidates]):
+        a = episode_a[start]
+        b = episode_b[start]
+        shift = offset[start]
+        
+        ranges = _matching_ranges(
+            fingerprints[episode_ids[a]], fingerprints[episode_ids[b]], shift,
+            frame_a[start] - max_frames, frame_a[end] + max_frames,
+            min_frames, max_frames, max_bit_error_rate, window
+        )
+        for range_start, range_end in ranges:
+            support.setdefault(a, {}).setdefault(b, []).append((range_start, range_end))
+            support.setdefault(b, {}).setdefault(a, []).append((range_start + shift, range_end + shift))
+    
+    # Count how many other episodes share each frame; union per pair first so overlaps count once
+    segments = {}
+    for a, partners in support.items():
+        coverage = np.zeros(fingerprints[episode_ids[a]].size, dtype=np.int32)
+        
+        for intervals in partners.values():
+            covered = np.zeros(coverage.size, dtype=bool)
+            for start, end in intervals:
+                covered[start:end + 1] = True
+            coverage += covered
+        
+        ranges = _runs(coverage >= min_episodes - 1)
+        ranges = [(start, end) for start, end in ranges if min_frames <= end - start <= max_frames]
+        if ranges:
+            segments[episode_ids[a]] = ranges
+    
+    return segments
+
+def _matching_ranges(fingerprints_a, fingerprints_b, offset, start, end, min_frames, max_frames,
+                     max_bit_error_rate, window):
+    """Find the ranges in episode a that match episode b shifted by offset frames."""
+    start = max(start, 0, -offset)
+    end = min(end, fingerprints_a.size, fingerprints_b.size - offset)
+    if end - start < min_frames:
+        return []
+    
+    a = fingerprints_a[start:end]
+    b = fingerprints_b[start + offset:end + offset]
+    
+    errors = np.unpackbits((a ^ b).view(np.uint8)).reshape(-1, 32).sum(axis=1, dtype=np.float32)
+    # Silence would match silence anywhere, so count it as chance level
+    errors[(a == 0) | (b == 0)] = 16
+    
+    rate = np.convolve(errors, np.full(window, 1 / (32 * window), dtype=np.float32), mode='same')
+    
+    return [(start + range_start, start + range_end) for range_start, range_end in _runs(rate < max_bit_error_rate)
+            if min_frames <= range_end - range_start <= max_frames]
+
+def _runs(mask):
+    """Get (first, last) index pairs of the runs of True in a boolean array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return [(int(start), int(end) - 1) for start, end in zip(edges[::2], edges[1::2])]
@@ -0,0 +1,173 @@
+import asyncio
+
+import aiohttp
+
+from models.cache import TTLCache
+from models.spotify_integration import REQUEST_SECONDS, RETRY_STATUS_CODES, SpotifyClient
+
+class AsyncSpotifyIntegration(SpotifyClient):
+    """Asyncio integration with Spotify API, for resolving many tracks from one worker."""
+    
+    def __init__(self, concurrency=20, connect_timeout=3.05, read_timeout=10, max_retries=3, backoff=0.5,
+                 max_retry_after=30, cache=None, search_ttl=6 * 3600, track_ttl=7 * 24 * 3600):
+        """Initialize async Spotify integration."""
+        # A cache can be shared with a SpotifyIntegration so both clients reuse lookups
+        cache = cache if cache is not None else TTLCache(max_size=2000, ttl=track_ttl)
+        super().__init__(max_retries, backoff, max_retry_after, cache, search_ttl, track_ttl)
+        
+        self.concurrency = concurrency
+        self.timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        
+        # Created on first use, since they must belong to the running event loop
+        self._session = None
+        self._semaphore = None
+        self._token_lock = None
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        await self.close()
+    
+    async def close(self):
+        """Close the shared connection pool."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    def _get_session(self):
+        """Get the shared session, creating it and the locks on first use."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._token_lock = asyncio.Lock()
+        
+        return self._session
+    
+    async def _call(self, method, url, **kwargs):
+        """Make an HTTP request and return (status, json), or the body text for an error.
+        
+        Rate limits and transient failures are retried with backoff.
+        """
+        session = self._get_session()
+        
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            retry_after = None
+            
+            try:
+                # The semaphore bounds requests in flight, not coroutines waiting to send
+                async with self._semaphore:
+                    with REQUEST_SECONDS.time(endpoint=self._endpoint(url), status='error') as timer:
+                        async with session.request(method, url, **kwargs) as response:
+                            timer.set(status=response.status)
+                            if response.status not in RETRY_STATUS_CODES or last_attempt:
+                                if response.status == 200:
+                                    return response.status, await response.json(content_type=None)
+                                return response.status, await response.text()
+                            
+                            retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if last_attempt:
+                    raise
+            
+            await asyncio.sleep(self._retry_delay(attempt, retry_after))
+    
+    async def get_token(self):
+        """Get a valid Spotify API token."""
+        token_data = self._valid_token()
+        if token_data:
+            return token_data
+        
+        self._get_session()
+        
+        # Only one coroutine fetches a new token; the others wait and reuse it
+        async with self._token_lock:
+            token_data = self._valid_token()
+            if token_data:
+                return token_data
+            
+            return await self._fetch_token()
+    
+    async def _fetch_token(self):
+        """Get a new token from the Spotify accounts service."""
+        try:
+            request = self._token_request()
+            if request is None:
+                return self._get_demo_token()
+            
+            return self._save_token(*await self._call('POST', self.accounts_url, **request))
+        except Exception as e:
+            return self._token_failed(e)
+    
+    async def search(self, query, limit=5):
+        """Search for tracks on Spotify."""
+        cached = self._cached_search(query, limit)
+        if cached is not None:
+            return cached
+        
+        try:
+            token_data = await self.get_token()
+            
+            if token_data['access_token'] == 'demo_token':
+                return self._get_demo_search_results(query)
+            
+            status, data = await self._call('GET', self._search_url(query, limit), headers=self._auth_headers(token_data['access_token']))
+            return self._parse_search(query, limit, status, data)
+        
+        except Exception as e:
+            print(f"Error searching Spotify: {e}")
+            return self._get_demo_search_results(query)
+    
+    async def get_track(self, track_id):
+        """Get a track from Spotify by ID."""
+        cached = self._cached_track(track_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            token_data = await self.get_token()
+            
+            if token_data['access_token'] == 'demo_token':
+                return self._get_demo_track(track_id)
+            
+            status, data = await self._call('GET', self._track_url(track_id), headers=self._auth_headers(token_data['access_token']))
+            return self._parse_track(track_id, status, data)
+        
+        except Exception as e:
+            print(f"Error getting Spotify track: {e}")
+            return self._get_demo_track(track_id)
+    
+    async def get_tracks(self, track_ids):
+        """Get several tracks, 50 per request, returned in input order with per-ID errors."""
+        track_ids = list(track_ids)
+        errors = {}
+        
+        tracks, missing = self._split_cached_tracks(track_ids)
+        
+        if missing:
+            token_data = await self.get_token()
+            answered = self._tracks_without_api(token_data, missing)
+            
+            if answered is not None:
+                results = [answered]
+            else:
+                results = await asyncio.gather(*(self._fetch_tracks(chunk, token_data['access_token']) for chunk in self._batches(missing)))
+            
+            for chunk_tracks, chunk_errors in results:
+                tracks.update(chunk_tracks)
+                errors.update(chunk_errors)
+        
+        return {
+            'tracks': [tracks.get(track_id) for track_id in track_ids],
+            'errors': errors
+        }
+    
+    async def _fetch_tracks(self, track_ids, access_token):
+        """Fetch one batch of tracks, returning found tracks and errors by ID."""
+        try:
+            status, data = await self._call('GET', self._tracks_url(track_ids), headers=self._auth_headers(access_token))
+            return self._parse_tracks(track_ids, status, data)
+        except Exception as e:
+            return self._tracks_failed(track_ids, e)
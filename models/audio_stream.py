@@ -0,0 +1,111 @@
+import mimetypes
+import os
+import threading
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Upstream headers passed through when proxying
+PROXY_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+class AudioStreamer:
+    """Serves episode audio with Range support from downloaded files, proxying the remote URL otherwise."""
+    
+    def __init__(self, database, downloads=None, cache=None, max_age=7 * 24 * 3600, timeout=(3.05, 30),
+                 pool_size=10):
+        """Initialize the audio streamer.
+        
+        downloads is an optional DownloadManager; when given, proxied episodes are
+        downloaded in the background so later requests are served locally. cache is an
+        optional DownloadCache that is told which downloaded episodes get played.
+        """
+        self.database = database
+        self.downloads = downloads
+        self.cache = cache
+        self.max_age = max_age
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+    
+    def local_path(self, episode_id):
+        """Get the path of a completed download of an episode, if the file is still there."""
+        for download in self.database.get_downloads().values():
+            if download.get('episodeId') != episode_id or download.get('status') != 'completed':
+                continue
+            
+            path = download.get('local_path')
+            if path and os.path.isfile(path):
+                return path
+        
+        return None
+    
+    def stream(self, episode_id):
+        """Build the Flask response for the audio of an episode in the current request."""
+        from flask import abort, send_file
+        
+        path = self.local_path(episode_id)
+        if path:
+            if self.cache:
+                self.cache.record_play(episode_id)
+            
+            # send_file answers Range, If-Range and If-None-Match itself and hands the file to
+            # the server's wsgi.file_wrapper, which uses sendfile where the server supports it
+            return send_file(
+                path,
+                mimetype=mimetypes.guess_type(path)[0] or 'audio/mpeg',
+                conditional=True,
+                etag=True,
+                max_age=self.max_age
+            )
+        
+        episode = self.database.get_episode(episode_id)
+        if not episode or not episode.get('audioUrl'):
+            abort(404)
+        
+        self._cache_episode(episode)
+        return self._proxy(episode['audioUrl'])
+    
+    def _proxy(self, url):
+        """Stream the remote file, passing the client's Range through."""
+        from flask import Response, abort, request
+        
+        headers = {name: request.headers[name] for name in ('Range', 'If-Range') if name in request.headers}
+        
+        try:
+            upstream = self.session.get(url, headers=headers, stream=True, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Error proxying {url}: {e}")
+            abort(502)
+        
+        if upstream.status_code >= 400 and upstream.status_code != 416:
+            upstream.close()
+            abort(502)
+        
+        response = Response(
+            upstream.iter_content(64 * 1024),
+            status=upstream.status_code,
+            headers={name: upstream.headers[name] for name in PROXY_HEADERS if name in upstream.headers},
+            direct_passthrough=True
+        )
+        # Don't let the browser keep proxied bytes; the local copy replaces them soon
+        response.headers['Cache-Control'] = 'no-cache'
+        response.call_on_close(upstream.close)
+        return response
+    
+    def _cache_episode(self, episode):
+        """Start a background download of a proxied episode unless one is already running."""
+        if self.downloads is None:
+            return
+        
+        # A seek sends several requests at once; only the first may start a download
+        with self._lock:
+            for download in self.database.get_downloads().values():
+                if download.get('episodeId') == episode['id'] and download.get('status') in ('pending', 'downloading'):
+                    return
+            
+            self.downloads.start(str(uuid.uuid4()), episode)
@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a time-to-live."""
+    
+    def __init__(self, max_size=1000, ttl=3600, path=None):
+        """Initialize the cache, loading persisted entries from path if given."""
+        self.max_size = max_size
+        self.ttl = ttl
+        self.path = path
+        
+        # key -> (expires_at, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0}
+        
+        if path:
+            self.load()
+    
+    def get(self, key, default=None):
+        """Get a value, or default if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            
+            if entry is None:
+                self.stats['misses'] += 1
+                return default
+            
+            if entry[0] < time.time():
+                del self._entries[key]
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                return default
+            
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[1]
+    
+    def set(self, key, value, ttl=None):
+        """Store a value, evicting the least recently used entries when full."""
+        ttl = self.ttl if ttl is None else ttl
+        
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def delete(self, key):
+        """Remove a value."""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        """Remove all values."""
+        with self._lock:
+            self._entries.clear()
+    
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+    
+    def get_stats(self):
+        """Get hit/miss counters and the hit rate."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats['size'] = len(self._entries)
+        
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        return stats
+    
+    def load(self):
+        """Load unexpired entries from the cache file."""
+        try:
+            with open(self.path, 'r') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"Error loading cache {self.path}: {e}")
+            return
+        
+        now = time.time()
+        with self._lock:
+            # Saved least recently used first, so the order carries over
+            for key, expires_at, value in entries:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+            
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def save(self):
+        """Write unexpired entries to the cache file."""
+        if not self.path:
+            return False
+        
+        now = time.time()
+        with self._lock:
+            entries = [[key, expires_at, value] for key, (expires_at, value) in self._entries.items() if expires_at > now]
+        
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            
+            # Write to a temp file and rename, so a crash never leaves half a cache file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.path)}.")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"Error saving cache {self.path}: {e}")
+            return False
@@ -1,124 +1,558 @@
+import atexit
+import copy
 import json
 import os
+import stat
+import tempfile
+import threading
 import time
 import uuid
+from bisect import bisect_right
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; writes are then only locked within the process
+    fcntl = None
+
+from models import metrics
+from models.episode import load_episodes, split_episodes
+from models.search_index import SearchIndex
+
+# Where the data files are kept unless another directory is given
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+
+# Episode fields returned by list views; the full HTML description is left out
+EPISODE_SUMMARY_FIELDS = ('id', 'title', 'date', 'audioUrl', 'image', 'duration')
+
+FILE_IO_SECONDS = metrics.histogram(
+    'sublimemix_database_file_io_seconds',
+    'Data file reads and writes, and SQLite write transactions; cached reads are not counted.',
+    ('operation', 'file')
+)
+
+# Read once, as the only way to get the umask is to set it
+UMASK = os.umask(0)
+os.umask(UMASK)
+
+def file_mode(path):
+    """Get the permissions for a new version of a file: those of the current one, or the default."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        return 0o666 & ~UMASK
+
+def marker_time(song):
+    """Get the playback position of a favorite song marker in seconds."""
+    try:
+        return float(song.get('timestamp') or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def nearest_marker(markers, times, position, max_distance=None):
+    """Get the marker closest to a playback position from markers sorted by time.
+    
+    On a tie the marker before the position wins, as that song is the one playing.
+    """
+    i = bisect_right(times, position)
+    nearest = None
+    
+    for j in (i - 1, i):
+        if 0 <= j < len(markers) and (nearest is None or abs(times[j] - position) < abs(times[nearest] - position)):
+            nearest = j
+    
+    if nearest is None or (max_distance is not None and abs(times[nearest] - position) > max_distance):
+        return None
+    return markers[nearest]
+
 class Database:
     """Database class for storing and retrieving data."""
     
-    def __init__(self):
+    def __init__(self, data_dir=None, progress_flush_interval=None):
         """Initialize the database."""
-        self.data_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+        self.data_dir = data_dir or DEFAULT_DATA_DIR
         os.makedirs(self.data_dir, exist_ok=True)
         
         self.episodes_file = os.path.join(self.data_dir, "episodes.json")
+        self.descriptions_file = os.path.join(self.data_dir, "episode_descriptions.json")
         self.favorites_file = os.path.join(self.data_dir, "favorites.json")
         self.favorite_songs_file = os.path.join(self.data_dir, "favorite_songs.json")
         self.downloads_file = os.path.join(self.data_dir, "downloads.json")
+        self.feeds_file = os.path.join(self.data_dir, "feeds.json")
+        self.tracklists_file = os.path.join(self.data_dir, "tracklists.json")
+        self.ad_segments_file = os.path.join(self.data_dir, "ad_segments.json")
+        self.search_index_file = os.path.join(self.data_dir, "search_index.json")
+        
+        # Parsed file contents keyed by path, with the (mtime, size, inode) they were read at
+        self._cache = {}
+        self._cache_lock = threading.RLock()
+        self.cache_stats = {'hits': 0, 'misses': 0, 'reloads': 0, 'recoveries': 0, 'writes': 0}
+        
+        # Per-file locks serializing read-modify-write cycles within this process
+        self._file_locks = {}
+        self._file_locks_lock = threading.Lock()
+        
+        # Indexes derived from cached file contents, rebuilt when the contents change
+        self._indexes = {}
+        
+        # Full-text search index, loaded on first use, with the cached episode and favorite
+        # song lists it was last brought up to date with
+        self._search_index = None
+        self._search_sources = None
+        self._search_lock = threading.RLock()
+        
+        # Download progress waiting to be written, keyed by task ID. Seconds between
+        # flushes; 0 writes every progress update straight to disk
+        if progress_flush_interval is None:
+            progress_flush_interval = float(os.environ.get('DOWNLOAD_PROGRESS_FLUSH_INTERVAL', 2.0))
+        self.progress_flush_interval = progress_flush_interval
+        self._pending_progress = {}
+        self._progress_lock = threading.Lock()
+        self._last_progress_flush = time.monotonic()
+        self._flush_timer = None
+        atexit.register(self.flush_download_progress)
         
         # Initialize data files if they don't exist
         self._init_data_files()
     
     def _init_data_files(self):
         """Initialize data files if they don't exist."""
-        if not os.path.exists(self.episodes_file):
-            with open(self.episodes_file, 'w') as f:
-                json.dump([], f)
+        for path, empty in ((self.episodes_file, []), (self.descriptions_file, {}),
+                            (self.favorites_file, []), (self.favorite_songs_file, []),
+                            (self.downloads_file, {}), (self.feeds_file, {}),
+                            (self.tracklists_file, {}), (self.ad_segments_file, {})):
+            if not os.path.exists(path):
+                with self._locked(path):
+                    # Another process may have created it while we waited for the lock
+                    if not os.path.exists(path):
+                        self._write_json(path, empty)
+        
+        self._split_descriptions()
+    
+    def _split_descriptions(self):
+        """Move descriptions out of an episodes file written before they were stored apart."""
+        try:
+            episodes = self._read_json(self.episodes_file)
+            if any(episode.description is not None for episode in episodes):
+                descriptions = self._get_descriptions()
+                self._write_episodes([episode.to_dict(descriptions.get(episode.id)) for episode in episodes])
+        except Exception as e:
+            print(f"Error moving episode descriptions: {e}")
+    
+    @contextmanager
+    def _locked(self, path):
+        """Hold the thread and process lock for a data file."""
+        with self._file_locks_lock:
+            lock = self._file_locks.setdefault(path, threading.Lock())
+        
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            
+            # Lock a sidecar file, since the data file itself is replaced on every write
+            with open(f"{path}.lock", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+    
+    def _file_signature(self, path):
+        """Return the (mtime, size, inode) used to detect changes to a data file."""
+        stat = os.stat(path)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _read_json(self, path):
+        """Read a data file, serving it from the cache while it is unchanged on disk."""
+        with self._cache_lock:
+            signature = self._file_signature(path)
+            cached = self._cache.get(path)
+            
+            if cached and cached[0] == signature:
+                self.cache_stats['hits'] += 1
+                return cached[1]
+            
+            try:
+                with FILE_IO_SECONDS.time(operation='read', file=os.path.basename(path)):
+                    data = self._load_json(path)
+            except ValueError:
+                data = self._recover_json(path)
+                signature = self._file_signature(path)
+            
+            if cached:
+                self.cache_stats['reloads'] += 1
+            else:
+                self.cache_stats['misses'] += 1
+            
+            self._cache[path] = (signature, data)
+            return data
+    
+    def _recover_json(self, path):
+        """Restore a corrupt data file from its last good snapshot."""
+        backup_path = f"{path}.bak"
+        
+        # Let the caller see the original error when there is nothing to fall back to
+        with open(backup_path, 'r') as f:
+            data = json.load(f)
+        
+        print(f"Data file {path} is corrupt, restored last good snapshot")
+        self.cache_stats['recoveries'] += 1
+        
+        tmp_path = self._write_temp(path, data)
+        try:
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        
+        return self._load_json(path) if path == self.episodes_file else data
+    
+    def _load_json(self, path):
+        """Parse a data file; episodes become compact records."""
+        if path == self.episodes_file:
+            return load_episodes(path)
+        
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    def _write_temp(self, path, data):
+        """Write data to a new file next to a data file and return its path once it is on disk."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+                f.flush()
+                os.fsync(f.fileno())
+            
+            # mkstemp creates the file readable by its owner only
+            os.chmod(tmp_path, file_mode(path))
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+    
+    def _write_json(self, path, data):
+        """Atomically write a data file and keep the cache in step with it.
         
-        if not os.path.exists(self.favorites_file):
-            with open(self.favorites_file, 'w') as f:
-                json.dump([], f)
+        Callers hold the file's lock; the cache lock is only taken to update the cache.
+        """
+        with FILE_IO_SECONDS.time(operation='write', file=os.path.basename(path)):
+            tmp_path = None
+            try:
+                # Write the new contents next to the file and only swap it in once
+                # they are on disk, so a crash never leaves a truncated file behind.
+                # Episode records are cached as they are and stored as dicts
+                tmp_path = self._write_temp(path, [episode.stored() for episode in data] if path == self.episodes_file else data)
+                
+                # Keep the current version as the last good snapshot
+                if os.path.exists(path):
+                    backup_tmp_path = f"{tmp_path}.bak"
+                    os.link(path, backup_tmp_path)
+                    os.replace(backup_tmp_path, f"{path}.bak")
+                
+                os.replace(tmp_path, path)
+                tmp_path = None
+                self._fsync_dir(os.path.dirname(path))
+                
+                signature = self._file_signature(path)
+                with self._cache_lock:
+                    self._cache[path] = (signature, data)
+                    self.cache_stats['writes'] += 1
+            except Exception:
+                # Drop the entry so the next read goes back to disk
+                with self._cache_lock:
+                    self._cache.pop(path, None)
+                raise
+            finally:
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    
+    def _fsync_dir(self, directory):
+        """Flush a directory entry so a rename survives a crash."""
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
         
-        if not os.path.exists(self.favorite_songs_file):
-            with open(self.favorite_songs_file, 'w') as f:
-                json.dump([], f)
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+    
+    def _get_index(self, path, name, build):
+        """Get an index over a data file, rebuilding it when the file has changed."""
+        with self._cache_lock:
+            data = self._read_json(path)
+            cached = self._indexes.get((path, name))
+            
+            # The index is only valid for the exact object it was built from
+            if cached and cached[0] is data:
+                return cached[1]
+            
+            index = build(data)
+            self._indexes[(path, name)] = (data, index)
+            return index
+    
+    def _index_by_id(self, records):
+        """Build an id -> record index."""
+        return {record.get('id'): record for record in records if record.get('id') is not None}
+    
+    def _index_by_episode(self, songs):
+        """Build an episode ID -> (marker times, songs) index, sorted by time."""
+        index = {}
+        for song in sorted(songs, key=marker_time):
+            times, markers = index.setdefault(song.get('episodeId'), ([], []))
+            times.append(marker_time(song))
+            markers.append(song)
+        return index
+    
+    def _index_by_date(self, episodes):
+        """Build a list of episodes sorted by date, newest first."""
+        return sorted(episodes, key=lambda episode: episode.get('date') or '', reverse=True)
+    
+    def get_cache_stats(self):
+        """Get cache hit/miss/reload counters."""
+        with self._cache_lock:
+            stats = dict(self.cache_stats)
+            stats['entries'] = len(self._cache)
+            return stats
+    
+    def clear_cache(self):
+        """Drop all cached file contents."""
+        with self._cache_lock:
+            self._cache.clear()
+            self._indexes.clear()
+    
+    def _get_descriptions(self):
+        """Get the episode descriptions by episode ID."""
+        try:
+            return self._read_json(self.descriptions_file)
+        except Exception as e:
+            print(f"Error loading episode descriptions: {e}")
+            return {}
+    
+    def _episode_dicts(self, episodes, fields=None):
+        """Turn episode records into dicts, reading descriptions only when they are asked for."""
+        if fields and 'description' not in fields:
+            return [{field: episode.get(field) for field in fields} for episode in episodes]
         
-        if not os.path.exists(self.downloads_file):
-            with open(self.downloads_file, 'w') as f:
-                json.dump({}, f)
+        descriptions = self._get_descriptions()
+        episodes = [episode.to_dict(descriptions.get(episode.id)) for episode in episodes]
+        if fields:
+            episodes = [{field: episode.get(field) for field in fields} for episode in episodes]
+        return episodes
     
     def get_episodes(self):
         """Get all episodes."""
         try:
-            with open(self.episodes_file, 'r') as f:
-                return json.load(f)
+            episodes = self._read_json(self.episodes_file)
         except Exception as e:
             print(f"Error loading episodes: {e}")
             return []
+        
+        return self._episode_dicts(episodes)
+    
+    def _write_episodes(self, episodes):
+        """Write episode dicts to the episodes file and their descriptions to the descriptions file."""
+        records, descriptions = split_episodes(episodes)
+        
+        # Descriptions are written first and those of the episodes being replaced are kept
+        # until the next save, so the episodes file never lists an episode without one
+        with self._locked(self.descriptions_file):
+            stored = self._read_json(self.descriptions_file)
+            for episode in self._read_json(self.episodes_file):
+                if episode.id not in descriptions and episode.id in stored:
+                    descriptions[episode.id] = stored[episode.id]
+            self._write_json(self.descriptions_file, descriptions)
+        
+        with self._locked(self.episodes_file):
+            self._write_json(self.episodes_file, records)
     
     def save_episodes(self, episodes):
         """Save episodes to file."""
         try:
-            with open(self.episodes_file, 'w') as f:
-                json.dump(episodes, f)
-            return True
+            self._write_episodes(episodes)
         except Exception as e:
             print(f"Error saving episodes: {e}")
             return False
+        
+        # Index new and changed episodes right away, so searching after a feed refresh stays fast.
+        # The saved index is only a cache that the next sync repairs, so it is written now and then
+        try:
+            self._get_search_index().save_if_due()
+        except Exception as e:
+            print(f"Error updating search index: {e}")
+        return True
     
     def get_episode(self, episode_id):
         """Get a specific episode by ID."""
-        episodes = self.get_episodes()
-        for episode in episodes:
-            if episode.get('id') == episode_id:
-                return episode
-        return None
+        episode = self._get_episode_record(episode_id)
+        return self._episode_dicts([episode])[0] if episode is not None else None
+    
+    def _get_episode_record(self, episode_id):
+        """Get the cached record of an episode, without its description."""
+        try:
+            return self._get_index(self.episodes_file, 'id', self._index_by_id).get(episode_id)
+        except Exception as e:
+            print(f"Error loading episodes: {e}")
+            return None
+    
+    def query_episodes(self, offset=0, limit=None, date_from=None, date_to=None,
+                       favorites_only=False, sort='date', fields=None):
+        """Get a page of episodes with optional filtering and field projection."""
+        # sort is 'date' (newest first), 'date_asc' or None to keep file order
+        try:
+            if sort in ('date', 'date_asc'):
+                episodes = self._get_index(self.episodes_file, 'date', self._index_by_date)
+                if sort == 'date_asc':
+                    episodes = episodes[::-1]
+            else:
+                episodes = self._read_json(self.episodes_file)
+        except Exception as e:
+            print(f"Error loading episodes: {e}")
+            episodes = []
+        
+        if favorites_only:
+            favorites = set(self.get_favorites())
+            episodes = [episode for episode in episodes if episode.get('id') in favorites]
+        
+        # Dates are ISO 8601 strings, so a plain date prefix like '2024-01-01' works too
+        if date_from or date_to:
+            episodes = [
+                episode for episode in episodes
+                if (not date_from or (episode.get('date') or '') >= date_from)
+                and (not date_to or (episode.get('date') or '')[:len(date_to)] <= date_to)
+            ]
+        
+        total = len(episodes)
+        offset = max(int(offset or 0), 0)
+        end = offset + int(limit) if limit is not None else None
+        page = episodes[offset:end]
+        
+        return {
+            # Project fields, e.g. EPISODE_SUMMARY_FIELDS to leave out the description
+            'episodes': self._episode_dicts(page, fields),
+            'total': total,
+            'offset': offset,
+            'limit': limit
+        }
+    
+    def _get_search_index(self):
+        """Get the search index, bringing it up to date with the episodes and favorite songs."""
+        with self._search_lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.search_index_file)
+                atexit.register(self._search_index.save)
+            
+            # Cached file contents are replaced on every write, never modified, so
+            # identity tells whether anything changed since the last sync
+            episodes = self._read_json(self.episodes_file)
+            favorite_songs = self._read_json(self.favorite_songs_file)
+            sources = self._search_sources
+            if not sources or sources[0] is not episodes or sources[1] is not favorite_songs:
+                self._search_index.sync(self._episode_dicts(episodes), favorite_songs)
+                self._search_sources = (episodes, favorite_songs)
+            
+            return self._search_index
+    
+    def _reindex_favorite_songs(self, episode_id, favorite_songs):
+        """Update the search index after the favorite songs of one episode changed."""
+        try:
+            with self._search_lock:
+                # Not loaded yet; the first search syncs everything anyway
+                if self._search_index is None or self._search_sources is None:
+                    return
+                
+                episodes = self._read_json(self.episodes_file)
+                if self._search_sources[0] is not episodes:
+                    return
+                
+                episode = self.get_episode(episode_id)
+                if episode:
+                    songs = [song for song in favorite_songs if song.get('episodeId') == episode_id]
+                    self._search_index.index_episode(episode, songs)
+                
+                self._search_sources = (episodes, favorite_songs)
+                self._search_index.save_if_due()
+        except Exception as e:
+            print(f"Error updating search index: {e}")
+    
+    def search(self, query, limit=20, fields=EPISODE_SUMMARY_FIELDS):
+        """Search episode titles, descriptions and favorite songs, best matches first."""
+        try:
+            results = self._get_search_index().search(query, limit)
+        except Exception as e:
+            print(f"Error searching episodes: {e}")
+            results = []
+        
+        found = []
+        for episode_id, score in results:
+            episode = self._get_episode_record(episode_id)
+            if episode is not None:
+                found.append((episode, score))
+        
+        episodes = self._episode_dicts([episode for episode, _ in found], fields)
+        for episode, (_, score) in zip(episodes, found):
+            episode['score'] = score
+        
+        return {
+            'episodes': episodes,
+            'query': query
+        }
     
     def get_favorites(self):
         """Get all favorite episodes."""
         try:
-            with open(self.favorites_file, 'r') as f:
-                return json.load(f)
+            return list(self._read_json(self.favorites_file))
         except Exception as e:
             print(f"Error loading favorites: {e}")
             return []
     
     def add_favorite(self, episode_id):
         """Add an episode to favorites."""
-        favorites = self.get_favorites()
-        
-        if episode_id not in favorites:
-            favorites.append(episode_id)
-            
-            try:
-                with open(self.favorites_file, 'w') as f:
-                    json.dump(favorites, f)
-            except Exception as e:
-                print(f"Error saving favorites: {e}")
-                return favorites
+        try:
+            with self._locked(self.favorites_file):
+                favorites = list(self._read_json(self.favorites_file))
+                
+                if episode_id not in favorites:
+                    favorites.append(episode_id)
+                    self._write_json(self.favorites_file, favorites)
+        except Exception as e:
+            print(f"Error saving favorites: {e}")
+            return self.get_favorites()
         
         return favorites
     
     def remove_favorite(self, episode_id):
         """Remove an episode from favorites."""
-        favorites = self.get_favorites()
-        
-        if episode_id in favorites:
-            favorites.remove(episode_id)
-            
-            try:
-                with open(self.favorites_file, 'w') as f:
-                    json.dump(favorites, f)
-            except Exception as e:
-                print(f"Error saving favorites: {e}")
-                return favorites
+        try:
+            with self._locked(self.favorites_file):
+                favorites = list(self._read_json(self.favorites_file))
+                
+                if episode_id in favorites:
+                    favorites.remove(episode_id)
+                    self._write_json(self.favorites_file, favorites)
+        except Exception as e:
+            print(f"Error saving favorites: {e}")
+            return self.get_favorites()
         
         return favorites
     
     def get_favorite_songs(self):
         """Get all favorite songs."""
         try:
-            with open(self.favorite_songs_file, 'r') as f:
-                return json.load(f)
+            return [dict(song) for song in self._read_json(self.favorite_songs_file)]
         except Exception as e:
             print(f"Error loading favorite songs: {e}")
             return []
     
     def add_favorite_song(self, song):
         """Add a song to favorite songs."""
-        favorite_songs = self.get_favorite_songs()
-        
         # Generate ID if not provided
         if not song.get('id'):
             song['id'] = str(uuid.uuid4())
@@ -127,11 +561,13 @@ class Database:
         if not song.get('createdAt'):
             song['createdAt'] = datetime.now().isoformat()
         
-        favorite_songs.append(song)
-        
         try:
-            with open(self.favorite_songs_file, 'w') as f:
-                json.dump(favorite_songs, f)
+            with self._locked(self.favorite_songs_file):
+                favorite_songs = list(self._read_json(self.favorite_songs_file))
+                favorite_songs.append(dict(song))
+                self._write_json(self.favorite_songs_file, favorite_songs)
+            
+            self._reindex_favorite_songs(song.get('episodeId'), favorite_songs)
             return song['id']
         except Exception as e:
             print(f"Error saving favorite songs: {e}")
@@ -139,53 +575,85 @@ class Database:
     
     def get_favorite_song(self, song_id):
         """Get a specific favorite song by ID."""
-        favorite_songs = self.get_favorite_songs()
-        for song in favorite_songs:
-            if song.get('id') == song_id:
-                return song
-        return None
+        try:
+            song = self._get_index(self.favorite_songs_file, 'id', self._index_by_id).get(song_id)
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return None
+        
+        return dict(song) if song is not None else None
+    
+    def get_episode_markers(self, episode_id):
+        """Get the favorite songs of an episode sorted by timestamp."""
+        try:
+            index = self._get_index(self.favorite_songs_file, 'episode', self._index_by_episode)
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return []
+        
+        return [dict(song) for song in index.get(episode_id, ((), ()))[1]]
+    
+    def get_marker_at(self, episode_id, position, max_distance=None):
+        """Get the favorite song of an episode at or nearest to a playback position in seconds."""
+        try:
+            index = self._get_index(self.favorite_songs_file, 'episode', self._index_by_episode)
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return None
+        
+        times, markers = index.get(episode_id, ((), ()))
+        song = nearest_marker(markers, times, position, max_distance)
+        return dict(song) if song is not None else None
     
     def remove_favorite_song(self, song_id):
         """Remove a song from favorite songs."""
-        favorite_songs = self.get_favorite_songs()
-        
-        for i, song in enumerate(favorite_songs):
-            if song.get('id') == song_id:
-                favorite_songs.pop(i)
+        try:
+            with self._locked(self.favorite_songs_file):
+                favorite_songs = self._read_json(self.favorite_songs_file)
+                remaining = [song for song in favorite_songs if song.get('id') != song_id]
                 
-                try:
-                    with open(self.favorite_songs_file, 'w') as f:
-                        json.dump(favorite_songs, f)
-                    return True
-                except Exception as e:
-                    print(f"Error saving favorite songs: {e}")
+                if len(remaining) == len(favorite_songs):
                     return False
-        
-        return False
+                
+                self._write_json(self.favorite_songs_file, remaining)
+            
+            removed = next(song for song in favorite_songs if song.get('id') == song_id)
+            self._reindex_favorite_songs(removed.get('episodeId'), remaining)
+            return True
+        except Exception as e:
+            print(f"Error saving favorite songs: {e}")
+            return False
     
     def get_downloads(self):
         """Get all downloads."""
         try:
-            with open(self.downloads_file, 'r') as f:
-                return json.load(f)
+            downloads = {task_id: dict(download) for task_id, download in self._read_json(self.downloads_file).items()}
         except Exception as e:
             print(f"Error loading downloads: {e}")
             return {}
+        
+        # Show buffered progress that hasn't been written yet
+        with self._progress_lock:
+            for task_id, pending in self._pending_progress.items():
+                if task_id in downloads:
+                    downloads[task_id].update(pending)
+        
+        return downloads
     
     def add_download(self, task_id, episode_id):
         """Add a download task."""
-        downloads = self.get_downloads()
-        
-        downloads[task_id] = {
-            'episodeId': episode_id,
-            'status': 'pending',
-            'progress': 0,
-            'createdAt': datetime.now().isoformat()
-        }
-        
         try:
-            with open(self.downloads_file, 'w') as f:
-                json.dump(downloads, f)
+            with self._locked(self.downloads_file):
+                downloads = dict(self._read_json(self.downloads_file))
+                
+                downloads[task_id] = {
+                    'episodeId': episode_id,
+                    'status': 'pending',
+                    'progress': 0,
+                    'createdAt': datetime.now().isoformat()
+                }
+                
+                self._write_json(self.downloads_file, downloads)
             return True
         except Exception as e:
             print(f"Error saving downloads: {e}")
@@ -193,30 +661,124 @@ class Database:
     
     def get_download(self, task_id):
         """Get a specific download by task ID."""
-        downloads = self.get_downloads()
-        return downloads.get(task_id)
+        try:
+            download = self._read_json(self.downloads_file).get(task_id)
+        except Exception as e:
+            print(f"Error loading downloads: {e}")
+            return None
+        
+        if download is None:
+            return None
+        
+        # Show buffered progress that hasn't been written yet
+        with self._progress_lock:
+            return {**download, **self._pending_progress.get(task_id, {})}
     
     def update_download_status(self, task_id, status, progress=None, error=None, local_path=None):
         """Update the status of a download task."""
-        downloads = self.get_downloads()
+        # Progress ticks that keep the same status are buffered in memory and
+        # written at most once per flush interval; status changes, errors and
+        # paths are written straight away
+        if error is None and local_path is None and self.progress_flush_interval > 0:
+            download = self.get_download(task_id)
+            
+            if download is None:
+                return False
+            
+            if download.get('status') == status:
+                with self._progress_lock:
+                    pending = self._pending_progress.setdefault(task_id, {})
+                    pending['status'] = status
+                    
+                    if progress is not None:
+                        pending['progress'] = progress
+                    
+                    elapsed = time.monotonic() - self._last_progress_flush
+                    due = elapsed >= self.progress_flush_interval
+                    
+                    # Write it once the interval is up even if no further update arrives
+                    if not due and self._flush_timer is None:
+                        self._flush_timer = threading.Timer(self.progress_flush_interval - elapsed, self.flush_download_progress)
+                        self._flush_timer.daemon = True
+                        self._flush_timer.start()
+                
+                if due:
+                    return self.flush_download_progress()
+                return True
         
-        if task_id not in downloads:
+        try:
+            with self._locked(self.downloads_file):
+                downloads = dict(self._read_json(self.downloads_file))
+                
+                if task_id not in downloads:
+                    return False
+                
+                self._apply_pending_progress(downloads)
+                
+                # Copy the record so the cached version is untouched if the write fails
+                download = dict(downloads[task_id])
+                download['status'] = status
+                
+                if progress is not None:
+                    download['progress'] = progress
+                
+                if error is not None:
+                    download['error'] = error
+                
+                if local_path is not None:
+                    download['local_path'] = local_path
+                
+                downloads[task_id] = download
+                self._write_json(self.downloads_file, downloads)
+            return True
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
             return False
-        
-        downloads[task_id]['status'] = status
-        
-        if progress is not None:
-            downloads[task_id]['progress'] = progress
-        
-        if error is not None:
-            downloads[task_id]['error'] = error
-        
-        if local_path is not None:
-            downloads[task_id]['local_path'] = local_path
+    
+    def update_download(self, task_id, **fields):
+        """Set extra fields on a download task, such as its size on disk or when it was last played."""
+        try:
+            with self._locked(self.downloads_file):
+                downloads = dict(self._read_json(self.downloads_file))
+                
+                if task_id not in downloads:
+                    return False
+                
+                self._apply_pending_progress(downloads)
+                downloads[task_id] = {**downloads[task_id], **fields}
+                self._write_json(self.downloads_file, downloads)
+            return True
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def _apply_pending_progress(self, downloads):
+        """Move buffered progress into a downloads dict that is about to be written."""
+        with self._progress_lock:
+            for task_id, pending in self._pending_progress.items():
+                if task_id in downloads:
+                    downloads[task_id] = {**downloads[task_id], **pending}
+            
+            self._pending_progress.clear()
+            self._last_progress_flush = time.monotonic()
+            
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+    
+    def flush_download_progress(self):
+        """Write buffered download progress to disk."""
+        with self._progress_lock:
+            if not self._pending_progress:
+                # A removed download can leave the timer with nothing to write
+                self._flush_timer = None
+                return True
         
         try:
-            with open(self.downloads_file, 'w') as f:
-                json.dump(downloads, f)
+            with self._locked(self.downloads_file):
+                downloads = dict(self._read_json(self.downloads_file))
+                self._apply_pending_progress(downloads)
+                self._write_json(self.downloads_file, downloads)
             return True
         except Exception as e:
             print(f"Error saving downloads: {e}")
@@ -224,17 +786,91 @@ class Database:
     
     def remove_download(self, task_id):
         """Remove a download task."""
-        downloads = self.get_downloads()
-        
-        if task_id in downloads:
-            del downloads[task_id]
-            
-            try:
-                with open(self.downloads_file, 'w') as f:
-                    json.dump(downloads, f)
+        try:
+            with self._locked(self.downloads_file):
+                downloads = dict(self._read_json(self.downloads_file))
+                
+                if task_id not in downloads:
+                    return False
+                
+                del downloads[task_id]
+                self._write_json(self.downloads_file, downloads)
+                
+                with self._progress_lock:
+                    self._pending_progress.pop(task_id, None)
                 return True
-            except Exception as e:
-                print(f"Error saving downloads: {e}")
-                return False
-        
-        return False
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def get_feed_state(self, feed_url):
+        """Get the stored HTTP validators (etag, modified) for a feed."""
+        try:
+            return dict(self._read_json(self.feeds_file).get(feed_url, {}))
+        except Exception as e:
+            print(f"Error loading feed state: {e}")
+            return {}
+    
+    def save_feed_state(self, feed_url, state):
+        """Save the HTTP validators (etag, modified) for a feed."""
+        try:
+            with self._locked(self.feeds_file):
+                feeds = dict(self._read_json(self.feeds_file))
+                feeds[feed_url] = dict(state)
+                self._write_json(self.feeds_file, feeds)
+            return True
+        except Exception as e:
+            print(f"Error saving feed state: {e}")
+            return False
+    
+    def get_tracklist(self, episode_id):
+        """Get the matched tracklist for an episode."""
+        try:
+            return copy.deepcopy(self._read_json(self.tracklists_file).get(episode_id))
+        except Exception as e:
+            print(f"Error loading tracklists: {e}")
+            return None
+    
+    def save_tracklist(self, episode_id, tracklist):
+        """Save the matched tracklist for an episode."""
+        try:
+            with self._locked(self.tracklists_file):
+                tracklists = dict(self._read_json(self.tracklists_file))
+                tracklists[episode_id] = copy.deepcopy(tracklist)
+                self._write_json(self.tracklists_file, tracklists)
+            return True
+        except Exception as e:
+            print(f"Error saving tracklists: {e}")
+            return False
+    
+    def get_ad_segments(self, episode_id):
+        """Get the detected ad skip ranges for an episode."""
+        try:
+            return copy.deepcopy(self._read_json(self.ad_segments_file).get(episode_id, []))
+        except Exception as e:
+            print(f"Error loading ad segments: {e}")
+            return []
+    
+    def save_ad_segments(self, segments_by_episode):
+        """Save detected ad skip ranges, given as a dict of episode ID to ranges."""
+        try:
+            with self._locked(self.ad_segments_file):
+                ad_segments = dict(self._read_json(self.ad_segments_file))
+                ad_segments.update(copy.deepcopy(segments_by_episode))
+                self._write_json(self.ad_segments_file, ad_segments)
+            return True
+        except Exception as e:
+            print(f"Error saving ad segments: {e}")
+            return False
+
+
+def create_database():
+    """Create the database for the storage backend selected in the environment."""
+    backend = os.environ.get('DATABASE_BACKEND', 'json').lower()
+    
+    if backend == 'sqlite':
+        # Imported here because the SQLite backend imports Database for its JSON migration
+        from models.sqlite_database import SQLiteDatabase
+        return SQLiteDatabase(os.environ.get('DATABASE_PATH') or None, data_dir=DEFAULT_DATA_DIR)
+    
+    return Database()
@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from models.download_manager import default_download_dir
+
+# Downloads whose partial files are kept because they can still be resumed
+UNFINISHED_STATUSES = ('pending', 'downloading', 'cancelled', 'failed')
+
+class DownloadCache:
+    """Keeps downloaded episodes within a disk quota by evicting the least recently played non-favorites."""
+    
+    def __init__(self, database, download_dir=None, quota=None, play_write_interval=60, reconcile=True):
+        """Initialize the download cache.
+        
+        quota is in bytes and defaults to DOWNLOAD_CACHE_QUOTA; 0 means unlimited.
+        """
+        self.database = database
+        self.download_dir = download_dir or default_download_dir()
+        os.makedirs(self.download_dir, exist_ok=True)
+        
+        self.quota = quota if quota is not None else int(os.environ.get('DOWNLOAD_CACHE_QUOTA', 0))
+        
+        # Every Range request counts as a play, so play times are written at most this often per episode
+        self.play_write_interval = play_write_interval
+        self._played = {}
+        self._lock = threading.Lock()
+        
+        if reconcile:
+            self.reconcile()
+    
+    def _file_size(self, path):
+        """Bytes a file takes on disk; partial downloads are sparse, so their length overstates it."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return 0
+        return stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+    
+    def _scan(self):
+        """Get the size of every file in the download directory by name."""
+        with os.scandir(self.download_dir) as entries:
+            return {entry.name: self._file_size(entry.path) for entry in entries if entry.is_file()}
+    
+    def _completed(self, downloads=None):
+        """Get the completed downloads that have a local file."""
+        downloads = downloads if downloads is not None else self.database.get_downloads()
+        return {
+            task_id: download for task_id, download in downloads.items()
+            if download.get('status') == 'completed' and download.get('local_path')
+        }
+    
+    def usage(self):
+        """Get disk usage statistics for the download directory."""
+        files = self._scan()
+        completed = self._completed()
+        favorites = set(self.database.get_favorites())
+        
+        used = sum(files.values())
+        episodes = 0
+        pinned = 0
+        
+        for download in completed.values():
+            size = files.get(os.path.basename(download['local_path']), 0)
+            episodes += size
+            if download.get('episodeId') in favorites:
+                pinned += size
+        
+        return {
+            'quota': self.quota,
+            'used': used,
+            'available': max(0, self.quota - used) if self.quota else None,
+            'episodes': len(completed),
+            'episodeBytes': episodes,
+            'pinnedBytes': pinned,
+            'evictableBytes': episodes - pinned,
+            'partialBytes': sum(size for name, size in files.items() if '.part' in name)
+        }
+    
+    def reconcile(self):
+        """Match files on disk with download records: drop records without a file and files without a record."""
+        downloads = self.database.get_downloads()
+        files = self._scan()
+        episode_ids = {episode.get('id') for episode in self.database.get_episodes()}
+        
+        removed_records = []
+        referenced = set()
+        unfinished = set()
+        
+        for task_id, download in downloads.items():
+            status = download.get('status')
+            path = download.get('local_path')
+            
+            if status == 'completed':
+                name = os.path.basename(path) if path else None
+                
+                if name not in files:
+                    self.database.remove_download(task_id)
+                    removed_records.append(task_id)
+                    continue
+                
+                referenced.add(name)
+                if download.get('size') != files[name]:
+                    self.database.update_download(task_id, size=files[name])
+            elif status in UNFINISHED_STATUSES:
+                unfinished.add(download.get('episodeId'))
+        
+        removed_files = []
+        freed = 0
+        
+        for name, size in files.items():
+            if name in referenced:
+                continue
+            
+            episode_id = _episode_for_file(name, episode_ids | unfinished)
+            if episode_id in unfinished:
+                continue
+            
+            # Only touch files this app could have written; anything else in the directory is left alone
+            if episode_id is not None or '.part' in name:
+                try:
+                    os.remove(os.path.join(self.download_dir, name))
+                    removed_files.append(name)
+                    freed += size
+                except OSError as e:
+                    print(f"Error removing {name}: {e}")
+        
+        return {'removedRecords': removed_records, 'removedFiles': removed_files, 'freedBytes': freed}
+    
+    def record_play(self, episode_id):
+        """Mark a downloaded episode as just played, which protects it from eviction the longest."""
+        now = time.monotonic()
+        
+        with self._lock:
+            if now - self._played.get(episode_id, -self.play_write_interval) < self.play_write_interval:
+                return
+            self._played[episode_id] = now
+        
+        played_at = datetime.now().isoformat()
+        for task_id, download in self._completed().items():
+            if download.get('episodeId') == episode_id:
+                self.database.update_download(task_id, lastPlayed=played_at)
+    
+    def record_download(self, task_id, path):
+        """Store the size of a finished download and evict others if it pushed usage over the quota."""
+        self.database.update_download(task_id, size=self._file_size(path), completedAt=datetime.now().isoformat())
+        return self.enforce_quota()
+    
+    def enforce_quota(self, reserve=0):
+        """Evict least recently played non-favorite episodes until usage plus reserve bytes fits the quota."""
+        if not self.quota:
+            return []
+        
+        used = sum(self._scan().values())
+        if used + reserve <= self.quota:
+            return []
+        
+        favorites = set(self.database.get_favorites())
+        candidates = [
+            (task_id, download) for task_id, download in self._completed().items()
+            if download.get('episodeId') not in favorites
+        ]
+        # Never played episodes count from when they finished downloading
+        candidates.sort(key=lambda item: item[1].get('lastPlayed') or item[1].get('completedAt') or
+                        item[1].get('createdAt') or '')
+        
+        evicted = []
+        for task_id, download in candidates:
+            if used + reserve <= self.quota:
+                break
+            
+            size = self._file_size(download['local_path'])
+            try:
+                os.remove(download['local_path'])
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Error evicting {download['local_path']}: {e}")
+                continue
+            
+            self.database.remove_download(task_id)
+            used -= size
+            evicted.append(download.get('episodeId'))
+        
+        if used + reserve > self.quota:
+            print(f"Download cache over quota: {used} bytes used, {reserve} needed, {self.quota} allowed")
+        
+        return evicted
+
+def _episode_for_file(name, episode_ids):
+    """Get the episode a downloaded file name belongs to; IDs can contain dots themselves."""
+    stem = name.lstrip('.')
+    position = stem.find('.')
+    
+    while position != -1:
+        if stem[:position] in episode_ids:
+            return stem[:position]
+        position = stem.find('.', position + 1)
+    
+    return None
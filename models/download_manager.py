@@ -0,0 +1,369 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+# Bytes handed to the disk and the bandwidth limiter at a time
+BLOCK_SIZE = 64 * 1024
+
+# The downloads directory next to data/, which run.sh creates
+DEFAULT_DOWNLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "downloads")
+
+def default_download_dir():
+    """Get the download directory from DOWNLOAD_DIR or the default."""
+    download_dir = os.environ.get('DOWNLOAD_DIR') or DEFAULT_DOWNLOAD_DIR
+    os.makedirs(download_dir, exist_ok=True)
+    return download_dir
+
+class DownloadError(Exception):
+    """A download failed in a way retrying the same request won't fix."""
+
+class DownloadCancelled(Exception):
+    """A download was cancelled; its partial file is kept for resuming."""
+
+class BandwidthLimiter:
+    """Token bucket shared by all downloads to cap their combined bandwidth."""
+    
+    def __init__(self, rate, burst=None):
+        """Initialize the limiter with a rate in bytes per second."""
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def consume(self, amount):
+        """Take amount bytes from the bucket, sleeping until they are paid for."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            # Going into debt keeps callers in arrival order without a queue
+            self.tokens -= amount
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+        
+        if delay:
+            time.sleep(delay)
+
+class DownloadManager:
+    """Downloads episode audio in parallel byte ranges, resuming interrupted downloads from partial files."""
+    
+    def __init__(self, database, download_dir=None, max_downloads=2, max_connections=8, connections_per_download=4,
+                 chunk_size=4 * 1024 * 1024, bandwidth=None, timeout=(3.05, 30), max_retries=3, backoff=1,
+                 progress_interval=1.0, cache=None):
+        """Initialize the download manager.
+        
+        cache is an optional DownloadCache that makes room for new downloads within its quota.
+        """
+        self.database = database
+        self.cache = cache
+        self.download_dir = download_dir or default_download_dir()
+        os.makedirs(self.download_dir, exist_ok=True)
+        
+        self.connections_per_download = connections_per_download
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.progress_interval = progress_interval
+        
+        # Combined limit in bytes per second over all downloads; 0 means unlimited
+        bandwidth = bandwidth if bandwidth is not None else float(os.environ.get('DOWNLOAD_BANDWIDTH_LIMIT', 0))
+        self.limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+        
+        # Episodes downloading at once, and HTTP connections open at once over all of them
+        self._executor = ThreadPoolExecutor(max_workers=max_downloads, thread_name_prefix='download')
+        self._connections = threading.BoundedSemaphore(max_connections)
+        
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_downloads, pool_maxsize=max_connections)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        self._cancelled = set()
+        self._lock = threading.Lock()
+    
+    def episode_path(self, episode):
+        """Local path for an episode's audio file."""
+        extension = os.path.splitext(urlparse(episode['audioUrl']).path)[1] or '.mp3'
+        return os.path.join(self.download_dir, f"{episode['id']}{extension}")
+    
+    def start(self, task_id, episode):
+        """Queue a download for an episode and return its future."""
+        if self.database.get_download(task_id) is None:
+            self.database.add_download(task_id, episode['id'])
+        
+        with self._lock:
+            self._cancelled.discard(task_id)
+        
+        return self._executor.submit(self.download, task_id, episode['audioUrl'], self.episode_path(episode))
+    
+    def resume_pending(self):
+        """Queue every download that was pending or interrupted, e.g. after a restart."""
+        futures = {}
+        
+        for task_id, download in self.database.get_downloads().items():
+            if download.get('status') not in ('pending', 'downloading'):
+                continue
+            
+            episode = self.database.get_episode(download.get('episodeId'))
+            if episode and episode.get('audioUrl'):
+                futures[task_id] = self.start(task_id, episode)
+        
+        return futures
+    
+    def cancel(self, task_id):
+        """Stop a running or queued download, keeping its partial file."""
+        with self._lock:
+            self._cancelled.add(task_id)
+    
+    def shutdown(self, wait=True):
+        """Cancel running downloads and stop the workers; partial files can be resumed later."""
+        with self._lock:
+            for task_id, download in self.database.get_downloads().items():
+                if download.get('status') in ('pending', 'downloading'):
+                    self._cancelled.add(task_id)
+        
+        self._executor.shutdown(wait=wait)
+    
+    def download(self, task_id, url, path):
+        """Download url to path, resuming a previous partial download, and record the outcome."""
+        try:
+            self._check_cancelled(task_id)
+            self.database.update_download_status(task_id, 'downloading')
+            self._download(task_id, url, path)
+            self.database.update_download_status(task_id, 'completed', 100, local_path=path)
+            
+            if self.cache:
+                self.cache.record_download(task_id, path)
+            return True
+        except DownloadCancelled:
+            self.database.update_download_status(task_id, 'cancelled')
+            return False
+        except Exception as e:
+            print(f"Error downloading {url}: {e}")
+            self.database.update_download_status(task_id, 'failed', error=str(e))
+            return False
+    
+    def _check_cancelled(self, task_id):
+        with self._lock:
+            if task_id in self._cancelled:
+                raise DownloadCancelled(task_id)
+    
+    def _download(self, task_id, url, path):
+        part_path = path + '.part'
+        state_path = path + '.part.json'
+        
+        info = self._with_retries(self._probe, url)
+        
+        if self.cache and info['size']:
+            # Make room up front so the quota holds while the file is being written
+            self.cache.enforce_quota(reserve=info['size'])
+        
+        if not (info['ranges'] and info['size']):
+            # Without range support there is nothing to resume or split
+            self._with_retries(self._fetch_whole, task_id, info, part_path)
+        else:
+            state = self._load_state(state_path)
+            
+            # A partial file is only trusted if it belongs to the same version of the same file
+            if (state is None or not os.path.exists(part_path) or state.get('url') != url or
+                    state.get('size') != info['size'] or state.get('validator') != info['validator']):
+                state = {
+                    'url': url,
+                    'size': info['size'],
+                    'validator': info['validator'],
+                    'chunks': [
+                        {'start': start, 'end': min(start + self.chunk_size, info['size']) - 1, 'received': 0}
+                        for start in range(0, info['size'], self.chunk_size)
+                    ]
+                }
+                with open(part_path, 'wb') as f:
+                    f.truncate(info['size'])
+            
+            self._fetch_chunks(task_id, info, part_path, state, state_path)
+            
+            # The partial file is preallocated, so its size alone proves nothing
+            received = sum(chunk['received'] for chunk in state['chunks'])
+            if received != info['size']:
+                raise DownloadError(f"Expected {info['size']} bytes, received {received}")
+        
+        size = os.path.getsize(part_path)
+        if info['size'] is not None and size != info['size']:
+            raise DownloadError(f"Expected {info['size']} bytes, got {size}")
+        
+        os.replace(part_path, path)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+    
+    def _with_retries(self, function, *args):
+        """Call function, retrying connection problems with exponential backoff."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return function(*args)
+            except (requests.RequestException, IOError) as e:
+                if attempt == self.max_retries:
+                    raise
+                print(f"Download interrupted ({e}), retrying")
+                time.sleep(self.backoff * 2 ** attempt)
+    
+    def _probe(self, url):
+        """Find the file size, whether ranges are served and a validator to detect changes."""
+        with self._connections:
+            response = self.session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=self.timeout)
+            with response:
+                self._check_status(response)
+                
+                etag = response.headers.get('ETag')
+                info = {
+                    # Redirects (tracking prefixes, CDNs) are followed once, not for every chunk
+                    'url': response.url,
+                    'ranges': False,
+                    'size': None,
+                    'validator': etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+                }
+                
+                match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                if response.status_code == 206 and match:
+                    info['ranges'] = True
+                    info['size'] = int(match.group(3))
+                elif response.headers.get('Content-Length'):
+                    info['size'] = int(response.headers['Content-Length'])
+                
+                return info
+    
+    def _fetch_whole(self, task_id, info, part_path):
+        """Stream the whole file in one request."""
+        with self._connections:
+            response = self.session.get(info['url'], stream=True, timeout=self.timeout)
+            with response, open(part_path, 'wb') as f:
+                self._check_status(response)
+                
+                received = 0
+                last_report = time.monotonic()
+                
+                for block in response.iter_content(BLOCK_SIZE):
+                    self._check_cancelled(task_id)
+                    if self.limiter:
+                        self.limiter.consume(len(block))
+                    f.write(block)
+                    received += len(block)
+                    
+                    if info['size'] and time.monotonic() - last_report >= self.progress_interval:
+                        last_report = time.monotonic()
+                        self._report(task_id, received, info['size'])
+    
+    def _fetch_chunks(self, task_id, info, part_path, state, state_path):
+        """Fetch the unfinished chunks in parallel into the preallocated partial file."""
+        pending = [chunk for chunk in state['chunks'] if chunk['start'] + chunk['received'] <= chunk['end']]
+        
+        # Set when one chunk fails so the remaining ones aren't started
+        abort = threading.Event()
+        
+        fd = os.open(part_path, os.O_WRONLY)
+        try:
+            with ThreadPoolExecutor(max_workers=self.connections_per_download) as pool:
+                futures = [
+                    pool.submit(self._with_retries, self._fetch_range, task_id, info, fd, chunk, abort)
+                    for chunk in pending
+                ]
+                
+                while True:
+                    done, not_done = wait(futures, timeout=self.progress_interval, return_when=FIRST_EXCEPTION)
+                    errors = [future.exception() for future in done if future.exception()]
+                    if errors:
+                        abort.set()
+                        wait(not_done)
+                    
+                    # Data goes to disk before the state that claims it, so a crash never skips bytes
+                    os.fsync(fd)
+                    self._save_state(state_path, state)
+                    self._report(task_id, sum(chunk['received'] for chunk in state['chunks']), info['size'])
+                    
+                    if errors:
+                        raise errors[0]
+                    if not not_done:
+                        break
+        finally:
+            os.close(fd)
+    
+    def _fetch_range(self, task_id, info, fd, chunk, abort):
+        """Fetch the rest of one chunk and write it at its offset."""
+        start = chunk['start'] + chunk['received']
+        end = chunk['end']
+        if start > end:
+            return
+        
+        # Chunks already running finish after another one fails, so their data is kept for resuming
+        if abort.is_set():
+            raise DownloadCancelled(task_id)
+        
+        headers = {'Range': f"bytes={start}-{end}"}
+        if info['validator']:
+            # The server sends the whole file instead if it changed since the probe
+            headers['If-Range'] = info['validator']
+        
+        with self._connections:
+            response = self.session.get(info['url'], headers=headers, stream=True, timeout=self.timeout)
+            with response:
+                self._check_status(response)
+                
+                match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+                if response.status_code != 206 or not match or int(match.group(1)) != start:
+                    raise DownloadError(f"Server did not return the requested range (HTTP {response.status_code})")
+                
+                for block in response.iter_content(BLOCK_SIZE):
+                    self._check_cancelled(task_id)
+                    block = block[:end - start + 1]
+                    if self.limiter:
+                        self.limiter.consume(len(block))
+                    
+                    os.pwrite(fd, block, start)
+                    start += len(block)
+                    chunk['received'] += len(block)
+                    
+                    if start > end:
+                        break
+        
+        if start <= end:
+            raise IOError(f"Connection closed at byte {start} of chunk ending at {end}")
+    
+    def _check_status(self, response):
+        """Raise for error responses; server errors are retried, client errors are not."""
+        if response.status_code >= 500:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        if response.status_code >= 400:
+            raise DownloadError(f"HTTP {response.status_code}")
+    
+    def _report(self, task_id, received, size):
+        # Stays below 100 until the size has been verified
+        self.database.update_download_status(task_id, 'downloading', min(99, int(received * 100 / size)))
+    
+    def _load_state(self, state_path):
+        try:
+            with open(state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _save_state(self, state_path, state):
+        directory = os.path.dirname(state_path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(state_path)}.")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
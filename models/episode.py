@@ -0,0 +1,81 @@
+import json
+
+# Keys of an episode in episodes.json, in the order they are written
+FIELDS = ('id', 'title', 'date', 'audioUrl', 'image', 'duration')
+FIELD_SET = frozenset(FIELDS)
+
+class Episode:
+    """Compact record of an episode as cached for list and summary reads.
+    
+    The description, by far the largest field, is stored apart from episodes.json in a
+    file of descriptions by episode ID and only read when a full episode is asked for.
+    Keys other than the known ones are kept in extra.
+    """
+    
+    __slots__ = FIELDS + ('extra', 'description')
+    
+    def __init__(self, id=None, title=None, date=None, audioUrl=None, image=None, duration=None,
+                 extra=None, description=None):
+        self.id = id
+        self.title = title
+        self.date = date
+        self.audioUrl = audioUrl
+        self.image = image
+        self.duration = duration
+        self.extra = extra or None
+        # Only set for files written before descriptions were stored apart
+        self.description = description
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Build a record from an episode dict."""
+        extra = dict(data)
+        description = extra.pop('description', None)
+        return cls(*(extra.pop(field, None) for field in FIELDS), extra=extra, description=description)
+    
+    def get(self, key, default=None):
+        """Get a stored field like dict.get; the description is not one of them."""
+        if key in FIELD_SET:
+            return getattr(self, key)
+        if self.extra and key in self.extra:
+            return self.extra[key]
+        return default
+    
+    def __repr__(self):
+        return f"Episode(id={self.id!r}, title={self.title!r}, date={self.date!r})"
+    
+    def stored(self):
+        """Get the dict episodes.json stores for the episode, without its description."""
+        data = {field: getattr(self, field) for field in FIELDS}
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def to_dict(self, description=None):
+        """Get the full episode as a plain dict, the way the API returns it."""
+        data = {field: getattr(self, field) for field in FIELDS}
+        data['description'] = self.description if self.description is not None else description
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+def split_episodes(episodes):
+    """Split episode dicts into records and a dict of their descriptions by episode ID."""
+    records = []
+    descriptions = {}
+    for episode in episodes:
+        record = Episode.from_dict(episode)
+        if record.description is not None:
+            descriptions[record.id] = record.description
+            record.description = None
+        records.append(record)
+    return records, descriptions
+
+def load_episodes(path):
+    """Read episodes.json into records."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    
+    if not isinstance(data, list):
+        raise ValueError("Episodes file does not hold a list")
+    return [Episode.from_dict(episode) for episode in data]
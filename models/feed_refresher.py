@@ -0,0 +1,144 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+class FeedRefresher:
+    """Keeps the stored episode catalog fresh by refreshing the feed in the background."""
+    
+    def __init__(self, parser, feed_url, interval=None, jitter=0.1, retry_delay=60, max_retry_delay=3600):
+        """Initialize the feed refresher."""
+        if parser.database is None:
+            raise ValueError("FeedRefresher needs a PodcastParser with a database")
+        
+        self.parser = parser
+        self.feed_url = feed_url
+        self.interval = interval or float(os.environ.get('FEED_REFRESH_INTERVAL', 3600))
+        self.jitter = jitter
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        
+        self._thread = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        
+        self._refreshing = False
+        self._last_refresh = None
+        self._last_success = None
+        self._last_duration = None
+        self._last_error = None
+        self._failures = 0
+        self._next_refresh = None
+    
+    def start(self, refresh_now=True):
+        """Start refreshing in a background thread."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            
+            self._stop.clear()
+            if refresh_now:
+                self._wake.set()
+            
+            self._thread = threading.Thread(target=self._run, name='feed-refresher', daemon=True)
+            self._thread.start()
+    
+    def stop(self, timeout=None):
+        """Stop the background thread."""
+        self._stop.set()
+        self._wake.set()
+        
+        if self._thread:
+            self._thread.join(timeout)
+    
+    def request_refresh(self):
+        """Ask for a refresh soon without waiting for it; the stored catalog stays available meanwhile."""
+        self._wake.set()
+    
+    def is_stale(self, max_age=None):
+        """Check whether the last successful refresh is older than max_age seconds."""
+        max_age = self.interval if max_age is None else max_age
+        
+        with self._lock:
+            return self._last_success is None or time.time() - self._last_success > max_age
+    
+    def refresh(self):
+        """Refresh the feed now in the calling thread."""
+        with self._lock:
+            if self._refreshing:
+                return False
+            self._refreshing = True
+        
+        start = time.perf_counter()
+        error = None
+        
+        try:
+            self.parser.refresh_feed(self.feed_url, raise_errors=True)
+        except Exception as e:
+            error = str(e)
+            print(f"Error refreshing feed: {e}")
+        
+        with self._lock:
+            self._refreshing = False
+            self._last_refresh = time.time()
+            self._last_duration = time.perf_counter() - start
+            self._last_error = error
+            
+            if error:
+                self._failures += 1
+            else:
+                self._failures = 0
+                self._last_success = self._last_refresh
+        
+        return error is None
+    
+    def _next_delay(self):
+        """Seconds until the next refresh: the interval, or exponential backoff after failures."""
+        with self._lock:
+            failures = self._failures
+        
+        if failures:
+            delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+        else:
+            delay = self.interval
+        
+        # Spread refreshes out so several workers don't hit the feed at the same moment
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+    
+    def _run(self):
+        """Background loop."""
+        while not self._stop.is_set():
+            if self._wake.is_set():
+                self._wake.clear()
+                self.refresh()
+            
+            delay = self._next_delay()
+            
+            with self._lock:
+                self._next_refresh = time.time() + delay
+            
+            # Sleep until the next refresh is due or someone asks for one
+            if self._wake.wait(delay):
+                continue
+            
+            self._wake.set()
+    
+    def status(self):
+        """Get the refresher status for the status endpoint."""
+        def isoformat(timestamp):
+            return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+        
+        with self._lock:
+            return {
+                'feedUrl': self.feed_url,
+                'running': bool(self._thread and self._thread.is_alive()),
+                'refreshing': self._refreshing,
+                'lastRefresh': isoformat(self._last_refresh),
+                'lastSuccess': isoformat(self._last_success),
+                'lastDuration': round(self._last_duration, 3) if self._last_duration is not None else None,
+                'lastError': self._last_error,
+                'consecutiveFailures': self._failures,
+                'nextRefresh': isoformat(self._next_refresh)
+            }
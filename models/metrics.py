@@ -0,0 +1,272 @@
+import cProfile
+import functools
+import io
+import itertools
+import os
+import pstats
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets, from a cached file read up to a slow feed
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+class _NullTimer:
+    """Stand-in timer used while metrics are disabled."""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return False
+    
+    def set(self, **labels):
+        pass
+
+NULL_TIMER = _NullTimer()
+
+class _Timer:
+    """Times a block and records it in a histogram on exit."""
+    
+    __slots__ = ('histogram', 'labels', 'start')
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+        return False
+    
+    def set(self, **labels):
+        """Set labels only known inside the block, such as a response status."""
+        self.labels.update(labels)
+
+class Histogram:
+    """Call counts and latency distribution per combination of label values."""
+    
+    def __init__(self, registry, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        
+        # Label values -> [count per bucket..., count above the last bucket, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, seconds, **labels):
+        """Record one call taking seconds."""
+        key = tuple(str(labels.get(name, '')) for name in self.label_names)
+        bucket = bisect_left(self.buckets, seconds)
+        
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[bucket] += 1
+            series[-1] += seconds
+    
+    def time(self, **labels):
+        """Context manager timing a block; nearly free while metrics are disabled."""
+        if not self.registry.enabled:
+            return NULL_TIMER
+        return _Timer(self, labels)
+    
+    def timed(self, **labels):
+        """Decorator timing every call of a function."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.registry.enabled:
+                    return func(*args, **kwargs)
+                
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - start, **labels)
+            return wrapper
+        return decorator
+    
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+    
+    def render(self):
+        """Render the histogram in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        
+        for key, values in sorted(series.items()):
+            labels = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, key))
+            separator = ',' if labels else ''
+            
+            # Buckets are cumulative: each counts every call at or below its bound
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}{separator}le="{bound}"}} {cumulative}')
+            
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {values[-1]:.6f}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        
+        return '\n'.join(lines)
+
+class MetricsRegistry:
+    """Collection of histograms exported together."""
+    
+    def __init__(self, enabled=None):
+        """Initialize the registry; enabled defaults to the METRICS_ENABLED environment variable."""
+        if enabled is None:
+            enabled = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+    
+    def histogram(self, name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+        """Get the histogram with a name, creating it the first time."""
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(self, name, documentation, label_names, buckets)
+            return self._metrics[name]
+    
+    def clear(self):
+        """Drop everything recorded so far."""
+        for metric in list(self._metrics.values()):
+            metric.clear()
+    
+    def render(self):
+        """Render every metric in the Prometheus text format, for a /metrics endpoint."""
+        return '\n'.join(metric.render() for metric in list(self._metrics.values())) + '\n'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+REGISTRY = MetricsRegistry()
+
+def histogram(name, documentation, label_names=(), buckets=LATENCY_BUCKETS):
+    """Get a histogram from the default registry."""
+    return REGISTRY.histogram(name, documentation, label_names, buckets)
+
+class RequestProfiler:
+    """Runs cProfile around single requests, when asked for or for a random sample of them."""
+    
+    def __init__(self, sample_rate=None, output_dir=None, sort='cumulative', limit=40, allow_forced=None):
+        """Initialize the profiler.
+        
+        sample_rate is the fraction of requests profiled without being asked for and
+        defaults to PROFILE_SAMPLE_RATE. Profiles are written to output_dir as .prof files
+        when it is set, defaulting to PROFILE_DIR. allow_forced lets clients ask for a
+        profile report and defaults to the PROFILE_REQUESTS environment variable; pass
+        app.debug to allow it in debug mode only.
+        """
+        if sample_rate is None:
+            sample_rate = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+        if allow_forced is None:
+            allow_forced = os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes')
+        self.sample_rate = sample_rate
+        self.allow_forced = allow_forced
+        self.output_dir = output_dir or os.environ.get('PROFILE_DIR') or None
+        self.sort = sort
+        self.limit = limit
+        
+        # Only one profiler can be active per interpreter; concurrent requests go unprofiled
+        self._lock = threading.Lock()
+        self._sequence = itertools.count(1)
+    
+    @contextmanager
+    def profile(self, name='request', force=False):
+        """Profile the block if forced or sampled, yielding the cProfile.Profile or None."""
+        sampled = force or (self.sample_rate and random.random() < self.sample_rate)
+        if not sampled or not self._lock.acquire(blocking=False):
+            yield None
+            return
+        
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                yield profiler
+            finally:
+                profiler.disable()
+        finally:
+            self._lock.release()
+        
+        if self.output_dir:
+            self.dump(profiler, name)
+    
+    def dump(self, profiler, name):
+        """Write a profile to the output directory for snakeviz or pstats."""
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            safe_name = ''.join(char if char.isalnum() else '_' for char in name).strip('_') or 'request'
+            filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{next(self._sequence)}-{safe_name}.prof"
+            path = os.path.join(self.output_dir, filename)
+            profiler.dump_stats(path)
+            return path
+        except OSError as e:
+            print(f"Error writing profile: {e}")
+            return None
+    
+    def report(self, profiler):
+        """Get the top functions of a profile as text."""
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats(self.sort).print_stats(self.limit)
+        return output.getvalue()
+    
+    def wrap(self, app, parameter='profile'):
+        """Wrap a WSGI app so requests with ?profile=1 (or sampled ones) are profiled.
+        
+        Forced requests get the profile report as a plain text response instead of their
+        normal body; sampled ones are written to the output directory. Without allow_forced
+        the parameter is ignored, since the report exposes code paths and timings.
+        """
+        def middleware(environ, start_response):
+            force = self.allow_forced and f"{parameter}=1" in environ.get('QUERY_STRING', '').split('&')
+            name = f"{environ.get('REQUEST_METHOD', '')} {environ.get('PATH_INFO', '')}"
+            
+            with self.profile(name, force=force) as profiler:
+                body = []
+                captured = {}
+                
+                def capture(status, headers, exc_info=None):
+                    captured['status'] = status
+                    captured['headers'] = headers
+                    return body.append
+                
+                result = app(environ, capture if force else start_response)
+                if not force:
+                    return result
+                
+                # Consume the response inside the profile; streamed bodies do their work here
+                try:
+                    for chunk in result:
+                        body.append(chunk)
+                finally:
+                    if hasattr(result, 'close'):
+                        result.close()
+            
+            if profiler is None:
+                start_response(captured['status'], captured['headers'])
+                return body
+            
+            report = self.report(profiler).encode('utf-8')
+            start_response('200 OK', [('Content-Type', 'text/plain; charset=utf-8'),
+                                      ('Content-Length', str(len(report)))])
+            return [report]
+        
+        return middleware
@@ -2,38 +2,287 @@ import feedparser
 import re
 import time
 import requests
-from datetime import datetime
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from html import unescape
+
+from models import metrics
+
+# XML namespaces used by podcast RSS feeds
+ITUNES_NS = '{http://www.itunes.com/dtds/podcast-1.0.dtd}'
+CONTENT_NS = '{http://purl.org/rss/1.0/modules/content/}'
+MEDIA_NS = '{http://search.yahoo.com/mrss/}'
+
+ID_RE = re.compile(r'([^\/]+)$')
+SRC_RE = re.compile(r'src=[\'"]([^\'"]+)[\'"]')
+SCRIPT_RE = re.compile(r'<(script|style)\b.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+LINE_BREAK_TAG_RE = re.compile(r'<br\b[^>]*>|</(?:p|div|li|tr|h[1-6]|blockquote)\s*>', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]*>')
+SPACES_RE = re.compile(r'  +')
+LINE_BREAKS_RE = re.compile(r'\n\s+')
+AUDIO_EXTENSIONS = {'mp3'}
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif'}
+
+FEED_SECONDS = metrics.histogram('sublimemix_feed_parse_seconds', 'Whole PodcastParser.parse_feed calls.')
+FEED_PHASE_SECONDS = metrics.histogram(
+    'sublimemix_feed_phase_seconds',
+    'Feed parsing phases: fetch (download and XML parsing by feedparser), entries and save.',
+    ('phase',)
+)
 
 class PodcastParser:
     """Parser for podcast feeds."""
     
-    def __init__(self):
+    def __init__(self, database=None):
         """Initialize the podcast parser."""
-        pass
+        # With a database the parser refreshes the stored catalog incrementally
+        self.database = database
     
+    @FEED_SECONDS.timed()
     def parse_feed(self, feed_url):
         """Parse a podcast feed and return episodes."""
+        if self.database is not None:
+            return self.refresh_feed(feed_url)
+        
         try:
-            # Parse feed
+            return self._fetch_episodes(feed_url)
+        
+        except Exception as e:
+            print(f"Error parsing feed: {e}")
+            return []
+    
+    def _fetch_episodes(self, feed_url):
+        """Fetch and parse a feed, raising on failure."""
+        # Parse feed
+        with FEED_PHASE_SECONDS.time(phase='fetch'):
             feed = feedparser.parse(feed_url)
+        
+        if not feed or not feed.entries:
+            raise Exception("Failed to parse feed or no entries found")
+        
+        episodes = []
+        
+        with FEED_PHASE_SECONDS.time(phase='entries'):
+            for i, entry in enumerate(feed.entries):
+                # Extract episode data
+                episode = self._parse_entry(entry, i)
+                
+                if episode:
+                    episodes.append(episode)
+        
+        return episodes
+    
+    def parse_feeds(self, feed_urls, max_workers=8):
+        """Parse several feeds concurrently and merge them into one date-sorted catalog."""
+        feed_urls = list(dict.fromkeys(feed_urls))
+        
+        def fetch(feed_url):
+            start = time.perf_counter()
+            try:
+                return self._fetch_episodes(feed_url), None, time.perf_counter() - start
+            except Exception as e:
+                return [], str(e), time.perf_counter() - start
+        
+        if not feed_urls:
+            return {'episodes': [], 'feeds': {}}
+        
+        # Fetching is network bound, so threads overlap the waiting
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(feed_urls))) as executor:
+            results = list(executor.map(fetch, feed_urls))
+        
+        episodes = []
+        feeds = {}
+        seen_ids = set()
+        seen_audio_urls = set()
+        
+        # Merge in the order the feeds were given, so earlier feeds win on duplicates
+        for feed_url, (feed_episodes, error, duration) in zip(feed_urls, results):
+            duplicates = 0
+            
+            for episode in feed_episodes:
+                episode_id = episode.get('id')
+                audio_url = episode.get('audioUrl')
+                
+                if episode_id in seen_ids or (audio_url and audio_url in seen_audio_urls):
+                    duplicates += 1
+                    continue
+                
+                seen_ids.add(episode_id)
+                if audio_url:
+                    seen_audio_urls.add(audio_url)
+                episodes.append(episode)
+            
+            if error:
+                print(f"Error parsing feed {feed_url}: {error}")
+            
+            feeds[feed_url] = {
+                'episodes': len(feed_episodes),
+                'duplicates': duplicates,
+                'duration': round(duration, 3),
+                'error': error
+            }
+        
+        episodes.sort(key=lambda episode: episode.get('date') or '', reverse=True)
+        
+        return {
+            'episodes': episodes,
+            'feeds': feeds
+        }
+    
+    def refresh_feed(self, feed_url, raise_errors=False):
+        """Fetch a feed only if it changed and merge new episodes into the stored catalog."""
+        stored = self.database.get_episodes()
+        
+        try:
+            # Send the validators from the last fetch so an unchanged feed costs a 304
+            state = self.database.get_feed_state(feed_url)
+            with FEED_PHASE_SECONDS.time(phase='fetch'):
+                feed = feedparser.parse(feed_url, etag=state.get('etag'), modified=state.get('modified'))
+            
+            if feed.get('status') == 304:
+                return stored
             
             if not feed or not feed.entries:
                 raise Exception("Failed to parse feed or no entries found")
             
+            known = {episode.get('id'): episode for episode in stored}
             episodes = []
+            new_count = 0
             
-            for i, entry in enumerate(feed.entries):
-                # Extract episode data
-                episode = self._parse_entry(entry, i)
+            with FEED_PHASE_SECONDS.time(phase='entries'):
+                for i, entry in enumerate(feed.entries):
+                    # Only entries with an unseen guid go through the full parse
+                    episode_id = self._extract_id(entry)
+                    
+                    if episode_id and episode_id in known:
+                        episodes.append(known.pop(episode_id))
+                        continue
+                    
+                    episode = self._parse_entry(entry, i)
+                    
+                    if episode:
+                        known.pop(episode['id'], None)
+                        episodes.append(episode)
+                        new_count += 1
+            
+            # Keep older episodes that have dropped out of the feed
+            episodes.extend(episode for episode in stored if episode.get('id') in known)
+            
+            with FEED_PHASE_SECONDS.time(phase='save'):
+                # The validators may only be kept once the episodes are stored; otherwise the next
+                # poll gets a 304 and the new episodes are lost until the feed changes again
+                if (new_count or len(episodes) != len(stored)) and not self.database.save_episodes(episodes):
+                    raise Exception("Failed to save episodes")
                 
-                if episode:
-                    episodes.append(episode)
+                self.database.save_feed_state(feed_url, {
+                    'etag': feed.get('etag'),
+                    'modified': feed.get('modified')
+                })
             
             return episodes
         
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error parsing feed: {e}")
-            return []
+            return stored
+    
+    def iter_feed(self, feed_url, stop_at_ids=None):
+        """Yield episodes one by one while the feed is still being downloaded."""
+        stop_at_ids = set(stop_at_ids or ())
+        response = None
+        
+        try:
+            if feed_url.startswith(('http://', 'https://')):
+                response = requests.get(feed_url, stream=True, timeout=30)
+                response.raise_for_status()
+                # Let urllib3 undo gzip/deflate so iterparse sees plain XML
+                response.raw.decode_content = True
+                source = response.raw
+            else:
+                source = open(feed_url, 'rb')
+            
+            with source:
+                channel = None
+                index = 0
+                
+                for event, elem in ET.iterparse(source, events=('start', 'end')):
+                    if event == 'start':
+                        if elem.tag == 'channel':
+                            channel = elem
+                        continue
+                    
+                    if elem.tag != 'item':
+                        continue
+                    
+                    entry = self._element_to_entry(elem)
+                    
+                    # Drop the parsed item so memory stays flat however long the feed is
+                    if channel is not None:
+                        channel.remove(elem)
+                    else:
+                        elem.clear()
+                    
+                    # Newest items come first, so a known guid means the rest is known too
+                    if stop_at_ids and self._extract_id(entry) in stop_at_ids:
+                        return
+                    
+                    episode = self._parse_entry(entry, index)
+                    index += 1
+                    
+                    if episode:
+                        yield episode
+        
+        except Exception as e:
+            print(f"Error streaming feed: {e}")
+        
+        finally:
+            if response is not None:
+                response.close()
+    
+    def _element_to_entry(self, item):
+        """Convert an RSS <item> element into a feedparser-style entry."""
+        entry = feedparser.FeedParserDict()
+        
+        for child in item:
+            tag = child.tag
+            text = (child.text or '').strip()
+            
+            if tag == 'guid':
+                entry['id'] = text
+            elif tag == 'title':
+                entry['title'] = text
+            elif tag == 'link':
+                entry.setdefault('links', []).append(feedparser.FeedParserDict(href=text, rel='alternate', type='text/html'))
+            elif tag == 'pubDate':
+                entry['published'] = text
+                try:
+                    published = parsedate_to_datetime(text)
+                    if published.tzinfo:
+                        published = published.astimezone(timezone.utc)
+                    entry['published_parsed'] = published.timetuple()
+                except (TypeError, ValueError):
+                    pass
+            elif tag == 'description':
+                entry['summary'] = child.text or ''
+            elif tag == CONTENT_NS + 'encoded':
+                entry['content'] = [feedparser.FeedParserDict(value=child.text or '')]
+            elif tag == 'enclosure':
+                entry.setdefault('enclosures', []).append(feedparser.FeedParserDict(
+                    url=child.get('url'),
+                    type=child.get('type', ''),
+                    length=child.get('length')
+                ))
+            elif tag == ITUNES_NS + 'duration':
+                entry['itunes_duration'] = text
+            elif tag == MEDIA_NS + 'content':
+                entry.setdefault('media_content', []).append(feedparser.FeedParserDict(child.attrib))
+            elif tag == MEDIA_NS + 'thumbnail':
+                entry.setdefault('media_thumbnail', []).append(feedparser.FeedParserDict(child.attrib))
+        
+        return entry
     
     def _parse_entry(self, entry, index):
         """Parse a feed entry and return episode data."""
@@ -50,17 +299,20 @@ class PodcastParser:
             # Extract date
             date = self._extract_date(entry)
             
+            # Scan the description HTML once for everything the extractors below need
+            html_info = self._scan_entry_html(entry)
+            
             # Extract audio URL
-            audio_url = self._extract_audio_url(entry)
+            audio_url = self._extract_audio_url(entry, html_info)
             
             # Extract image URL
-            image_url = self._extract_image_url(entry)
+            image_url = self._extract_image_url(entry, html_info)
             
             # Extract duration
             duration = self._extract_duration(entry)
             
             # Extract description
-            description = self._extract_description(entry)
+            description = self._extract_description(entry, html_info)
             
             return {
                 'id': episode_id,
@@ -83,7 +335,7 @@ class PodcastParser:
             guid = entry.id
             
             # Extract ID from URL if possible
-            match = re.search(r'([^\/]+)$', guid)
+            match = ID_RE.search(guid)
             if match:
                 return match.group(1)
             
@@ -103,7 +355,7 @@ class PodcastParser:
         
         return datetime.now().isoformat()
     
-    def _extract_audio_url(self, entry):
+    def _extract_audio_url(self, entry, html_info=None):
         """Extract audio URL from entry."""
         # Check for enclosures
         if hasattr(entry, 'enclosures') and entry.enclosures:
@@ -127,25 +379,13 @@ class PodcastParser:
                 if link.get('type', '').startswith('audio/') and 'href' in link:
                     return link['href']
         
-        # Check for content
-        if hasattr(entry, 'content') and entry.content:
-            for content in entry.content:
-                if 'value' in content:
-                    # Try to extract audio URL from HTML
-                    match = re.search(r'src=[\'"]([^\'"]+\.mp3)[\'"]', content['value'])
-                    if match:
-                        return match.group(1)
-        
-        # Check for summary
-        if hasattr(entry, 'summary'):
-            # Try to extract audio URL from HTML
-            match = re.search(r'src=[\'"]([^\'"]+\.mp3)[\'"]', entry.summary)
-            if match:
-                return match.group(1)
+        # Check for an audio URL in the content or summary HTML
+        if html_info is None:
+            html_info = self._scan_entry_html(entry)
         
-        return None
+        return html_info['audio']
     
-    def _extract_image_url(self, entry):
+    def _extract_image_url(self, entry, html_info=None):
         """Extract image URL from entry."""
         # Check for image in media content
         if hasattr(entry, 'media_content') and entry.media_content:
@@ -165,21 +405,12 @@ class PodcastParser:
                 if link.get('type', '').startswith('image/') and 'href' in link:
                     return link['href']
         
-        # Check for image in content
-        if hasattr(entry, 'content') and entry.content:
-            for content in entry.content:
-                if 'value' in content:
-                    # Try to extract image URL from HTML
-                    match = re.search(r'src=[\'"]([^\'"]+\.(jpg|jpeg|png|gif))[\'"]', content['value'])
-                    if match:
-                        return match.group(1)
+        # Check for an image URL in the content or summary HTML
+        if html_info is None:
+            html_info = self._scan_entry_html(entry)
         
-        # Check for image in summary
-        if hasattr(entry, 'summary'):
-            # Try to extract image URL from HTML
-            match = re.search(r'src=[\'"]([^\'"]+\.(jpg|jpeg|png|gif))[\'"]', entry.summary)
-            if match:
-                return match.group(1)
+        if html_info['image']:
+            return html_info['image']
         
         # Check for image in feed
         if hasattr(entry, 'feed') and hasattr(entry.feed, 'image') and hasattr(entry.feed.image, 'href'):
@@ -187,6 +418,73 @@ class PodcastParser:
         
         return None
     
+    def _scan_entry_html(self, entry):
+        """Scan an entry's HTML once for audio and image URLs and a plain-text description."""
+        sources = []
+        
+        if hasattr(entry, 'content') and entry.content:
+            for content in entry.content:
+                if 'value' in content:
+                    sources.append(content['value'])
+        
+        if hasattr(entry, 'summary'):
+            sources.append(entry.summary)
+        
+        audio_url = None
+        image_url = None
+        scanned = set()
+        
+        # feedparser often fills content and summary with the same HTML; scan it only once
+        for html in sources:
+            if not html or html in scanned:
+                continue
+            scanned.add(html)
+            
+            for match in SRC_RE.finditer(html):
+                url = match.group(1)
+                extension = url.rsplit('.', 1)[-1].lower()
+                
+                if audio_url is None and extension in AUDIO_EXTENSIONS:
+                    audio_url = url
+                elif image_url is None and extension in IMAGE_EXTENSIONS:
+                    image_url = url
+                
+                if audio_url and image_url:
+                    break
+            
+            if audio_url and image_url:
+                break
+        
+        return {
+            'audio': audio_url,
+            'image': image_url,
+            'text': self._html_to_text(self._extract_description_html(entry))
+        }
+    
+    def _html_to_text(self, html):
+        """Convert description HTML into plain text, one block per line."""
+        if not html:
+            return html
+        
+        # Every step is a single regex or str pass with no per-line Python loops; the
+        # whitespace patterns start with a literal so the regex engine can skip ahead
+        if '<script' in html or '<style' in html or '<SCRIPT' in html or '<STYLE' in html:
+            html = SCRIPT_RE.sub('', html)
+        
+        text = TAG_RE.sub('', LINE_BREAK_TAG_RE.sub('\n', html))
+        
+        if '&' in text:
+            # Cheap replacements when only the common entities occur; mixing them with a full
+            # unescape afterwards would decode '&amp;lt;' twice
+            if '&' in text.replace('&amp;', '').replace('&nbsp;', ''):
+                text = unescape(text)
+            else:
+                text = text.replace('&amp;', '&').replace('&nbsp;', ' ')
+        
+        text = text.replace('\t', ' ').replace('\r', ' ').replace('\xa0', ' ')
+        text = SPACES_RE.sub(' ', text).replace(' \n', '\n')
+        return LINE_BREAKS_RE.sub('\n', text).strip()
+    
     def _extract_duration(self, entry):
         """Extract episode duration from entry."""
         # Check for itunes duration
@@ -202,8 +500,15 @@ class PodcastParser:
         
         return None
     
-    def _extract_description(self, entry):
-        """Extract episode description from entry."""
+    def _extract_description(self, entry, html_info=None):
+        """Extract episode description from entry as plain text."""
+        if html_info is None:
+            return self._html_to_text(self._extract_description_html(entry))
+        
+        return html_info['text']
+    
+    def _extract_description_html(self, entry):
+        """Extract the raw episode description HTML from entry."""
         # Check for summary
         if hasattr(entry, 'summary'):
             return entry.summary
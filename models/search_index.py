@@ -0,0 +1,397 @@
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+from bisect import bisect_left
+from itertools import accumulate, islice
+from operator import sub
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Title words count three times, favorite song artists/titles twice, description words once
+TITLE_WEIGHT = 3
+SONG_WEIGHT = 2
+
+# Words that only start with a prefix query score half of an exact match
+PREFIX_WEIGHT = 0.5
+MAX_PREFIX_EXPANSIONS = 200
+
+# Score boost per pair of query words found next to each other in the right order
+PROXIMITY_BONUS = 0.5
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+INDEX_VERSION = 1
+
+def tokenize(text):
+    """Split text into lowercase words without accents, so 'Tiësto' matches 'tiesto'."""
+    text = text.lower()
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+    return TOKEN_RE.findall(text)
+
+def episode_fields(episode, songs):
+    """Get the searchable title, description and favorite song text of an episode."""
+    # Descriptions are stored as plain text, already unescaped
+    return (
+        episode.get('title') or '',
+        episode.get('description') or '',
+        ' '.join(f"{song.get('artist') or ''} {song.get('title') or ''}" for song in songs)
+    )
+
+class SearchIndex:
+    """Inverted index with word positions over episodes and their favorite songs."""
+    
+    def __init__(self, path=None, save_interval=60):
+        """Initialize the index, loading it from path if it has been saved before."""
+        self.path = path
+        self.save_interval = save_interval
+        
+        # Document number -> (episode ID, signature, title end, description end, length)
+        self._docs = {}
+        self._doc_numbers = {}
+        self._next_doc = 0
+        self._total_length = 0
+        
+        # Word -> [document numbers, position counts, position deltas], the deltas restarting
+        # per document. New documents always get the highest number, so indexing one only
+        # appends and the postings never have to be decoded
+        self._postings = {}
+        
+        # Query time caches: field weighted word counts per document for words searched
+        # before, per document arrays of field ends and BM25 length norms and the sorted
+        # words for prefix lookups. Updates drop what they invalidate
+        self._frequencies = {}
+        self._doc_arrays = None
+        self._vocabulary = None
+        
+        # Replaced documents whose postings are still in the index; skipped at query time
+        self._stale = 0
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._lock = threading.RLock()
+        
+        if path:
+            self.load()
+    
+    def __len__(self):
+        return len(self._docs)
+    
+    def load(self):
+        """Load the saved index; a missing or outdated file leaves the index empty."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            print(f"Error loading search index: {e}")
+            return False
+        
+        if data.get('version') != INDEX_VERSION:
+            return False
+        
+        with self._lock:
+            self._docs = {doc[0]: tuple(doc[1:]) for doc in data['docs']}
+            self._doc_numbers = {info[0]: doc for doc, info in self._docs.items()}
+            self._total_length = sum(info[4] for info in self._docs.values())
+            self._postings = data['postings']
+            
+            # Removed documents can still have postings, so their numbers must not be handed
+            # out again; files saved without next_doc get it from the highest number posted
+            self._next_doc = data.get('next_doc')
+            if self._next_doc is None:
+                posted = [docs[-1] for docs, _, _ in self._postings.values()]
+                self._next_doc = max(*self._docs, *posted, -1) + 1
+            
+            self._frequencies = {}
+            self._doc_arrays = None
+            self._vocabulary = None
+            self._stale = data.get('stale', 0)
+            self._dirty = False
+        return True
+    
+    def save(self):
+        """Write the index to disk if it changed."""
+        if not self.path:
+            return False
+        
+        with self._lock:
+            if not self._dirty:
+                return True
+            
+            # Drop replaced documents once they make up a good part of the postings
+            if self._stale > len(self._docs) // 4:
+                self._compact()
+            
+            # Serialized under the lock, as updates append to the posting lists in place
+            content = json.dumps({
+                'version': INDEX_VERSION,
+                'stale': self._stale,
+                'next_doc': self._next_doc,
+                'docs': [[doc, *info] for doc, info in self._docs.items()],
+                'postings': self._postings
+            }, separators=(',', ':'))
+            self._dirty = False
+            self._last_save = time.monotonic()
+        
+        directory = os.path.dirname(self.path) or '.'
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(self.path)}.")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                # dumps takes the C encoder; dump to a file goes through the pure Python one
+                f.write(content)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            print(f"Error saving search index: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+    
+    def save_if_due(self):
+        """Save the index if it changed and the last save is older than the save interval."""
+        if self._dirty and time.monotonic() - self._last_save >= self.save_interval:
+            return self.save()
+        return True
+    
+    def _positions(self, word, doc):
+        """Get the positions of a word in a document."""
+        docs, counts, deltas = self._postings[word]
+        i = bisect_left(docs, doc)
+        start = sum(islice(counts, i))
+        return list(accumulate(deltas[start:start + counts[i]]))
+    
+    def _get_doc_arrays(self):
+        """Get the title end, description end and BM25 length norm per document number.
+        
+        Removed documents get an infinite norm, so they score zero.
+        """
+        if self._doc_arrays is None:
+            title_ends = np.zeros(self._next_doc, dtype=np.int64)
+            description_ends = np.zeros(self._next_doc, dtype=np.int64)
+            norms = np.full(self._next_doc, np.inf)
+            
+            average_length = self._total_length / len(self._docs) or 1
+            for doc, info in self._docs.items():
+                title_ends[doc] = info[2]
+                description_ends[doc] = info[3]
+                norms[doc] = BM25_K1 * (1 - BM25_B + BM25_B * info[4] / average_length)
+            
+            self._doc_arrays = (title_ends, description_ends, norms)
+        return self._doc_arrays
+    
+    def _get_frequencies(self, word):
+        """Get the documents a word occurs in and how often, counting title and song words extra."""
+        cached = self._frequencies.get(word)
+        if cached is not None:
+            return cached
+        
+        postings = self._postings[word]
+        docs = np.array(postings[0], dtype=np.int64)
+        counts = np.array(postings[1], dtype=np.int64)
+        deltas = np.array(postings[2], dtype=np.int64)
+        starts = np.cumsum(counts) - counts
+        # Deltas restart per document; take off what the previous documents added up to
+        positions = np.cumsum(deltas)
+        positions -= np.repeat(positions[starts] - deltas[starts], counts)
+        
+        title_ends, description_ends, _ = self._get_doc_arrays()
+        doc_numbers = np.repeat(docs, counts)
+        weights = (1 + (TITLE_WEIGHT - 1) * (positions < title_ends[doc_numbers]) +
+                   (SONG_WEIGHT - 1) * (positions >= description_ends[doc_numbers]))
+        
+        cached = (docs, np.add.reduceat(weights, starts).astype(np.float64))
+        self._frequencies[word] = cached
+        return cached
+    
+    def _compact(self):
+        """Remove the postings of replaced documents."""
+        for word, (docs, counts, deltas) in list(self._postings.items()):
+            kept = [[], [], []]
+            start = 0
+            for doc, count in zip(docs, counts):
+                if doc in self._docs:
+                    kept[0].append(doc)
+                    kept[1].append(count)
+                    kept[2].extend(deltas[start:start + count])
+                start += count
+            
+            if kept[0]:
+                self._postings[word] = kept
+            else:
+                del self._postings[word]
+        
+        self._frequencies = {}
+        
+        self._stale = 0
+        self._vocabulary = None
+    
+    def sync(self, episodes, songs):
+        """Bring the index in line with episodes and favorite songs, reindexing only what changed."""
+        songs_by_episode = {}
+        for song in songs:
+            songs_by_episode.setdefault(song.get('episodeId'), []).append(song)
+        
+        changed = 0
+        with self._lock:
+            seen = set()
+            for episode in episodes:
+                episode_id = episode.get('id')
+                if episode_id is None:
+                    continue
+                
+                seen.add(episode_id)
+                if self.index_episode(episode, songs_by_episode.get(episode_id, ())):
+                    changed += 1
+            
+            for episode_id in [episode_id for episode_id in self._doc_numbers if episode_id not in seen]:
+                self.remove_episode(episode_id)
+                changed += 1
+        
+        return changed
+    
+    def index_episode(self, episode, songs=()):
+        """Index an episode with its favorite songs unless it is already indexed as is."""
+        fields = episode_fields(episode, songs)
+        signature = zlib.crc32('\0'.join(fields).encode('utf-8'))
+        
+        with self._lock:
+            doc = self._doc_numbers.get(episode['id'])
+            if doc is not None and self._docs[doc][1] == signature:
+                return False
+            
+            self.remove_episode(episode['id'])
+            
+            positions = {}
+            position = 0
+            ends = []
+            for text in fields:
+                for word in tokenize(text):
+                    positions.setdefault(word, []).append(position)
+                    position += 1
+                ends.append(position)
+            
+            doc = self._next_doc
+            self._next_doc += 1
+            
+            for word, word_positions in positions.items():
+                postings = self._postings.get(word)
+                if postings is None:
+                    postings = self._postings[word] = [[], [], []]
+                    self._vocabulary = None
+                postings[0].append(doc)
+                postings[1].append(len(word_positions))
+                postings[2].append(word_positions[0])
+                postings[2].extend(map(sub, islice(word_positions, 1, None), word_positions))
+                self._frequencies.pop(word, None)
+            
+            self._docs[doc] = (episode['id'], signature, ends[0], ends[1], position)
+            self._doc_numbers[episode['id']] = doc
+            self._total_length += position
+            self._doc_arrays = None
+            self._dirty = True
+            return True
+    
+    def remove_episode(self, episode_id):
+        """Remove an episode from search results."""
+        with self._lock:
+            doc = self._doc_numbers.pop(episode_id, None)
+            if doc is None:
+                return False
+            
+            self._total_length -= self._docs.pop(doc)[4]
+            self._doc_arrays = None
+            self._stale += 1
+            self._dirty = True
+            return True
+    
+    def _expand(self, word, prefix):
+        """Get the indexed words a query word matches, with their weights."""
+        matches = [(word, 1.0)] if word in self._postings else []
+        
+        if prefix:
+            if self._vocabulary is None:
+                self._vocabulary = sorted(self._postings)
+            
+            start = bisect_left(self._vocabulary, word)
+            for candidate in self._vocabulary[start:start + MAX_PREFIX_EXPANSIONS + 1]:
+                if not candidate.startswith(word):
+                    break
+                if candidate != word:
+                    matches.append((candidate, PREFIX_WEIGHT))
+        
+        return matches
+    
+    def search(self, query, limit=20):
+        """Find the episodes matching every word of a query, best first, as (episode ID, score) pairs.
+        
+        The last word matches as a prefix while typing; other words do when they end with '*'.
+        """
+        words = []
+        raw_words = query.split()
+        for i, raw_word in enumerate(raw_words):
+            prefix = raw_word.endswith('*') or (i == len(raw_words) - 1 and not query[-1:].isspace())
+            tokens = tokenize(raw_word)
+            words.extend((token, prefix and j == len(tokens) - 1) for j, token in enumerate(tokens))
+        
+        if not words:
+            return []
+        
+        with self._lock:
+            count = len(self._docs)
+            if not count:
+                return []
+            _, _, norms = self._get_doc_arrays()
+            
+            totals = np.zeros(len(norms))
+            matched = np.zeros(len(norms), dtype=np.int32)
+            sources = []
+            
+            for word, prefix in words:
+                candidates = self._expand(word, prefix)
+                best = np.zeros(len(norms))
+                source = np.zeros(len(norms), dtype=np.int32)
+                
+                # A word scores the best of the indexed words it matches in each document
+                for i, (candidate, weight) in enumerate(candidates):
+                    docs, frequencies = self._get_frequencies(candidate)
+                    document_count = np.count_nonzero(np.isfinite(norms[docs]))
+                    idf = math.log(1 + (count - document_count + 0.5) / (document_count + 0.5))
+                    
+                    scores = weight * idf * (BM25_K1 + 1) * frequencies / (frequencies + norms[docs])
+                    better = scores > best[docs]
+                    best[docs[better]] = scores[better]
+                    source[docs[better]] = i
+                
+                totals += best
+                matched += best > 0
+                sources.append((candidates, source))
+            
+            # Every word has to match
+            hits = np.flatnonzero(matched == len(words))
+            if len(hits) > limit * 3:
+                hits = hits[np.argpartition(-totals[hits], limit * 3)[:limit * 3]]
+            
+            # Reward words that appear next to each other, on the candidates that can still make the cut
+            results = []
+            for doc in hits.tolist():
+                score = float(totals[doc])
+                positions = [self._positions(candidates[source[doc]][0], doc) for candidates, source in sources]
+                for first, second in zip(positions, positions[1:]):
+                    following = set(second)
+                    if any(position + 1 in following for position in first):
+                        score *= 1 + PROXIMITY_BONUS
+                results.append((score, doc))
+            
+            results.sort(reverse=True)
+            return [(self._docs[doc][0], round(score, 4)) for score, doc in results[:limit]]
@@ -1,65 +1,128 @@
+import atexit
 import os
 import requests
 import base64
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from urllib.parse import urlencode
 
-class SpotifyIntegration:
-    """Integration with Spotify API."""
+from models import metrics
+from models.cache import TTLCache
+
+# Responses worth retrying: rate limiting and transient server errors
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Most track IDs the several-tracks endpoint accepts per request
+TRACKS_BATCH_SIZE = 50
+
+# Search results made up in demo mode, or after a failed search, have IDs starting with this
+DEMO_TRACK_PREFIX = 'demo_track_'
+
+REQUEST_SECONDS = metrics.histogram(
+    'sublimemix_spotify_request_seconds',
+    'Spotify HTTP calls by endpoint and response status, each retry counted separately.',
+    ('endpoint', 'status')
+)
+
+class SpotifyClient:
+    """Request building, response parsing, caching and demo fallbacks shared by the sync and async integrations.
     
-    def __init__(self):
-        """Initialize Spotify integration."""
+    Subclasses only add the transport: _call, which returns (status, body) for a request,
+    and the methods that drive it.
+    """
+    
+    def __init__(self, max_retries, backoff, max_retry_after, cache, search_ttl, track_ttl):
+        """Initialize the credentials, endpoints, retry settings and cache."""
         self.client_id = os.environ.get('SPOTIFY_CLIENT_ID', '')
         self.client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET', '')
         self.token = None
         self.token_expiry = 0
+        
+        # Overridable so the integration can be pointed at a local stand-in server
+        self.accounts_url = os.environ.get('SPOTIFY_ACCOUNTS_URL', 'https://accounts.spotify.com/api/token')
+        self.api_url = os.environ.get('SPOTIFY_API_URL', 'https://api.spotify.com/v1')
+        
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_retry_after = max_retry_after
+        
+        # Search results and tracks
+        self.cache = cache
+        self.search_ttl = search_ttl
+        self.track_ttl = track_ttl
     
-    def get_token(self):
-        """Get a valid Spotify API token."""
-        # Check if we have a valid token
+    def _retry_delay(self, attempt, retry_after=None):
+        """Get the seconds to wait before retrying, honoring a Retry-After header."""
+        delay = self.backoff * 2 ** attempt
+        
+        # Spotify says how long to back off when it rate limits us
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                pass
+        
+        return min(delay, self.max_retry_after)
+    
+    def _endpoint(self, url):
+        """Name the endpoint of a request URL for metrics, leaving out IDs and parameters."""
+        if url.startswith(self.accounts_url):
+            return 'token'
+        
+        path = url[len(self.api_url):] if url.startswith(self.api_url) else url
+        parts = path.split('?', 1)[0].strip('/').split('/')
+        return f"{parts[0]}/:id" if len(parts) > 1 else parts[0]
+    
+    def _valid_token(self):
+        """Return the cached token data if the token is still valid."""
         if self.token and time.time() < self.token_expiry:
             return {
                 'access_token': self.token,
                 'expires_in': int(self.token_expiry - time.time())
             }
         
-        # Get new token
-        try:
-            # If client credentials are not set, use demo mode
-            if not self.client_id or not self.client_secret:
-                print("Spotify credentials not set, using demo mode")
-                return self._get_demo_token()
-            
-            # Prepare request
-            auth_header = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
-            headers = {
+        return None
+    
+    def _token_request(self):
+        """Get the keyword arguments of a token request, or None in demo mode."""
+        # If client credentials are not set, use demo mode
+        if not self.client_id or not self.client_secret:
+            print("Spotify credentials not set, using demo mode")
+            return None
+        
+        auth_header = base64.b64encode(f"{self.client_id}:{self.client_secret}".encode()).decode()
+        return {
+            'headers': {
                 'Authorization': f'Basic {auth_header}',
                 'Content-Type': 'application/x-www-form-urlencoded'
-            }
-            data = {'grant_type': 'client_credentials'}
-            
-            # Make request
-            response = requests.post('https://accounts.spotify.com/api/token', headers=headers, data=data)
-            
-            if response.status_code != 200:
-                raise Exception(f"Failed to get token: {response.text}")
-            
-            # Parse response
-            token_data = response.json()
-            
-            # Save token
-            self.token = token_data['access_token']
-            self.token_expiry = time.time() + token_data['expires_in']
-            
-            return {
-                'access_token': self.token,
-                'expires_in': token_data['expires_in']
-            }
+            },
+            'data': {'grant_type': 'client_credentials'}
+        }
+    
+    def _save_token(self, status, token_data):
+        """Keep the token from a token response."""
+        if status != 200:
+            raise Exception(f"Failed to get token: {token_data}")
         
-        except Exception as e:
-            print(f"Error getting Spotify token: {e}")
-            return self._get_demo_token()
+        self.token = token_data['access_token']
+        self.token_expiry = time.time() + token_data['expires_in']
+        
+        return {
+            'access_token': self.token,
+            'expires_in': token_data['expires_in']
+        }
+    
+    def _token_failed(self, error):
+        """Answer a failed token request in demo mode."""
+        print(f"Error getting Spotify token: {error}")
+        # The token isn't kept, so the next call tries the configured credentials again
+        return {
+            'access_token': 'demo_token',
+            'expires_in': 0
+        }
     
     def _get_demo_token(self):
         """Get a demo token for testing."""
@@ -72,98 +135,142 @@ class SpotifyIntegration:
             'expires_in': 3600
         }
     
-    def search(self, query, limit=5):
-        """Search for tracks on Spotify."""
-        try:
-            # Get token
-            token_data = self.get_token()
-            
-            # If in demo mode, return demo results
-            if token_data['access_token'] == 'demo_token':
-                return self._get_demo_search_results(query)
-            
-            # Prepare request
-            headers = {
-                'Authorization': f"Bearer {token_data['access_token']}"
-            }
-            params = {
-                'q': query,
-                'type': 'track',
-                'limit': limit
-            }
-            
-            # Make request
-            response = requests.get(f'https://api.spotify.com/v1/search?{urlencode(params)}', headers=headers)
-            
-            if response.status_code != 200:
-                raise Exception(f"Failed to search: {response.text}")
-            
-            # Parse response
-            search_data = response.json()
-            
-            # Extract tracks
-            tracks = []
-            
-            if 'tracks' in search_data and 'items' in search_data['tracks']:
-                for item in search_data['tracks']['items']:
-                    track = {
-                        'id': item['id'],
-                        'name': item['name'],
-                        'artists': [artist['name'] for artist in item['artists']],
-                        'album': item['album']['name'],
-                        'image': item['album']['images'][0]['url'] if item['album']['images'] else None,
-                        'preview_url': item['preview_url'],
-                        'external_url': item['external_urls']['spotify'] if 'external_urls' in item and 'spotify' in item['external_urls'] else None
-                    }
-                    
-                    tracks.append(track)
-            
-            return tracks
+    def _auth_headers(self, access_token):
+        """Get the headers of an API request."""
+        return {
+            'Authorization': f"Bearer {access_token}"
+        }
+    
+    def _search_url(self, query, limit):
+        """Get the URL of a track search."""
+        params = {
+            'q': query,
+            'type': 'track',
+            'limit': limit
+        }
+        return f'{self.api_url}/search?{urlencode(params)}'
+    
+    def _track_url(self, track_id):
+        """Get the URL of a single track."""
+        return f'{self.api_url}/tracks/{track_id}'
+    
+    def _tracks_url(self, track_ids):
+        """Get the URL of a batch of tracks."""
+        return f"{self.api_url}/tracks?{urlencode({'ids': ','.join(track_ids)})}"
+    
+    def _search_cache_key(self, query, limit):
+        """Cache key for a search, ignoring case and extra whitespace in the query."""
+        return f"search:{limit}:{' '.join(query.lower().split())}"
+    
+    def get_cache_stats(self):
+        """Get cache hit/miss counters and the hit rate."""
+        return self.cache.get_stats()
+    
+    def _cached_search(self, query, limit):
+        """Get cached search results, or None."""
+        cached = self.cache.get(self._search_cache_key(query, limit))
+        return list(cached) if cached is not None else None
+    
+    def _cached_track(self, track_id):
+        """Get a cached track, or None."""
+        cached = self.cache.get(f"track:{track_id}")
+        return dict(cached) if cached is not None else None
+    
+    def _parse_search(self, query, limit, status, search_data):
+        """Get the tracks from a search response and cache them."""
+        if status != 200:
+            raise Exception(f"Failed to search: {search_data}")
         
-        except Exception as e:
-            print(f"Error searching Spotify: {e}")
-            return self._get_demo_search_results(query)
+        tracks = []
+        
+        if 'tracks' in search_data and 'items' in search_data['tracks']:
+            for item in search_data['tracks']['items']:
+                track = self._format_track(item)
+                tracks.append(track)
+                
+                # Tracks found by search also answer later get_track calls
+                self.cache.set(f"track:{track['id']}", track, self.track_ttl)
+        
+        self.cache.set(self._search_cache_key(query, limit), tracks, self.search_ttl)
+        return list(tracks)
     
-    def get_track(self, track_id):
-        """Get a track from Spotify by ID."""
-        try:
-            # Get token
-            token_data = self.get_token()
-            
-            # If in demo mode, return demo track
-            if token_data['access_token'] == 'demo_token':
-                return self._get_demo_track(track_id)
-            
-            # Prepare request
-            headers = {
-                'Authorization': f"Bearer {token_data['access_token']}"
-            }
-            
-            # Make request
-            response = requests.get(f'https://api.spotify.com/v1/tracks/{track_id}', headers=headers)
-            
-            if response.status_code != 200:
-                raise Exception(f"Failed to get track: {response.text}")
-            
-            # Parse response
-            track_data = response.json()
-            
-            # Extract track
-            track = {
-                'id': track_data['id'],
-                'name': track_data['name'],
-                'artists': [artist['name'] for artist in track_data['artists']],
-                'album': track_data['album']['name'],
-                'image': track_data['album']['images'][0]['url'] if track_data['album']['images'] else None,
-                'preview_url': track_data['preview_url'],
-                'external_url': track_data['external_urls']['spotify'] if 'external_urls' in track_data and 'spotify' in track_data['external_urls'] else None
-            }
+    def _parse_track(self, track_id, status, track_data):
+        """Get the track from a track response and cache it."""
+        if status != 200:
+            raise Exception(f"Failed to get track: {track_data}")
+        
+        track = self._format_track(track_data)
+        self.cache.set(f"track:{track_id}", track, self.track_ttl)
+        return dict(track)
+    
+    def _parse_tracks(self, track_ids, status, data):
+        """Get the tracks of a batch response and cache them, returning found tracks and errors by ID."""
+        if status != 200:
+            raise Exception(f"Failed to get tracks: {data}")
+        
+        tracks = {}
+        errors = {}
+        
+        # Results come back in request order, with null for unknown IDs
+        for track_id, track_data in zip(track_ids, data.get('tracks', [])):
+            if not track_data:
+                errors[track_id] = "Track not found"
+                continue
             
-            return track
+            track = self._format_track(track_data)
+            self.cache.set(f"track:{track_id}", track, self.track_ttl)
+            tracks[track_id] = dict(track)
         
-        except Exception as e:
-            print(f"Error getting Spotify track: {e}")
-            return self._get_demo_track(track_id)
+        for track_id in track_ids:
+            if track_id not in tracks and track_id not in errors:
+                errors[track_id] = "Track missing from response"
+        
+        return tracks, errors
+    
+    def _tracks_failed(self, track_ids, error):
+        """Report a failed batch as an error for each of its IDs."""
+        print(f"Error getting Spotify tracks: {error}")
+        return {}, {track_id: str(error) for track_id in track_ids}
+    
+    def _split_cached_tracks(self, track_ids):
+        """Get the cached tracks by ID and the IDs still to fetch, each ID once."""
+        tracks = {}
+        missing = []
+        for track_id in dict.fromkeys(track_ids):
+            cached = self._cached_track(track_id)
+            if cached is not None:
+                tracks[track_id] = cached
+            else:
+                missing.append(track_id)
+        
+        return tracks, missing
+    
+    def _tracks_without_api(self, token_data, track_ids):
+        """Answer a batch without the API when there is no real token: (tracks, errors), or None."""
+        if token_data['access_token'] != 'demo_token':
+            return None
+        
+        if self.client_id and self.client_secret:
+            # The token request failed; demo tracks would pass for real ones here
+            return {}, {track_id: "Failed to get Spotify token" for track_id in track_ids}
+        
+        return {track_id: self._get_demo_track(track_id) for track_id in track_ids}, {}
+    
+    def _batches(self, track_ids):
+        """Split track IDs into batches the several-tracks endpoint accepts."""
+        return [track_ids[i:i + TRACKS_BATCH_SIZE] for i in range(0, len(track_ids), TRACKS_BATCH_SIZE)]
+    
+    def _format_track(self, item):
+        """Convert a Spotify track object into our track format."""
+        return {
+            'id': item['id'],
+            'name': item['name'],
+            'artists': [artist['name'] for artist in item['artists']],
+            'album': item['album']['name'],
+            'image': item['album']['images'][0]['url'] if item['album']['images'] else None,
+            'preview_url': item['preview_url'],
+            'external_url': item['external_urls']['spotify'] if 'external_urls' in item and 'spotify' in item['external_urls'] else None
+        }
     
     def _get_demo_search_results(self, query):
         """Get demo search results for testing."""
@@ -191,13 +298,13 @@ class SpotifyIntegration:
             title = potential_title or f"Demo Track {i+1}"
             
             track = {
-                'id': f"demo_track_{i+1}",
+                'id': f"{DEMO_TRACK_PREFIX}{i+1}",
                 'name': title,
                 'artists': [artist],
                 'album': f"Demo Album {i+1}",
                 'image': f"https://via.placeholder.com/300?text={title.replace(' ', '+')}",
                 'preview_url': None,
-                'external_url': f"https://open.spotify.com/track/demo_track_{i+1}"
+                'external_url': f"https://open.spotify.com/track/{DEMO_TRACK_PREFIX}{i+1}"
             }
             
             tracks.append(track)
@@ -215,3 +322,161 @@ class SpotifyIntegration:
             'preview_url': None,
             'external_url': f"https://open.spotify.com/track/{track_id}"
         }
+
+class SpotifyIntegration(SpotifyClient):
+    """Integration with Spotify API."""
+    
+    def __init__(self, timeout=(3.05, 10), max_retries=3, backoff=0.5, max_retry_after=30, pool_size=10,
+                 cache_size=2000, search_ttl=6 * 3600, track_ttl=7 * 24 * 3600, cache_path=None):
+        """Initialize Spotify integration."""
+        # Optionally persisted so the cache survives restarts
+        cache = TTLCache(max_size=cache_size, ttl=track_ttl,
+                         path=cache_path or os.environ.get('SPOTIFY_CACHE_PATH') or None)
+        super().__init__(max_retries, backoff, max_retry_after, cache, search_ttl, track_ttl)
+        self._token_lock = threading.Lock()
+        
+        # (connect, read) timeout in seconds, so a hung call can't block a worker forever
+        self.timeout = timeout
+        
+        # One keep-alive connection pool shared by all requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        if self.cache.path:
+            atexit.register(self.cache.save)
+    
+    def _request(self, method, url, **kwargs):
+        """Make an HTTP request, retrying rate limits and transient failures with backoff."""
+        kwargs.setdefault('timeout', self.timeout)
+        
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            
+            try:
+                with REQUEST_SECONDS.time(endpoint=self._endpoint(url), status='error') as timer:
+                    response = self.session.request(method, url, **kwargs)
+                    timer.set(status=response.status_code)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                continue
+            
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            
+            response.close()
+            time.sleep(self._retry_delay(attempt, response.headers.get('Retry-After')))
+        
+        return response
+    
+    def _call(self, method, url, **kwargs):
+        """Make an HTTP request and return (status, json), or the body text for an error."""
+        response = self._request(method, url, **kwargs)
+        if response.status_code == 200:
+            return response.status_code, response.json()
+        return response.status_code, response.text
+    
+    def get_token(self):
+        """Get a valid Spotify API token."""
+        # Check if we have a valid token
+        token_data = self._valid_token()
+        if token_data:
+            return token_data
+        
+        # Only one thread fetches a new token; the others wait and reuse it
+        with self._token_lock:
+            token_data = self._valid_token()
+            if token_data:
+                return token_data
+            
+            return self._fetch_token()
+    
+    def _fetch_token(self):
+        """Get a new token from the Spotify accounts service."""
+        try:
+            request = self._token_request()
+            if request is None:
+                return self._get_demo_token()
+            
+            return self._save_token(*self._call('POST', self.accounts_url, **request))
+        except Exception as e:
+            return self._token_failed(e)
+    
+    def search(self, query, limit=5):
+        """Search for tracks on Spotify."""
+        cached = self._cached_search(query, limit)
+        if cached is not None:
+            return cached
+        
+        try:
+            token_data = self.get_token()
+            
+            # If in demo mode, return demo results
+            if token_data['access_token'] == 'demo_token':
+                return self._get_demo_search_results(query)
+            
+            status, data = self._call('GET', self._search_url(query, limit), headers=self._auth_headers(token_data['access_token']))
+            return self._parse_search(query, limit, status, data)
+        
+        except Exception as e:
+            print(f"Error searching Spotify: {e}")
+            return self._get_demo_search_results(query)
+    
+    def get_track(self, track_id):
+        """Get a track from Spotify by ID."""
+        cached = self._cached_track(track_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            token_data = self.get_token()
+            
+            # If in demo mode, return demo track
+            if token_data['access_token'] == 'demo_token':
+                return self._get_demo_track(track_id)
+            
+            status, data = self._call('GET', self._track_url(track_id), headers=self._auth_headers(token_data['access_token']))
+            return self._parse_track(track_id, status, data)
+        
+        except Exception as e:
+            print(f"Error getting Spotify track: {e}")
+            return self._get_demo_track(track_id)
+    
+    def get_tracks(self, track_ids, max_workers=4):
+        """Get several tracks, 50 per request, returned in input order with per-ID errors."""
+        track_ids = list(track_ids)
+        errors = {}
+        
+        # Serve what we can from the cache and only fetch the rest
+        tracks, missing = self._split_cached_tracks(track_ids)
+        
+        if missing:
+            token_data = self.get_token()
+            answered = self._tracks_without_api(token_data, missing)
+            
+            if answered is not None:
+                results = [answered]
+            else:
+                chunks = self._batches(missing)
+                with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+                    results = list(executor.map(lambda chunk: self._fetch_tracks(chunk, token_data['access_token']), chunks))
+            
+            for chunk_tracks, chunk_errors in results:
+                tracks.update(chunk_tracks)
+                errors.update(chunk_errors)
+        
+        return {
+            'tracks': [tracks.get(track_id) for track_id in track_ids],
+            'errors': errors
+        }
+    
+    def _fetch_tracks(self, track_ids, access_token):
+        """Fetch one batch of tracks, returning found tracks and errors by ID."""
+        try:
+            status, data = self._call('GET', self._tracks_url(track_ids), headers=self._auth_headers(access_token))
+            return self._parse_tracks(track_ids, status, data)
+        except Exception as e:
+            return self._tracks_failed(track_ids, e)
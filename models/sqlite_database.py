@@ -0,0 +1,603 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from models.database import DEFAULT_DATA_DIR, EPISODE_SUMMARY_FIELDS, FILE_IO_SECONDS, Database, marker_time, nearest_marker
+from models.search_index import SearchIndex
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    position INTEGER PRIMARY KEY,
+    id TEXT UNIQUE,
+    date TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS episodes_date ON episodes (date);
+CREATE TABLE IF NOT EXISTS favorites (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    episode_id TEXT UNIQUE NOT NULL
+);
+CREATE TABLE IF NOT EXISTS favorite_songs (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT UNIQUE NOT NULL,
+    episode_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS favorite_songs_episode ON favorite_songs (episode_id);
+CREATE TABLE IF NOT EXISTS downloads (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_id TEXT UNIQUE NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS feeds (
+    url TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tracklists (
+    episode_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ad_segments (
+    episode_id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+class SQLiteDatabase:
+    """SQLite storage with the same interface as the JSON Database."""
+    
+    def __init__(self, db_path=None, data_dir=None):
+        """Initialize the database.
+        
+        data_dir holds the JSON files to import and other data such as waveform peaks;
+        it defaults to the directory of db_path.
+        """
+        self.data_dir = data_dir or (os.path.dirname(os.path.abspath(db_path)) if db_path else DEFAULT_DATA_DIR)
+        os.makedirs(self.data_dir, exist_ok=True)
+        
+        self.db_path = db_path or os.path.join(self.data_dir, "sublimemix.db")
+        
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        self._local = threading.local()
+        
+        # Full-text search index, loaded on first use, with the content version it was last
+        # brought up to date with. Every write to episodes or favorite songs bumps the version
+        # in the meta table, so changes made by other processes are noticed too
+        self.search_index_path = f"{os.path.splitext(self.db_path)[0]}.search.json"
+        self._search_index = None
+        self._search_version = None
+        self._search_lock = threading.RLock()
+        
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        
+        # Import the existing JSON files the first time the database is opened
+        self.import_json()
+    
+    def _connect(self):
+        """Get the connection for the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        
+        if conn is None:
+            # Autocommit mode; transactions are started explicitly in _transaction
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        
+        return conn
+    
+    @contextmanager
+    def _transaction(self):
+        """Run a read-modify-write cycle under SQLite's write lock."""
+        conn = self._connect()
+        with FILE_IO_SECONDS.time(operation='transaction', file=os.path.basename(self.db_path)):
+            # IMMEDIATE takes the write lock up front, so concurrent workers queue
+            # instead of both reading the old value and one update getting lost
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    
+    def import_json(self, database=None, force=False):
+        """Import episodes, favorites, favorite songs and downloads from the JSON files in data_dir."""
+        # Opening a Database would create empty JSON files where there are none to import
+        if database is None and not os.path.exists(os.path.join(self.data_dir, "episodes.json")):
+            return False
+        
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+                if row and not force:
+                    return False
+                
+                source = database or Database(data_dir=self.data_dir)
+                
+                conn.execute("DELETE FROM episodes")
+                self._insert_episodes(conn, source.get_episodes())
+                
+                for episode_id in source.get_favorites():
+                    conn.execute("INSERT OR IGNORE INTO favorites (episode_id) VALUES (?)", (episode_id,))
+                
+                for song in source.get_favorite_songs():
+                    if not song.get('id'):
+                        song = {**song, 'id': str(uuid.uuid4())}
+                    conn.execute(
+                        "INSERT OR REPLACE INTO favorite_songs (id, episode_id, data) VALUES (?, ?, ?)",
+                        (song['id'], song.get('episodeId'), json.dumps(song))
+                    )
+                
+                for feed_url, state in source._read_json(source.feeds_file).items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO feeds (url, data) VALUES (?, ?)",
+                        (feed_url, json.dumps(state))
+                    )
+                
+                for episode_id, tracklist in source._read_json(source.tracklists_file).items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO tracklists (episode_id, data) VALUES (?, ?)",
+                        (episode_id, json.dumps(tracklist))
+                    )
+                
+                for episode_id, segments in source._read_json(source.ad_segments_file).items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO ad_segments (episode_id, data) VALUES (?, ?)",
+                        (episode_id, json.dumps(segments))
+                    )
+                
+                for task_id, download in source.get_downloads().items():
+                    conn.execute(
+                        "INSERT OR REPLACE INTO downloads (task_id, data) VALUES (?, ?)",
+                        (task_id, json.dumps(download))
+                    )
+                
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)",
+                    (datetime.now().isoformat(),)
+                )
+                self._bump_content_version(conn)
+            return True
+        except Exception as e:
+            print(f"Error importing JSON data: {e}")
+            return False
+    
+    def _insert_episodes(self, conn, episodes):
+        """Insert episodes keeping their order."""
+        conn.executemany(
+            "INSERT OR REPLACE INTO episodes (position, id, date, data) VALUES (?, ?, ?, ?)",
+            (
+                (i, episode.get('id'), episode.get('date'), json.dumps(episode))
+                for i, episode in enumerate(episodes)
+            )
+        )
+    
+    def _bump_content_version(self, conn):
+        """Mark the searchable content as changed and get the previous version."""
+        row = conn.execute("SELECT value FROM meta WHERE key = 'content_version'").fetchone()
+        version = int(row[0]) if row else 0
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('content_version', ?)", (str(version + 1),))
+        return version
+    
+    def get_episodes(self):
+        """Get all episodes."""
+        try:
+            rows = self._connect().execute("SELECT data FROM episodes ORDER BY position")
+            return [json.loads(data) for data, in rows]
+        except Exception as e:
+            print(f"Error loading episodes: {e}")
+            return []
+    
+    def save_episodes(self, episodes):
+        """Save episodes to the database."""
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM episodes")
+                self._insert_episodes(conn, episodes)
+                self._bump_content_version(conn)
+        except Exception as e:
+            print(f"Error saving episodes: {e}")
+            return False
+        
+        # Index new and changed episodes right away, so searching after a feed refresh stays fast.
+        # The saved index is only a cache that the next sync repairs, so it is written now and then
+        try:
+            self._get_search_index().save_if_due()
+        except Exception as e:
+            print(f"Error updating search index: {e}")
+        return True
+    
+    def get_episode(self, episode_id):
+        """Get a specific episode by ID."""
+        try:
+            row = self._connect().execute("SELECT data FROM episodes WHERE id = ?", (episode_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error loading episodes: {e}")
+            return None
+    
+    def query_episodes(self, offset=0, limit=None, date_from=None, date_to=None,
+                       favorites_only=False, sort='date', fields=None):
+        """Get a page of episodes with optional filtering and field projection."""
+        where = []
+        params = []
+        
+        if favorites_only:
+            where.append("id IN (SELECT episode_id FROM favorites)")
+        
+        # Same prefix semantics as Database.query_episodes
+        if date_from:
+            where.append("COALESCE(date, '') >= ?")
+            params.append(date_from)
+        
+        if date_to:
+            where.append("substr(COALESCE(date, ''), 1, ?) <= ?")
+            params.extend([len(date_to), date_to])
+        
+        where_sql = f" WHERE {' AND '.join(where)}" if where else ""
+        
+        if sort == 'date':
+            order_sql = " ORDER BY COALESCE(date, '') DESC, position"
+        elif sort == 'date_asc':
+            order_sql = " ORDER BY COALESCE(date, '') ASC, position DESC"
+        else:
+            order_sql = " ORDER BY position"
+        
+        offset = max(int(offset or 0), 0)
+        
+        try:
+            conn = self._connect()
+            total = conn.execute(f"SELECT COUNT(*) FROM episodes{where_sql}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT data FROM episodes{where_sql}{order_sql} LIMIT ? OFFSET ?",
+                params + [int(limit) if limit is not None else -1, offset]
+            )
+            page = [json.loads(data) for data, in rows]
+        except Exception as e:
+            print(f"Error loading episodes: {e}")
+            total = 0
+            page = []
+        
+        if fields:
+            page = [{field: episode.get(field) for field in fields} for episode in page]
+        
+        return {
+            'episodes': page,
+            'total': total,
+            'offset': offset,
+            'limit': limit
+        }
+    
+    def _get_search_index(self):
+        """Get the search index, bringing it up to date with the episodes and favorite songs."""
+        with self._search_lock:
+            if self._search_index is None:
+                self._search_index = SearchIndex(self.search_index_path)
+                atexit.register(self._search_index.save)
+            
+            row = self._connect().execute("SELECT value FROM meta WHERE key = 'content_version'").fetchone()
+            version = int(row[0]) if row else 0
+            if version != self._search_version:
+                self._search_index.sync(self.get_episodes(), self.get_favorite_songs())
+                self._search_version = version
+            
+            return self._search_index
+    
+    def _reindex_favorite_songs(self, episode_id, previous_version):
+        """Update the search index after the favorite songs of one episode changed."""
+        try:
+            with self._search_lock:
+                # Only when nothing else changed in between; otherwise the next search syncs everything
+                if self._search_index is None or self._search_version != previous_version:
+                    return
+                
+                episode = self.get_episode(episode_id)
+                if episode:
+                    rows = self._connect().execute(
+                        "SELECT data FROM favorite_songs WHERE episode_id = ? ORDER BY position", (episode_id,)
+                    )
+                    self._search_index.index_episode(episode, [json.loads(data) for data, in rows])
+                
+                self._search_version = previous_version + 1
+                self._search_index.save_if_due()
+        except Exception as e:
+            print(f"Error updating search index: {e}")
+    
+    def search(self, query, limit=20, fields=EPISODE_SUMMARY_FIELDS):
+        """Search episode titles, descriptions and favorite songs, best matches first."""
+        try:
+            results = self._get_search_index().search(query, limit)
+        except Exception as e:
+            print(f"Error searching episodes: {e}")
+            results = []
+        
+        episodes = []
+        for episode_id, score in results:
+            episode = self.get_episode(episode_id)
+            if episode is None:
+                continue
+            
+            episode = {field: episode.get(field) for field in fields} if fields else episode
+            episode['score'] = score
+            episodes.append(episode)
+        
+        return {
+            'episodes': episodes,
+            'query': query
+        }
+    
+    def get_favorites(self):
+        """Get all favorite episodes."""
+        try:
+            rows = self._connect().execute("SELECT episode_id FROM favorites ORDER BY position")
+            return [episode_id for episode_id, in rows]
+        except Exception as e:
+            print(f"Error loading favorites: {e}")
+            return []
+    
+    def add_favorite(self, episode_id):
+        """Add an episode to favorites."""
+        try:
+            with self._transaction() as conn:
+                conn.execute("INSERT OR IGNORE INTO favorites (episode_id) VALUES (?)", (episode_id,))
+        except Exception as e:
+            print(f"Error saving favorites: {e}")
+        
+        return self.get_favorites()
+    
+    def remove_favorite(self, episode_id):
+        """Remove an episode from favorites."""
+        try:
+            with self._transaction() as conn:
+                conn.execute("DELETE FROM favorites WHERE episode_id = ?", (episode_id,))
+        except Exception as e:
+            print(f"Error saving favorites: {e}")
+        
+        return self.get_favorites()
+    
+    def get_favorite_songs(self):
+        """Get all favorite songs."""
+        try:
+            rows = self._connect().execute("SELECT data FROM favorite_songs ORDER BY position")
+            return [json.loads(data) for data, in rows]
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return []
+    
+    def add_favorite_song(self, song):
+        """Add a song to favorite songs."""
+        # Generate ID if not provided
+        if not song.get('id'):
+            song['id'] = str(uuid.uuid4())
+        
+        # Add timestamp if not provided
+        if not song.get('createdAt'):
+            song['createdAt'] = datetime.now().isoformat()
+        
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT INTO favorite_songs (id, episode_id, data) VALUES (?, ?, ?)",
+                    (song['id'], song.get('episodeId'), json.dumps(song))
+                )
+                previous_version = self._bump_content_version(conn)
+            
+            self._reindex_favorite_songs(song.get('episodeId'), previous_version)
+            return song['id']
+        except Exception as e:
+            print(f"Error saving favorite songs: {e}")
+            return None
+    
+    def get_favorite_song(self, song_id):
+        """Get a specific favorite song by ID."""
+        try:
+            row = self._connect().execute("SELECT data FROM favorite_songs WHERE id = ?", (song_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return None
+    
+    def get_episode_markers(self, episode_id):
+        """Get the favorite songs of an episode sorted by timestamp."""
+        try:
+            rows = self._connect().execute(
+                "SELECT data FROM favorite_songs WHERE episode_id = ? ORDER BY position", (episode_id,)
+            )
+            return sorted((json.loads(data) for data, in rows), key=marker_time)
+        except Exception as e:
+            print(f"Error loading favorite songs: {e}")
+            return []
+    
+    def get_marker_at(self, episode_id, position, max_distance=None):
+        """Get the favorite song of an episode at or nearest to a playback position in seconds."""
+        markers = self.get_episode_markers(episode_id)
+        return nearest_marker(markers, [marker_time(marker) for marker in markers], position, max_distance)
+    
+    def remove_favorite_song(self, song_id):
+        """Remove a song from favorite songs."""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT episode_id FROM favorite_songs WHERE id = ?", (song_id,)).fetchone()
+                if not row:
+                    return False
+                
+                conn.execute("DELETE FROM favorite_songs WHERE id = ?", (song_id,))
+                previous_version = self._bump_content_version(conn)
+            
+            self._reindex_favorite_songs(row[0], previous_version)
+            return True
+        except Exception as e:
+            print(f"Error saving favorite songs: {e}")
+            return False
+    
+    def get_downloads(self):
+        """Get all downloads."""
+        try:
+            rows = self._connect().execute("SELECT task_id, data FROM downloads ORDER BY position")
+            return {task_id: json.loads(data) for task_id, data in rows}
+        except Exception as e:
+            print(f"Error loading downloads: {e}")
+            return {}
+    
+    def add_download(self, task_id, episode_id):
+        """Add a download task."""
+        download = {
+            'episodeId': episode_id,
+            'status': 'pending',
+            'progress': 0,
+            'createdAt': datetime.now().isoformat()
+        }
+        
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO downloads (task_id, data) VALUES (?, ?)",
+                    (task_id, json.dumps(download))
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def get_download(self, task_id):
+        """Get a specific download by task ID."""
+        try:
+            row = self._connect().execute("SELECT data FROM downloads WHERE task_id = ?", (task_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error loading downloads: {e}")
+            return None
+    
+    def update_download_status(self, task_id, status, progress=None, error=None, local_path=None):
+        """Update the status of a download task."""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT data FROM downloads WHERE task_id = ?", (task_id,)).fetchone()
+                
+                if not row:
+                    return False
+                
+                download = json.loads(row[0])
+                download['status'] = status
+                
+                if progress is not None:
+                    download['progress'] = progress
+                
+                if error is not None:
+                    download['error'] = error
+                
+                if local_path is not None:
+                    download['local_path'] = local_path
+                
+                conn.execute("UPDATE downloads SET data = ? WHERE task_id = ?", (json.dumps(download), task_id))
+            return True
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def update_download(self, task_id, **fields):
+        """Set extra fields on a download task, such as its size on disk or when it was last played."""
+        try:
+            with self._transaction() as conn:
+                row = conn.execute("SELECT data FROM downloads WHERE task_id = ?", (task_id,)).fetchone()
+                
+                if not row:
+                    return False
+                
+                download = {**json.loads(row[0]), **fields}
+                conn.execute("UPDATE downloads SET data = ? WHERE task_id = ?", (json.dumps(download), task_id))
+            return True
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def flush_download_progress(self):
+        """Write buffered download progress; each update is already a single-row write here."""
+        return True
+    
+    def remove_download(self, task_id):
+        """Remove a download task."""
+        try:
+            with self._transaction() as conn:
+                cursor = conn.execute("DELETE FROM downloads WHERE task_id = ?", (task_id,))
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Error saving downloads: {e}")
+            return False
+    
+    def get_feed_state(self, feed_url):
+        """Get the stored HTTP validators (etag, modified) for a feed."""
+        try:
+            row = self._connect().execute("SELECT data FROM feeds WHERE url = ?", (feed_url,)).fetchone()
+            return json.loads(row[0]) if row else {}
+        except Exception as e:
+            print(f"Error loading feed state: {e}")
+            return {}
+    
+    def save_feed_state(self, feed_url, state):
+        """Save the HTTP validators (etag, modified) for a feed."""
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO feeds (url, data) VALUES (?, ?)",
+                    (feed_url, json.dumps(state))
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving feed state: {e}")
+            return False
+    
+    def get_tracklist(self, episode_id):
+        """Get the matched tracklist for an episode."""
+        try:
+            row = self._connect().execute("SELECT data FROM tracklists WHERE episode_id = ?", (episode_id,)).fetchone()
+            return json.loads(row[0]) if row else None
+        except Exception as e:
+            print(f"Error loading tracklists: {e}")
+            return None
+    
+    def save_tracklist(self, episode_id, tracklist):
+        """Save the matched tracklist for an episode."""
+        try:
+            with self._transaction() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO tracklists (episode_id, data) VALUES (?, ?)",
+                    (episode_id, json.dumps(tracklist))
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving tracklists: {e}")
+            return False
+    
+    def get_ad_segments(self, episode_id):
+        """Get the detected ad skip ranges for an episode."""
+        try:
+            row = self._connect().execute("SELECT data FROM ad_segments WHERE episode_id = ?", (episode_id,)).fetchone()
+            return json.loads(row[0]) if row else []
+        except Exception as e:
+            print(f"Error loading ad segments: {e}")
+            return []
+    
+    def save_ad_segments(self, segments_by_episode):
+        """Save detected ad skip ranges, given as a dict of episode ID to ranges."""
+        try:
+            with self._transaction() as conn:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO ad_segments (episode_id, data) VALUES (?, ?)",
+                    [(episode_id, json.dumps(segments)) for episode_id, segments in segments_by_episode.items()]
+                )
+            return True
+        except Exception as e:
+            print(f"Error saving ad segments: {e}")
+            return False
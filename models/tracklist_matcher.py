@@ -0,0 +1,173 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from models.podcast_parser import PodcastParser
+from models.spotify_integration import DEMO_TRACK_PREFIX
+
+# Matches scoring below this are kept but not treated as linked
+MIN_CONFIDENCE = 0.6
+
+TIMESTAMP_RE = re.compile(r'^[\[(]?(\d{1,2}:\d{2}(?::\d{2})?)[\])]?\s*')
+POSITION_RE = re.compile(r'^(\d{1,3})\s*[.):]\s*')
+SEPARATOR_RE = re.compile(r'\s+[-–—]\s+')
+BRACKETS_RE = re.compile(r'\s*[\[(][^\])]*[\])]')
+NON_WORD_RE = re.compile(r'[^\w\s]')
+
+def parse_timestamp(value):
+    """Convert H:MM:SS or MM:SS into seconds."""
+    seconds = 0
+    for part in value.split(':'):
+        seconds = seconds * 60 + int(part)
+    return seconds
+
+def parse_tracklist(description):
+    """Parse "Artist - Title" lines, with optional position and timestamp, out of a description."""
+    if not description:
+        return []
+    
+    # Descriptions stored before plain-text extraction may still be HTML
+    if '<' in description:
+        description = PodcastParser()._html_to_text(description)
+    
+    tracks = []
+    
+    for line in description.split('\n'):
+        line = line.strip()
+        if not line or len(line) > 200:
+            continue
+        
+        position = None
+        timestamp = None
+        
+        # Position and timestamp can come in either order, e.g. "01. [00:03:12]" or "[03:12] 1."
+        for _ in range(2):
+            match = TIMESTAMP_RE.match(line)
+            if match and timestamp is None:
+                timestamp = parse_timestamp(match.group(1))
+                line = line[match.end():]
+            
+            match = POSITION_RE.match(line)
+            if match and position is None:
+                position = int(match.group(1))
+                line = line[match.end():]
+        
+        parts = SEPARATOR_RE.split(line, maxsplit=1)
+        if len(parts) != 2 or not parts[0].strip() or not parts[1].strip():
+            continue
+        
+        tracks.append({
+            'position': position if position is not None else len(tracks) + 1,
+            'artist': parts[0].strip(),
+            'title': parts[1].strip(),
+            'timestamp': timestamp
+        })
+    
+    return tracks
+
+def normalize(text):
+    """Lowercase text and drop punctuation for comparison."""
+    return ' '.join(NON_WORD_RE.sub(' ', text.lower()).split())
+
+def similarity(a, b):
+    """Similarity of two names, also trying them without bracketed parts like "(Extended Mix)"."""
+    scores = [SequenceMatcher(None, normalize(a), normalize(b)).ratio()]
+    
+    stripped_a = BRACKETS_RE.sub('', a)
+    stripped_b = BRACKETS_RE.sub('', b)
+    if stripped_a != a or stripped_b != b:
+        scores.append(SequenceMatcher(None, normalize(stripped_a), normalize(stripped_b)).ratio())
+    
+    return max(scores)
+
+class TracklistMatcher:
+    """Links the tracklists in episode descriptions to Spotify tracks."""
+    
+    def __init__(self, spotify, database, max_workers=4):
+        """Initialize the tracklist matcher."""
+        self.spotify = spotify
+        self.database = database
+        self.max_workers = max_workers
+    
+    def match_episode(self, episode_id, force=False):
+        """Match an episode's tracklist and store the result."""
+        if not force:
+            stored = self.database.get_tracklist(episode_id)
+            if stored is not None:
+                return stored
+        
+        episode = self.database.get_episode(episode_id)
+        if episode is None:
+            return None
+        
+        tracks = parse_tracklist(episode.get('description'))
+        
+        # Searches are network bound; SpotifyIntegration caches repeated queries
+        if tracks:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                tracks = list(executor.map(self._match_track, tracks))
+        
+        tracklist = {
+            'episodeId': episode_id,
+            'matchedAt': datetime.now().isoformat(),
+            'tracks': tracks,
+            'matched': sum(1 for track in tracks if track['matched'])
+        }
+        
+        # Tracks Spotify couldn't be searched for are matched again on the next call
+        if not any(track.get('unavailable') for track in tracks):
+            self.database.save_tracklist(episode_id, tracklist)
+        return tracklist
+    
+    def match_episodes(self, episode_ids=None, force=False):
+        """Match the tracklists of several episodes, all episodes by default."""
+        if episode_ids is None:
+            episode_ids = [episode.get('id') for episode in self.database.get_episodes()]
+        
+        results = {}
+        for episode_id in episode_ids:
+            results[episode_id] = self.match_episode(episode_id, force=force)
+        
+        return results
+    
+    def _match_track(self, track):
+        """Search Spotify for a parsed track and keep the best scoring candidate."""
+        best = None
+        best_score = 0.0
+        
+        candidates = self.spotify.search(f"{track['artist']} {track['title']}", limit=5)
+        
+        # Demo results stand in for a search that failed or had no credentials; they match nothing
+        if candidates and all(str(candidate.get('id')).startswith(DEMO_TRACK_PREFIX) for candidate in candidates):
+            return {
+                **track,
+                'spotify': None,
+                'confidence': 0.0,
+                'matched': False,
+                'unavailable': True
+            }
+        
+        for candidate in candidates:
+            score = self._score(track, candidate)
+            if score > best_score:
+                best = candidate
+                best_score = score
+        
+        return {
+            **track,
+            'spotify': best,
+            'confidence': round(best_score, 3),
+            'matched': best is not None and best_score >= MIN_CONFIDENCE
+        }
+    
+    def _score(self, track, candidate):
+        """Score how well a Spotify track matches a parsed track, from 0 to 1."""
+        title_score = similarity(track['title'], candidate.get('name') or '')
+        artist_score = max(
+            (similarity(track['artist'], artist) for artist in candidate.get('artists') or []),
+            default=0.0
+        )
+        
+        # Tracklists often credit several artists where Spotify lists one, so the title counts more
+        return 0.6 * title_score + 0.4 * artist_score
@@ -0,0 +1,181 @@
+import os
+import struct
+import subprocess
+import tempfile
+
+import numpy as np
+
+# Audio is decoded to mono 16-bit PCM at this rate; plenty for drawing a waveform
+DECODE_SAMPLE_RATE = 8000
+
+# Peaks are first taken over blocks this size while streaming, then merged down
+FINE_SAMPLES_PER_PEAK = 256
+
+# Header of the audiowaveform .dat format (version 1): version, flags, sample rate,
+# samples per pixel, length; followed by interleaved int16 min/max pairs
+DAT_HEADER = struct.Struct('<iIiiI')
+DAT_VERSION = 1
+
+class WaveformGenerator:
+    """Precomputes waveform peaks for downloaded episodes so the browser doesn't decode whole mixes."""
+    
+    def __init__(self, database, peaks_dir=None, peak_count=4000, ffmpeg='ffmpeg'):
+        """Initialize the waveform generator."""
+        self.database = database
+        self.peaks_dir = peaks_dir or os.path.join(database.data_dir, "peaks")
+        self.peak_count = peak_count
+        self.ffmpeg = ffmpeg
+        os.makedirs(self.peaks_dir, exist_ok=True)
+    
+    def peaks_path(self, episode_id):
+        """Path of the peaks file for an episode."""
+        return os.path.join(self.peaks_dir, f"{episode_id}.dat")
+    
+    def needs_update(self, episode_id, audio_path):
+        """Check whether an episode's peaks are missing or older than its audio file."""
+        try:
+            return os.path.getmtime(self.peaks_path(episode_id)) < os.path.getmtime(audio_path)
+        except OSError:
+            return True
+    
+    def process_downloads(self, force=False):
+        """Generate peaks for every downloaded episode that doesn't have up-to-date peaks yet."""
+        result = {'generated': [], 'skipped': 0, 'errors': {}}
+        
+        for download in self.database.get_downloads().values():
+            episode_id = download.get('episodeId')
+            audio_path = download.get('local_path')
+            
+            if download.get('status') != 'completed' or not audio_path or not os.path.exists(audio_path):
+                continue
+            
+            if not force and not self.needs_update(episode_id, audio_path):
+                result['skipped'] += 1
+                continue
+            
+            try:
+                self.generate(episode_id, audio_path)
+                result['generated'].append(episode_id)
+            except Exception as e:
+                print(f"Error generating waveform for {episode_id}: {e}")
+                result['errors'][episode_id] = str(e)
+        
+        return result
+    
+    def generate(self, episode_id, audio_path):
+        """Decode an audio file once and store its downsampled min/max peaks."""
+        mins, maxs = compute_peaks(decode_audio(audio_path, ffmpeg=self.ffmpeg), FINE_SAMPLES_PER_PEAK)
+        mins, maxs, samples_per_peak = downsample_peaks(mins, maxs, FINE_SAMPLES_PER_PEAK, self.peak_count)
+        
+        path = self.peaks_path(episode_id)
+        write_dat(path, mins, maxs, DECODE_SAMPLE_RATE, samples_per_peak)
+        return path
+    
+    def read_peaks(self, episode_id):
+        """Get the raw .dat bytes for an episode, or None if they haven't been generated."""
+        try:
+            with open(self.peaks_path(episode_id), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+def decode_audio(audio_path, sample_rate=DECODE_SAMPLE_RATE, chunk_samples=FINE_SAMPLES_PER_PEAK * 4096,
+                 ffmpeg='ffmpeg'):
+    """Stream an audio file as chunks of mono int16 samples without holding it all in memory."""
+    process = subprocess.Popen(
+        [ffmpeg, '-v', 'error', '-i', audio_path, '-ac', '1', '-ar', str(sample_rate), '-f', 's16le', '-'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    
+    finished = False
+    try:
+        while True:
+            data = process.stdout.read(chunk_samples * 2)
+            if not data:
+                break
+            # A read can end halfway through a sample; keep whole samples only
+            if len(data) % 2:
+                data += process.stdout.read(1)
+            yield np.frombuffer(data, dtype='<i2')
+        finished = True
+    finally:
+        if not finished:
+            # The caller stopped early or failed; don't leave ffmpeg running
+            process.kill()
+        process.stdout.close()
+        stderr = process.stderr.read()
+        process.stderr.close()
+        if process.wait() != 0 and finished:
+            raise RuntimeError(f"ffmpeg failed: {stderr.decode(errors='replace').strip()}")
+
+def compute_peaks(chunks, samples_per_peak):
+    """Compute min/max peaks per block of samples over a stream of sample chunks."""
+    mins = []
+    maxs = []
+    remainder = np.empty(0, dtype=np.int16)
+    
+    for chunk in chunks:
+        if remainder.size:
+            chunk = np.concatenate((remainder, chunk))
+        
+        # Whole blocks are reduced in one vectorized call; the tail waits for the next chunk
+        whole = chunk.size - chunk.size % samples_per_peak
+        if whole:
+            blocks = chunk[:whole].reshape(-1, samples_per_peak)
+            mins.append(blocks.min(axis=1))
+            maxs.append(blocks.max(axis=1))
+        remainder = chunk[whole:]
+    
+    if remainder.size:
+        mins.append(remainder.min(keepdims=True))
+        maxs.append(remainder.max(keepdims=True))
+    
+    if not mins:
+        return np.empty(0, dtype=np.int16), np.empty(0, dtype=np.int16)
+    
+    return np.concatenate(mins).astype(np.int16), np.concatenate(maxs).astype(np.int16)
+
+def downsample_peaks(mins, maxs, samples_per_peak, peak_count):
+    """Merge neighbouring peaks so there are at most peak_count of them."""
+    if mins.size <= peak_count:
+        return mins, maxs, samples_per_peak
+    
+    factor = -(-mins.size // peak_count)
+    padding = -mins.size % factor
+    
+    # Pad with the last values so the padding never changes a min or max
+    if padding:
+        mins = np.concatenate((mins, np.repeat(mins[-1:], padding)))
+        maxs = np.concatenate((maxs, np.repeat(maxs[-1:], padding)))
+    
+    return (mins.reshape(-1, factor).min(axis=1), maxs.reshape(-1, factor).max(axis=1),
+            samples_per_peak * factor)
+
+def write_dat(path, mins, maxs, sample_rate, samples_per_peak):
+    """Atomically write peaks in the audiowaveform .dat format."""
+    pairs = np.empty(mins.size * 2, dtype='<i2')
+    pairs[0::2] = mins
+    pairs[1::2] = maxs
+    
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            # Flags 0 means 16-bit values
+            f.write(DAT_HEADER.pack(DAT_VERSION, 0, sample_rate, samples_per_peak, mins.size))
+            f.write(pairs.tobytes())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_dat(data):
+    """Parse .dat bytes into (sample_rate, samples_per_peak, mins, maxs)."""
+    version, flags, sample_rate, samples_per_peak, length = DAT_HEADER.unpack_from(data)
+    
+    if version != DAT_VERSION or flags & 1:
+        raise ValueError("Unsupported waveform data format")
+    
+    pairs = np.frombuffer(data, dtype='<i2', offset=DAT_HEADER.size, count=length * 2)
+    return sample_rate, samples_per_peak, pairs[0::2], pairs[1::2]
@@ -9,5 +9,8 @@ mkdir -p downloads
 export SPOTIFY_CLIENT_ID=""
 export SPOTIFY_CLIENT_SECRET=""
 
+# Storage backend: "json" (default) or "sqlite" for running multiple workers
+export DATABASE_BACKEND="json"
+
 # Start the Flask application
 python3 app.py
@@ -9,6 +9,7 @@ document.addEventListener('DOMContentLoaded', function() {
     window.isShuffleEnabled = false;
     window.isContinuousEnabled = true;
     window.playbackHistory = [];
+    window.playedEpisodes = {};
     
     // Initialize application
     initApp();
@@ -198,6 +199,9 @@ function initModals() {
     });
 }
 
+// Number of episodes fetched per page
+const EPISODES_PAGE_SIZE = 50;
+
 // Load episodes
 function loadEpisodes(forceRefresh = false) {
     console.log('Loading episodes');
@@ -205,13 +209,23 @@ function loadEpisodes(forceRefresh = false) {
     // Show loading
     document.querySelector('.episodes-container').innerHTML = '<div class="loading">Afleveringen laden...</div>';
     
-    // Fetch episodes from API
-    fetch('/api/episodes')
+    // Start again from the first page
+    window.episodes = [];
+    window.episodesTotal = 0;
+    
+    loadEpisodesPage(0);
+}
+
+// Load a page of episodes
+function loadEpisodesPage(offset) {
+    // Fetch a page of episodes from API, without descriptions
+    fetch(`/api/episodes?offset=${offset}&limit=${EPISODES_PAGE_SIZE}&fields=summary`)
         .then(response => response.json())
         .then(data => {
             if (data.episodes && Array.isArray(data.episodes)) {
-                window.episodes = data.episodes;
-                console.log(`Loaded ${window.episodes.length} episodes`);
+                window.episodes = window.episodes.concat(data.episodes);
+                window.episodesTotal = data.total || window.episodes.length;
+                console.log(`Loaded ${window.episodes.length} of ${window.episodesTotal} episodes`);
                 
                 // Update UI
                 updateEpisodesUI();
@@ -299,6 +313,19 @@ function updateEpisodesUI() {
             downloadEpisode(episodeId);
         });
     });
+    
+    // Add load more button if not all episodes are loaded yet
+    if (window.episodesTotal > window.episodes.length) {
+        const loadMoreButton = document.createElement('button');
+        loadMoreButton.className = 'load-more';
+        loadMoreButton.textContent = 'Meer afleveringen laden';
+        loadMoreButton.addEventListener('click', function() {
+            this.disabled = true;
+            loadEpisodesPage(window.episodes.length);
+        });
+        
+        episodesContainer.appendChild(loadMoreButton);
+    }
 }
 
 // Load favorites
@@ -376,12 +403,7 @@ function updateFavoritesUI() {
         
         // Add event listeners
         episodeElement.querySelector('.play-episode').addEventListener('click', function() {
-            const episodeId = this.dataset.id;
-            const episode = window.episodes.find(ep => ep.id === episodeId);
-            
-            if (episode) {
-                loadEpisode(episode);
-            }
+            loadEpisode(favorite);
         });
         
         episodeElement.querySelector('.favorite-episode').addEventListener('click', function() {
@@ -464,11 +486,11 @@ function updateFavoriteSongsUI() {
             const episodeId = this.dataset.episodeId;
             const timestamp = parseFloat(this.dataset.timestamp);
             
-            const episode = window.episodes.find(ep => ep.id === episodeId);
-            
-            if (episode) {
-                loadEpisode(episode, timestamp);
-            }
+            findEpisode(episodeId).then(episode => {
+                if (episode) {
+                    loadEpisode(episode, timestamp);
+                }
+            });
         });
         
         songElement.querySelector('.remove-song').addEventListener('click', function() {
@@ -552,11 +574,12 @@ function updateDownloadsUI() {
         // Add event listeners
         downloadElement.querySelector('.play-episode').addEventListener('click', function() {
             const episodeId = this.dataset.id;
-            const episode = window.episodes.find(ep => ep.id === episodeId);
             
-            if (episode) {
-                loadEpisode(episode);
-            }
+            findEpisode(episodeId).then(episode => {
+                if (episode) {
+                    loadEpisode(episode);
+                }
+            });
         });
         
         downloadElement.querySelector('.favorite-episode').addEventListener('click', function() {
@@ -587,7 +610,7 @@ function updateHomeSection() {
         
         for (const episodeId of window.playbackHistory) {
             if (!uniqueEpisodeIds.has(episodeId)) {
-                const episode = window.episodes.find(ep => ep.id === episodeId);
+                const episode = findLoadedEpisode(episodeId);
                 
                 if (episode) {
                     uniqueEpisodes.push(episode);
@@ -620,12 +643,7 @@ function updateHomeSection() {
             
             // Add click event
             episodeElement.addEventListener('click', function() {
-                const episodeId = this.dataset.id;
-                const episode = window.episodes.find(ep => ep.id === episodeId);
-                
-                if (episode) {
-                    loadEpisode(episode);
-                }
+                loadEpisode(episode);
             });
         });
     }
@@ -661,23 +679,59 @@ function updateHomeSection() {
             
             // Add click event
             episodeElement.addEventListener('click', function() {
-                const episodeId = this.dataset.id;
-                const episode = window.episodes.find(ep => ep.id === episodeId);
-                
-                if (episode) {
-                    loadEpisode(episode);
-                }
+                loadEpisode(episode);
             });
         });
     }
 }
 
+// Find an episode among the ones already in the page
+function findLoadedEpisode(episodeId) {
+    return window.episodes.find(ep => ep.id === episodeId) ||
+        window.favorites.find(fav => fav.id === episodeId) ||
+        window.downloads.find(dl => dl.id === episodeId) ||
+        window.playedEpisodes[episodeId];
+}
+
+// Find an episode, fetching it from the API when it is not on a loaded page
+function findEpisode(episodeId) {
+    const episode = findLoadedEpisode(episodeId);
+    
+    if (episode) {
+        return Promise.resolve(episode);
+    }
+    
+    return fetch(`/api/episodes/${episodeId}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(data => data && (data.episode || data))
+        .catch(error => {
+            console.error('Error loading episode:', error);
+            return null;
+        });
+}
+
+// Fetch the episode at a position in the full list
+function fetchEpisodeAt(offset) {
+    if (offset < window.episodes.length) {
+        return Promise.resolve(window.episodes[offset]);
+    }
+    
+    return fetch(`/api/episodes?offset=${offset}&limit=1&fields=summary`)
+        .then(response => response.json())
+        .then(data => (data.episodes && data.episodes[0]) || null)
+        .catch(error => {
+            console.error('Error loading episode:', error);
+            return null;
+        });
+}
+
 // Load episode
 function loadEpisode(episode, startTime = 0) {
     console.log(`Loading episode: ${episode.title}`);
     
     // Update current episode
     window.currentEpisode = episode;
+    window.playedEpisodes[episode.id] = episode;
     
     // Add to playback history
     window.playbackHistory.unshift(episode.id);
@@ -687,7 +741,7 @@ function loadEpisode(episode, startTime = 0) {
     
     // Load audio in wavesurfer
     if (window.wavesurfer) {
-        window.wavesurfer.load(episode.audioUrl);
+        loadAudio(episode);
         
         // Set start time and play when ready
         window.wavesurfer.once('ready', function() {
@@ -742,31 +796,39 @@ function playNextEpisode() {
         return;
     }
     
-    let nextEpisode;
+    // Pages that are not loaded yet are fetched one episode at a time
+    const total = Math.max(window.episodesTotal, window.episodes.length);
+    const currentIndex = window.episodes.findIndex(ep => ep.id === window.currentEpisode.id);
+    let nextOffset = -1;
     
     if (window.isShuffleEnabled) {
-        // Get random episode
-        const availableEpisodes = window.episodes.filter(ep => ep.id !== window.currentEpisode.id);
-        
-        if (availableEpisodes.length > 0) {
-            const randomIndex = Math.floor(Math.random() * availableEpisodes.length);
-            nextEpisode = availableEpisodes[randomIndex];
+        // Get random episode from the full list, other than the current one
+        if (total > 1) {
+            nextOffset = Math.floor(Math.random() * (currentIndex === -1 ? total : total - 1));
+            
+            if (currentIndex !== -1 && nextOffset >= currentIndex) {
+                nextOffset++;
+            }
         }
     } else {
         // Get next episode in list
-        const currentIndex = window.episodes.findIndex(ep => ep.id === window.currentEpisode.id);
-        
-        if (currentIndex !== -1 && currentIndex < window.episodes.length - 1) {
-            nextEpisode = window.episodes[currentIndex + 1];
+        if (currentIndex !== -1 && currentIndex < total - 1) {
+            nextOffset = currentIndex + 1;
         } else if (window.isContinuousEnabled) {
             // Loop back to first episode
-            nextEpisode = window.episodes[0];
+            nextOffset = 0;
         }
     }
     
-    if (nextEpisode) {
-        loadEpisode(nextEpisode);
+    if (nextOffset === -1) {
+        return;
     }
+    
+    fetchEpisodeAt(nextOffset).then(nextEpisode => {
+        if (nextEpisode && nextEpisode.id !== window.currentEpisode.id) {
+            loadEpisode(nextEpisode);
+        }
+    });
 }
 
 // Play previous episode
@@ -786,7 +848,7 @@ function playPreviousEpisode() {
     if (window.playbackHistory.length > 1) {
         // Get previous episode from history
         const previousEpisodeId = window.playbackHistory[1];
-        previousEpisode = window.episodes.find(ep => ep.id === previousEpisodeId);
+        previousEpisode = findLoadedEpisode(previousEpisodeId);
     } else {
         // Get previous episode in list
         const currentIndex = window.episodes.findIndex(ep => ep.id === window.currentEpisode.id);
@@ -843,7 +905,7 @@ function toggleFavorite() {
 
 // Toggle favorite episode
 function toggleFavoriteEpisode(episodeId) {
-    const episode = window.episodes.find(ep => ep.id === episodeId);
+    const episode = findLoadedEpisode(episodeId);
     
     if (!episode) {
         return;
@@ -976,6 +1038,7 @@ function saveSongMarker() {
     
     // Add to favorite songs
     window.favoriteSongs.push(marker);
+    addEpisodeMarker(marker);
     
     // Update API
     fetch('/api/favorite-songs', {
@@ -1012,6 +1075,7 @@ function saveSongMarker() {
 function removeFavoriteSong(songId) {
     // Remove from favorite songs
     window.favoriteSongs = window.favoriteSongs.filter(song => song.id !== songId);
+    window.episodeMarkers = (window.episodeMarkers || []).filter(song => song.id !== songId);
     
     // Update API
     fetch(`/api/favorite-songs/${songId}`, {
@@ -1032,7 +1096,7 @@ function removeFavoriteSong(songId) {
 
 // Download episode
 function downloadEpisode(episodeId) {
-    const episode = window.episodes.find(ep => ep.id === episodeId);
+    const episode = findLoadedEpisode(episodeId);
     
     if (!episode) {
         return;
@@ -19,6 +19,8 @@ function initWaveSurfer() {
         height: 60,
         responsive: true,
         normalize: true,
+        // Stream audio through a media element; the waveform comes from precomputed peaks
+        backend: 'MediaElement',
         plugins: [
             WaveSurfer.timeline.create({
                 container: '#waveform-timeline',
@@ -61,6 +63,9 @@ function initWaveSurfer() {
     wavesurfer.on('audioprocess', function() {
         // Update current time
         document.getElementById('current-time').textContent = formatTime(wavesurfer.getCurrentTime());
+        
+        // Jump past detected ads
+        skipAdSegment(wavesurfer.getCurrentTime());
     });
     
     wavesurfer.on('finish', function() {
@@ -75,6 +80,15 @@ function initWaveSurfer() {
     wavesurfer.on('error', function(error) {
         console.error('WaveSurfer error:', error);
         
+        // Retry once from the episode's original URL
+        const fallback = window.audioFallback;
+        if (fallback) {
+            window.audioFallback = null;
+            console.log('Playing from original URL:', fallback.url);
+            loadAudioUrl(fallback.url, fallback.waveform);
+            return;
+        }
+        
         // Show error message
         alert('Er is een fout opgetreden bij het afspelen van deze aflevering. Probeer het later opnieuw.');
         
@@ -87,10 +101,7 @@ function initWaveSurfer() {
         console.log('Marker clicked:', marker);
         
         // Find corresponding song
-        const song = window.favoriteSongs.find(song => 
-            song.episodeId === window.currentEpisode.id && 
-            Math.abs(song.timestamp - marker.time) < 1
-        );
+        const song = findMarker(marker.time, 1);
         
         if (song) {
             // Show song info
@@ -99,31 +110,176 @@ function initWaveSurfer() {
     });
 }
 
+// Load audio with precomputed peaks, falling back to decoding in the browser
+function loadAudio(episode) {
+    loadAdSegments(episode);
+    
+    // Served from the downloaded file when there is one, so seeking doesn't go back to the origin
+    const audioUrl = `/api/episodes/${episode.id}/audio`;
+    
+    fetch(`/api/episodes/${episode.id}/peaks`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`No peaks for episode ${episode.id}`);
+            }
+            return response.arrayBuffer();
+        })
+        .then(buffer => parseWaveformData(buffer))
+        .catch(error => {
+            console.log('Decoding waveform in browser:', error.message);
+            return null;
+        })
+        .then(waveform => {
+            // Played from the original URL instead if the streaming route can't serve the episode
+            window.audioFallback = episode.audioUrl ? { url: episode.audioUrl, waveform: waveform } : null;
+            loadAudioUrl(audioUrl, waveform);
+        });
+}
+
+// Load an audio URL into wavesurfer, with precomputed peaks when there are any
+function loadAudioUrl(url, waveform) {
+    if (waveform) {
+        window.wavesurfer.load(url, waveform.peaks, 'metadata', waveform.duration);
+    } else {
+        window.wavesurfer.load(url);
+    }
+}
+
+// Parse audiowaveform .dat data into interleaved min/max peaks scaled to -1..1
+function parseWaveformData(buffer) {
+    const view = new DataView(buffer);
+    const sampleRate = view.getInt32(8, true);
+    const samplesPerPeak = view.getInt32(12, true);
+    const length = view.getUint32(16, true);
+    const values = new Int16Array(buffer, 20, length * 2);
+    
+    const peaks = new Float32Array(values.length);
+    for (let i = 0; i < values.length; i++) {
+        peaks[i] = values[i] / 32768;
+    }
+    
+    return {
+        peaks: peaks,
+        duration: length * samplesPerPeak / sampleRate
+    };
+}
+
+// Load detected ad skip ranges for an episode
+function loadAdSegments(episode) {
+    window.adSegments = [];
+    
+    fetch(`/api/episodes/${episode.id}/ad-segments`)
+        .then(response => response.ok ? response.json() : [])
+        .then(segments => {
+            // Ignore the response if another episode was loaded in the meantime
+            if (window.currentEpisode && window.currentEpisode.id === episode.id) {
+                window.adSegments = segments;
+            }
+        })
+        .catch(error => {
+            console.error('Error loading ad segments:', error);
+        });
+}
+
+// Skip to the end of the ad segment containing the given time
+function skipAdSegment(time) {
+    const segment = (window.adSegments || []).find(segment => time >= segment.start && time < segment.end - 0.5);
+    
+    if (segment) {
+        console.log(`Skipping ad: ${formatTime(segment.start)} - ${formatTime(segment.end)}`);
+        window.wavesurfer.setCurrentTime(segment.end);
+    }
+}
+
 // Load markers for current episode
 function loadMarkers() {
-    if (!window.wavesurfer || !window.currentEpisode || !window.favoriteSongs) {
+    if (!window.wavesurfer || !window.currentEpisode) {
         return;
     }
     
+    const episode = window.currentEpisode;
+    
     // Clear existing markers
     window.wavesurfer.markers.clear();
+    window.episodeMarkers = [];
     
-    // Get markers for current episode
-    const episodeMarkers = window.favoriteSongs.filter(song => song.episodeId === window.currentEpisode.id);
+    // Only this episode's favorite songs, sorted by timestamp
+    fetch(`/api/episodes/${episode.id}/markers`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Markers request failed with status ${response.status}`);
+            }
+            return response.json();
+        })
+        .catch(error => {
+            // Filter the favorite songs already loaded instead
+            console.error('Error loading markers:', error);
+            return (window.favoriteSongs || [])
+                .filter(song => song.episodeId === episode.id)
+                .sort((a, b) => a.timestamp - b.timestamp);
+        })
+        .then(markers => {
+            // Ignore the response if another episode was loaded in the meantime
+            if (!window.currentEpisode || window.currentEpisode.id !== episode.id) {
+                return;
+            }
+            
+            window.episodeMarkers = markers;
+            
+            // Add markers
+            markers.forEach(song => {
+                window.wavesurfer.markers.add([{
+                    time: song.timestamp,
+                    label: `${song.title} - ${song.artist}`,
+                    color: '#ff5500',
+                    position: 'top'
+                }]);
+            });
+        });
+}
+
+// Insert a favorite song into the current episode's markers, keeping them sorted
+function addEpisodeMarker(song) {
+    const markers = window.episodeMarkers || [];
+    markers.splice(bisectMarkers(song.timestamp), 0, song);
+    window.episodeMarkers = markers;
+}
+
+// Index of the first marker after the given time
+function bisectMarkers(time) {
+    const markers = window.episodeMarkers || [];
+    let low = 0;
+    let high = markers.length;
     
-    if (episodeMarkers.length === 0) {
-        return;
+    while (low < high) {
+        const middle = (low + high) >> 1;
+        if (markers[middle].timestamp <= time) {
+            low = middle + 1;
+        } else {
+            high = middle;
+        }
     }
     
-    // Add markers
-    episodeMarkers.forEach(song => {
-        window.wavesurfer.markers.add([{
-            time: song.timestamp,
-            label: `${song.title} - ${song.artist}`,
-            color: '#ff5500',
-            position: 'top'
-        }]);
+    return low;
+}
+
+// Find the marker nearest to the given time, within maxDistance seconds if given
+function findMarker(time, maxDistance) {
+    const markers = window.episodeMarkers || [];
+    const i = bisectMarkers(time);
+    let nearest = null;
+    
+    [i - 1, i].forEach(j => {
+        if (j >= 0 && j < markers.length &&
+            (nearest === null || Math.abs(markers[j].timestamp - time) < Math.abs(nearest.timestamp - time))) {
+            nearest = markers[j];
+        }
     });
+    
+    if (nearest === null || (maxDistance !== undefined && Math.abs(nearest.timestamp - time) > maxDistance)) {
+        return null;
+    }
+    return nearest;
 }
 
 // Format time (seconds to MM:SS)
@@ -0,0 +1,67 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from models.database import Database
+
+FEED = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:itunes="http://www.itunes.com/dtds/podcast-1.0.dtd">
+<channel>
+<title>Sublime Weekendmix</title>
+{items}
+</channel>
+</rss>"""
+
+ITEM = """<item>
+<title>Weekendmix {i}</title>
+<guid>https://example.com/episodes/{i}</guid>
+<pubDate>Fri, {i:02d} Feb 2024 20:00:00 +0000</pubDate>
+<enclosure url="https://example.com/audio/{i}.mp3" type="audio/mpeg"/>
+<description><![CDATA[<p>Caf&eacute; del Mar</p><p>1. Artist - Title</p>]]></description>
+</item>"""
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Serves the feeds in server.feeds by path, with an ETag, answering 304 when the client sends it back."""
+    
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get('If-None-Match'))
+        
+        numbers = server.feeds.get(self.path)
+        if numbers is None:
+            self.send_error(404)
+            return
+        
+        if self.headers.get('If-None-Match') == server.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        
+        body = FEED.format(items=''.join(ITEM.format(i=i) for i in numbers)).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/rss+xml')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', server.etag)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def db(tmp_path):
+    return Database(data_dir=str(tmp_path))
+
+@pytest.fixture
+def feed_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+    server.etag = '"v1"'
+    # Episode numbers served by path
+    server.feeds = {'/feed.xml': [1, 2]}
+    server.requests = []
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
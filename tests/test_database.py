@@ -0,0 +1,97 @@
+import json
+import os
+import stat
+import threading
+import time
+
+from models.database import UMASK, Database
+
+# Atomic writes, snapshots and locking
+
+def test_write_leaves_no_temporary_files(db):
+    db.add_favorite('episode-1')
+    db.add_favorite('episode-2')
+    
+    leftovers = [name for name in os.listdir(db.data_dir) if name.startswith('.')]
+    assert leftovers == []
+    assert db.get_favorites() == ['episode-1', 'episode-2']
+
+def test_write_keeps_file_permissions(db):
+    # New files get the default permissions rather than mkstemp's owner-only ones
+    assert stat.S_IMODE(os.stat(db.favorites_file).st_mode) == 0o666 & ~UMASK
+    
+    os.chmod(db.favorites_file, 0o640)
+    db.add_favorite('episode-1')
+    assert stat.S_IMODE(os.stat(db.favorites_file).st_mode) == 0o640
+
+def test_corrupt_file_is_restored_from_snapshot(db):
+    db.add_favorite('episode-1')
+    db.add_favorite('episode-2')
+    
+    # A torn write of the current version; the snapshot holds the one before it
+    with open(db.favorites_file, 'w') as f:
+        f.write('["episode-1", "epis')
+    
+    assert db.get_favorites() == ['episode-1']
+    assert db.get_cache_stats()['recoveries'] == 1
+    with open(db.favorites_file) as f:
+        assert json.load(f) == ['episode-1']
+
+def test_corrupt_episodes_file_is_restored(db):
+    episodes = [{'id': f"episode-{i}", 'title': f"Weekendmix {i}", 'description': f"Tracklist {i}"} for i in range(3)]
+    assert db.save_episodes(episodes)
+    assert db.save_episodes(episodes[:2])
+    
+    with open(db.episodes_file, 'w') as f:
+        f.write('[{"id": ')
+    
+    assert [episode['id'] for episode in db.get_episodes()] == ['episode-0', 'episode-1', 'episode-2']
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    # Separate instances share no thread locks, like separate worker processes
+    databases = [Database(data_dir=str(tmp_path)) for _ in range(4)]
+    
+    def add(db, worker):
+        for i in range(10):
+            db.add_favorite(f"episode-{worker}-{i}")
+    
+    threads = [threading.Thread(target=add, args=(db, worker)) for worker, db in enumerate(databases)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(Database(data_dir=str(tmp_path)).get_favorites()) == 40
+
+def test_returned_records_are_copies(db):
+    db.add_download('task-1', 'episode-1')
+    db.add_favorite_song({'id': 'song-1', 'episodeId': 'episode-1', 'timestamp': 60})
+    db.save_feed_state('https://example.com/feed.xml', {'etag': '"v1"'})
+    db.save_tracklist('episode-1', [{'title': 'Saman'}])
+    
+    db.get_download('task-1')['status'] = 'hacked'
+    db.get_downloads()['task-1']['status'] = 'hacked'
+    db.get_favorite_song('song-1')['title'] = 'hacked'
+    db.get_favorite_songs()[0]['title'] = 'hacked'
+    db.get_episode_markers('episode-1')[0]['title'] = 'hacked'
+    db.get_feed_state('https://example.com/feed.xml')['etag'] = 'hacked'
+    db.get_tracklist('episode-1')[0]['title'] = 'hacked'
+    
+    assert db.get_download('task-1')['status'] == 'pending'
+    assert 'title' not in db.get_favorite_song('song-1')
+    assert db.get_feed_state('https://example.com/feed.xml') == {'etag': '"v1"'}
+    assert db.get_tracklist('episode-1') == [{'title': 'Saman'}]
+
+# Buffered download progress
+
+def test_buffered_progress_is_written_without_further_updates(tmp_path):
+    db = Database(data_dir=str(tmp_path), progress_flush_interval=0.1)
+    db.add_download('task-1', 'episode-1')
+    db.update_download_status('task-1', 'downloading')
+    db.update_download_status('task-1', 'downloading', 50)
+    
+    # Another process only sees what is on disk
+    assert Database(data_dir=str(tmp_path)).get_download('task-1')['progress'] == 0
+    
+    time.sleep(0.3)
+    assert Database(data_dir=str(tmp_path)).get_download('task-1')['progress'] == 50
@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from benchmarks.fake_audio_server import FakeAudioServer, fake_audio
+from models.download_manager import DownloadManager
+
+SIZE = 1024 * 1024
+
+@pytest.fixture
+def manager(db, tmp_path):
+    manager = DownloadManager(db, download_dir=str(tmp_path / 'downloads'), chunk_size=256 * 1024,
+                              max_retries=0, backoff=0, progress_interval=0.05)
+    yield manager
+    manager.shutdown()
+
+def download(manager, server, task_id='task-1'):
+    episode = {'id': 'episode-1', 'audioUrl': server.audio_url('episode_1')}
+    return manager.start(task_id, episode).result(), manager.episode_path(episode)
+
+def test_download_in_parallel_ranges(db, manager):
+    with FakeAudioServer(size=SIZE) as server:
+        ok, path = download(manager, server)
+    
+    assert ok
+    with open(path, 'rb') as f:
+        assert f.read() == fake_audio('episode_1.mp3', SIZE)
+    
+    # The probe plus one request per chunk
+    assert server.range_requests == 5
+    assert db.get_download('task-1')['status'] == 'completed'
+    assert db.get_download('task-1')['local_path'] == path
+    assert not os.path.exists(path + '.part')
+
+def test_download_without_range_support(db, manager):
+    with FakeAudioServer(size=SIZE, ranges=False) as server:
+        ok, path = download(manager, server)
+    
+    assert ok
+    with open(path, 'rb') as f:
+        assert f.read() == fake_audio('episode_1.mp3', SIZE)
+    
+    assert server.range_requests == 0
+    assert server.requests == 2
+    assert db.get_download('task-1')['status'] == 'completed'
+
+def test_interrupted_download_resumes(db, manager):
+    with FakeAudioServer(size=SIZE, block_size=16 * 1024) as server:
+        server.cut_after(300 * 1024)
+        ok, path = download(manager, server)
+        
+        assert not ok
+        assert db.get_download('task-1')['status'] == 'failed'
+        assert os.path.exists(path + '.part.json')
+        
+        server.cut_after(None)
+        sent = server.sent
+        ok, path = download(manager, server)
+    
+    assert ok
+    with open(path, 'rb') as f:
+        assert f.read() == fake_audio('episode_1.mp3', SIZE)
+    
+    # Only what was missing is fetched again
+    assert server.sent - sent < SIZE
+    assert not os.path.exists(path + '.part.json')
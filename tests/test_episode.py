@@ -0,0 +1,81 @@
+import json
+
+from models.database import EPISODE_SUMMARY_FIELDS, Database
+from models.episode import Episode, split_episodes
+
+def make_episode(i, description=None):
+    return {
+        'id': f"episode-{i}",
+        'title': f"Sublime Weekendmix {i} – Café del Mar ♫",
+        'date': f"2024-01-{i + 1:02d}T20:00:00",
+        'audioUrl': f"https://example.com/audio/{i}.mp3",
+        'image': None,
+        'duration': '1:58:00',
+        'description': description if description is not None else f"Tracklist {i}:\n1. Ólafur Arnalds – Saman\n2. 坂本龍一 - Merry Christmas"
+    }
+
+def test_record_keeps_unknown_keys_and_leaves_out_the_description():
+    data = {**make_episode(1), 'adDuration': 30}
+    records, descriptions = split_episodes([data])
+    
+    episode = records[0]
+    assert isinstance(episode, Episode)
+    assert episode.get('adDuration') == 30
+    assert episode.get('description') is None
+    assert 'description' not in episode.stored()
+    assert descriptions == {'episode-1': data['description']}
+    assert episode.to_dict(descriptions['episode-1']) == data
+
+def test_episodes_round_trip_with_non_ascii_text(db):
+    episodes = [make_episode(i) for i in range(5)]
+    assert db.save_episodes(episodes)
+    
+    db.clear_cache()
+    assert db.get_episodes() == episodes
+    assert db.get_episode('episode-3') == episodes[3]
+
+def test_public_methods_return_plain_dicts(db):
+    assert db.save_episodes([make_episode(i) for i in range(3)])
+    
+    episode = db.get_episode('episode-1')
+    assert type(episode) is dict
+    assert all(type(episode) is dict for episode in db.get_episodes())
+    assert all(type(episode) is dict for episode in db.query_episodes()['episodes'])
+    
+    episode['title'] = 'Changed'
+    json.dumps(episode)
+    assert db.get_episode('episode-1')['title'] != 'Changed'
+
+def test_descriptions_are_stored_apart(db):
+    episodes = [make_episode(i) for i in range(3)]
+    assert db.save_episodes(episodes)
+    
+    with open(db.episodes_file, encoding='utf-8') as f:
+        assert all('description' not in episode for episode in json.load(f))
+    with open(db.descriptions_file, encoding='utf-8') as f:
+        assert json.load(f) == {episode['id']: episode['description'] for episode in episodes}
+    
+    # Summary reads leave the descriptions file alone
+    db.clear_cache()
+    db.query_episodes(fields=EPISODE_SUMMARY_FIELDS)
+    assert db.descriptions_file not in db._cache
+
+def test_descriptions_of_removed_episodes_are_dropped(db):
+    episodes = [make_episode(i) for i in range(3)]
+    assert db.save_episodes(episodes)
+    assert db.save_episodes(episodes[:2])
+    assert db.save_episodes(episodes[:2])
+    
+    with open(db.descriptions_file, encoding='utf-8') as f:
+        assert set(json.load(f)) == {'episode-0', 'episode-1'}
+
+def test_episodes_file_with_descriptions_is_split(tmp_path):
+    # The layout written before descriptions were stored apart
+    episodes = [make_episode(i) for i in range(3)]
+    with open(tmp_path / 'episodes.json', 'w', encoding='utf-8') as f:
+        json.dump(episodes, f, ensure_ascii=False)
+    
+    db = Database(data_dir=str(tmp_path))
+    assert db.get_episodes() == episodes
+    with open(db.episodes_file, encoding='utf-8') as f:
+        assert all('description' not in episode for episode in json.load(f))
@@ -0,0 +1,31 @@
+import pytest
+
+from models.podcast_parser import PodcastParser
+
+def test_unchanged_feed_is_answered_with_304(db, feed_server):
+    feed_url = f"{feed_server.url}/feed.xml"
+    parser = PodcastParser(db)
+    
+    episodes = parser.refresh_feed(feed_url, raise_errors=True)
+    assert [episode['id'] for episode in episodes] == ['1', '2']
+    assert db.get_feed_state(feed_url)['etag'] == '"v1"'
+    
+    assert parser.refresh_feed(feed_url, raise_errors=True) == db.get_episodes()
+    assert feed_server.requests == [None, '"v1"']
+    
+    # A changed feed is fetched in full and merged
+    feed_server.etag = '"v2"'
+    feed_server.feeds['/feed.xml'] = [1, 2, 3]
+    episodes = parser.refresh_feed(feed_url, raise_errors=True)
+    assert sorted(episode['id'] for episode in episodes) == ['1', '2', '3']
+    assert len(db.get_episodes()) == 3
+
+def test_validators_are_not_kept_when_saving_fails(db, feed_server, monkeypatch):
+    feed_url = f"{feed_server.url}/feed.xml"
+    monkeypatch.setattr(db, 'save_episodes', lambda episodes: False)
+    
+    with pytest.raises(Exception):
+        PodcastParser(db).refresh_feed(feed_url, raise_errors=True)
+    
+    # Otherwise the next poll would get a 304 and never store the episodes
+    assert db.get_feed_state(feed_url) == {}
@@ -0,0 +1,30 @@
+from models.podcast_parser import PodcastParser
+
+def test_feeds_are_merged_newest_first_without_duplicates(feed_server):
+    feed_server.feeds = {'/a.xml': [1, 2, 3], '/b.xml': [3, 4]}
+    feed_urls = [f"{feed_server.url}/a.xml", f"{feed_server.url}/b.xml", f"{feed_server.url}/a.xml"]
+    
+    result = PodcastParser().parse_feeds(feed_urls)
+    
+    assert [episode['id'] for episode in result['episodes']] == ['4', '3', '2', '1']
+    # Each feed is fetched once, however often it is listed
+    assert len(feed_server.requests) == 2
+    
+    feeds = result['feeds']
+    assert list(feeds) == feed_urls[:2]
+    assert (feeds[feed_urls[0]]['episodes'], feeds[feed_urls[0]]['duplicates']) == (3, 0)
+    assert (feeds[feed_urls[1]]['episodes'], feeds[feed_urls[1]]['duplicates']) == (2, 1)
+    assert all(feed['error'] is None for feed in feeds.values())
+
+def test_failing_feed_does_not_stop_the_others(feed_server):
+    feed_urls = [f"{feed_server.url}/missing.xml", f"{feed_server.url}/feed.xml"]
+    
+    result = PodcastParser().parse_feeds(feed_urls)
+    
+    assert [episode['id'] for episode in result['episodes']] == ['2', '1']
+    assert result['feeds'][feed_urls[0]]['episodes'] == 0
+    assert result['feeds'][feed_urls[0]]['error']
+    assert result['feeds'][feed_urls[1]]['error'] is None
+
+def test_no_feeds():
+    assert PodcastParser().parse_feeds([]) == {'episodes': [], 'feeds': {}}
@@ -0,0 +1,63 @@
+from models.search_index import SearchIndex
+
+def make_episode(episode_id, title, description=''):
+    return {'id': episode_id, 'title': title, 'description': description}
+
+def ids(results):
+    return [episode_id for episode_id, _ in results]
+
+def test_multi_term_and_prefix_queries():
+    index = SearchIndex()
+    index.sync([
+        make_episode('1', 'Weekendmix 1', 'Tiësto - Adagio for Strings'),
+        make_episode('2', 'Weekendmix 2', 'Armin van Buuren - Blah Blah Blah'),
+        make_episode('3', 'Adagio special', 'Strings only')
+    ], [{'episodeId': '2', 'artist': 'Ferry Corsten', 'title': 'Out of the Blue'}])
+    
+    assert ids(index.search('tiesto')) == ['1']
+    assert ids(index.search('adagio strings')) == ['3', '1']
+    assert ids(index.search('corst')) == ['2']
+    assert index.search('adagio blah') == []
+
+def test_reindexing_replaces_the_old_text():
+    index = SearchIndex()
+    index.index_episode(make_episode('1', 'Old title'))
+    index.index_episode(make_episode('1', 'New title'))
+    
+    assert index.search('old ') == []
+    assert ids(index.search('new ')) == ['1']
+
+def test_removed_document_numbers_are_not_reused_after_reload(tmp_path):
+    path = str(tmp_path / 'search_index.json')
+    index = SearchIndex(path)
+    for i in range(8):
+        index.index_episode(make_episode(str(i), f"Episode {i}"))
+    
+    # The highest numbered document is removed, but few enough that its postings are kept
+    index.index_episode(make_episode('gone', 'zebra', 'unicorn'))
+    index.remove_episode('gone')
+    index.save()
+    
+    index = SearchIndex(path)
+    index.index_episode(make_episode('new', 'apple', 'banana'))
+    
+    assert index.search('zebra ') == []
+    assert index.search('unicorn ') == []
+    assert ids(index.search('apple ')) == ['new']
+
+def test_saved_index_loads_the_same_results(tmp_path):
+    path = str(tmp_path / 'search_index.json')
+    index = SearchIndex(path)
+    index.sync([make_episode(str(i), f"Episode {i}", f"track{i} shared") for i in range(20)], [])
+    index.save()
+    
+    loaded = SearchIndex(path)
+    assert len(loaded) == 20
+    assert loaded.search('shared track1') == index.search('shared track1')
+
+def test_descriptions_are_indexed_as_plain_text():
+    index = SearchIndex()
+    # A literal '&lt;' in the stored text must not be unescaped a second time
+    index.index_episode(make_episode('1', 'Weekendmix', 'Write &lt;br&gt; for a line break'))
+    
+    assert ids(index.search('lt br gt ')) == ['1']
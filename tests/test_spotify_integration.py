@@ -0,0 +1,72 @@
+import time
+
+import pytest
+
+from benchmarks.fake_spotify import FakeSpotifyServer
+from models.spotify_integration import SpotifyIntegration
+
+@pytest.fixture
+def spotify_server(monkeypatch):
+    with FakeSpotifyServer(retry_after=0) as server:
+        for name, value in server.environ().items():
+            monkeypatch.setenv(name, value)
+        
+        # Count TCP connections, to see whether requests share them
+        server.connections = 0
+        get_request = server.get_request
+        
+        def counting_get_request():
+            server.connections += 1
+            return get_request()
+        
+        server.get_request = counting_get_request
+        yield server
+
+def test_requests_share_one_connection(spotify_server):
+    spotify = SpotifyIntegration()
+    
+    tracks = [spotify.get_track(f"track{i}") for i in range(5)]
+    
+    assert [track['name'] for track in tracks] == [f"Track track{i}" for i in range(5)]
+    assert spotify_server.requests == 6
+    assert spotify_server.connections == 1
+
+def test_rate_limited_request_is_retried(spotify_server):
+    spotify = SpotifyIntegration(backoff=0)
+    spotify.get_token()
+    
+    spotify_server.rate_limit(2)
+    assert spotify.get_track('abc')['name'] == "Track abc"
+    assert spotify_server.rejected == 2
+
+def test_retry_after_is_capped(spotify_server):
+    spotify = SpotifyIntegration(max_retry_after=0.1)
+    spotify.get_token()
+    spotify_server.retry_after = 60
+    
+    start = time.monotonic()
+    spotify_server.rate_limit(1)
+    assert spotify.get_track('abc')['name'] == "Track abc"
+    assert time.monotonic() - start < 5
+
+def test_gives_up_after_max_retries(spotify_server):
+    spotify = SpotifyIntegration(max_retries=2, backoff=0)
+    spotify.get_token()
+    
+    spotify_server.rate_limit(10)
+    result = spotify.get_tracks(['abc'])
+    
+    assert result['tracks'] == [None]
+    assert 'abc' in result['errors']
+    assert spotify_server.rejected == 3
+
+def test_hung_request_times_out(spotify_server):
+    spotify = SpotifyIntegration(timeout=(1, 0.1), max_retries=1, backoff=0)
+    spotify_server.latency = 1
+    
+    start = time.monotonic()
+    result = spotify.get_tracks(['abc'])
+    
+    # Without a token the tracks are reported as errors rather than made up
+    assert result['errors'] == {'abc': "Failed to get Spotify token"}
+    assert time.monotonic() - start < 1